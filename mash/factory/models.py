@@ -23,9 +23,12 @@
 ################################################################################
 
 
+from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_save, pre_delete
+from django.core.cache import cache
 from experiments.models import Experiment, Configuration
-from heuristics.models import HeuristicVersion
+from heuristics.models import HeuristicVersion, HeuristicTestStatus
 
 
 class FactoryTask(models.Model):
@@ -97,3 +100,63 @@ class DebuggingEntry(models.Model):
 
     class Meta:
         verbose_name_plural = "Debugging entries"
+
+
+
+# The status of the menu of the factory (see utilities.menu_status()) is cached
+# per user, and invalidated each time one of the objects it depends on is
+# modified (by the website or the scheduler). The cache is only used when its
+# backend is shared between the processes: with a backend local to a process,
+# the invalidations done by the scheduler would never reach the website.
+MENU_STATUS_CACHE_TIMEOUT = 60
+
+LOCAL_CACHE_BACKENDS = ('locmem', 'dummy')
+
+
+def menu_status_cache_enabled():
+    return settings.CACHE_BACKEND.split(':')[0] not in LOCAL_CACHE_BACKENDS
+
+
+def menu_status_cache_key(user_id):
+    return 'factory_menu_status_%d' % user_id
+
+
+def invalidate_menu_status(user_id):
+    if user_id is not None:
+        cache.delete(menu_status_cache_key(user_id))
+
+
+def _invalidate_menu_status_of_heuristic_version(heuristic_version):
+    if heuristic_version.heuristic_id is not None:
+        invalidate_menu_status(heuristic_version.heuristic.author_id)
+
+
+def _on_heuristic_version_changed(sender, instance, **kwargs):
+    try:
+        _invalidate_menu_status_of_heuristic_version(instance)
+    except:
+        pass
+
+
+def _on_heuristic_version_dependency_changed(sender, instance, **kwargs):
+    try:
+        _invalidate_menu_status_of_heuristic_version(instance.heuristic_version)
+    except:
+        pass
+
+
+def _on_experiment_changed(sender, instance, **kwargs):
+    invalidate_menu_status(instance.user_id)
+
+
+post_save.connect(_on_heuristic_version_changed, sender=HeuristicVersion)
+pre_delete.connect(_on_heuristic_version_changed, sender=HeuristicVersion)
+
+post_save.connect(_on_heuristic_version_dependency_changed, sender=HeuristicTestStatus)
+pre_delete.connect(_on_heuristic_version_dependency_changed, sender=HeuristicTestStatus)
+
+post_save.connect(_on_heuristic_version_dependency_changed, sender=DebuggingEntry)
+pre_delete.connect(_on_heuristic_version_dependency_changed, sender=DebuggingEntry)
+
+post_save.connect(_on_experiment_changed, sender=Experiment)
+pre_delete.connect(_on_experiment_changed, sender=Experiment)
@@ -55,6 +55,7 @@ urlpatterns = patterns('mash.factory.views',
     (r'^recorded_data_tutorial/(?P<task>\d+)/(?P<sequence>\d+)/$',                      'recorded_data_tutorial',    { 'SSL': True, 'frame_index': 0 }),
     (r'^recorded_data/(?P<task>\d+)/(?P<sequence>\d+)/(?P<frame_index>\d+)/$',          'recorded_data',             { 'SSL': True }),
     (r'^recorded_data_tutorial/(?P<task>\d+)/(?P<sequence>\d+)/(?P<frame_index>\d+)/$', 'recorded_data_tutorial',    { 'SSL': True }),
+    (r'^recorded_data_image/(?P<task>\d+)/(?P<sequence>\d+)/(?P<frame_index>\d+)/(?P<image_index>\d+)/$', 'recorded_data_image', { 'SSL': True }),
     (r'^record_data/(?P<task>\d+)/(?P<sequence>\d+)/(?P<heuristic>\d+)/$',              'record_data',               { 'SSL': True }),
     (r'^record_data_tutorial/(?P<task>\d+)/(?P<sequence>\d+)/(?P<heuristic>\d+)/$',     'record_data_tutorial',      { 'SSL': True }),
     (r'^snippet/(?P<task>\d+)/(?P<instrument_view>\d+)/$',                              'snippet',                   { 'SSL': True }),
@@ -0,0 +1,148 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from mash.heuristics.models import Heuristic
+from mash.heuristics.models import HeuristicVersion
+from mash.heuristics.models import HeuristicTestStatus
+from mash.experiments.models import Experiment
+from mash.factory.models import FactoryTaskResult, DebuggingEntry
+from mash.factory.models import menu_status_cache_enabled, menu_status_cache_key
+from mash.factory.models import MENU_STATUS_CACHE_TIMEOUT
+
+
+####################################################################################################
+#
+# MENU STATUS
+#
+####################################################################################################
+
+#---------------------------------------------------------------------------------------------------
+# Returns the status of the menu of the factory for a user (cached if the cache backend is shared
+# with the scheduler, see models.menu_status_cache_enabled())
+#---------------------------------------------------------------------------------------------------
+def menu_status(user):
+    if user.is_anonymous():
+        return _compute_menu_status(None)
+
+    if not(menu_status_cache_enabled()):
+        return _compute_menu_status(user)
+
+    key = menu_status_cache_key(user.id)
+
+    status = cache.get(key)
+    if status is None:
+        status = _compute_menu_status(user)
+        cache.set(key, status, MENU_STATUS_CACHE_TIMEOUT)
+
+    return status
+
+#---------------------------------------------------------------------------------------------------
+# Computes the status of the menu of the factory for a user (None: anonymous user)
+#---------------------------------------------------------------------------------------------------
+def _compute_menu_status(user):
+    status = {
+        'compilation': 0,
+        'experiments': 0,
+        'recorded_data': None,
+        'heuristic_unchecked': 0,
+        'nb_compilation_errors': 0,
+        'nb_total_numbers_heuristics': 0,
+        'heuristic_ids': {
+            'errors': [],
+            'in_progress': [],
+        },
+    }
+
+    if user is None:
+        return status
+
+    # Retrieve everything in one query: one row per heuristic version of the
+    # user (with its test status and debugging entry, if any), each one of
+    # them also containing the number of factory experiments in progress
+    cursor = connection.cursor()
+    cursor.execute('SELECT v.id, h.simple, v.checked, t.id, t.error, d.status, '
+                          '(SELECT COUNT(*) FROM %(results)s r '
+                                           'INNER JOIN %(experiments)s e ON e.id = r.experiment_id '
+                                           'WHERE e.user_id = u.id AND e.status IN (%%s, %%s)) '
+                   'FROM %(users)s u '
+                        'LEFT OUTER JOIN %(heuristics)s h ON h.author_id = u.id '
+                        'LEFT OUTER JOIN %(versions)s v ON v.heuristic_id = h.id '
+                        'LEFT OUTER JOIN %(test_status)s t ON t.heuristic_version_id = v.id '
+                        'LEFT OUTER JOIN %(debugging_entries)s d ON d.heuristic_version_id = v.id '
+                   'WHERE u.id = %%s '
+                   'ORDER BY v.id' % {
+                        'results':              FactoryTaskResult._meta.db_table,
+                        'experiments':          Experiment._meta.db_table,
+                        'users':                User._meta.db_table,
+                        'heuristics':           Heuristic._meta.db_table,
+                        'versions':             HeuristicVersion._meta.db_table,
+                        'test_status':          HeuristicTestStatus._meta.db_table,
+                        'debugging_entries':    DebuggingEntry._meta.db_table,
+                   },
+                   [Experiment.STATUS_SCHEDULED, Experiment.STATUS_RUNNING, user.id])
+
+    debugging_statuses = []
+
+    for (version_id, simple, checked, test_status_id, error, debugging_status, nb_experiments) in cursor.fetchall():
+        status['experiments'] = nb_experiments
+
+        if version_id is None:
+            continue
+
+        if debugging_status is not None:
+            debugging_statuses.append(debugging_status)
+
+        if not(simple):
+            continue
+
+        status['nb_total_numbers_heuristics'] += 1
+
+        if checked:
+            continue
+
+        status['heuristic_unchecked'] += 1
+
+        if test_status_id is not None:
+            if error:
+                status['heuristic_ids']['errors'].append(version_id)
+            else:
+                status['heuristic_ids']['in_progress'].append(version_id)
+
+    status['compilation'] = len(status['heuristic_ids']['in_progress'])
+    status['nb_compilation_errors'] = len(status['heuristic_ids']['errors'])
+
+    # A user has at most one debugging entry
+    if len(debugging_statuses) == 1:
+        if (debugging_statuses[0] == DebuggingEntry.STATUS_DONE) or \
+           (debugging_statuses[0] == DebuggingEntry.STATUS_FAILED):
+            status['recorded_data'] = 'done'
+        else:
+            status['recorded_data'] = 'running'
+
+    return status
@@ -42,6 +42,7 @@ from mash.experiments.views import schedule_experiment
 from mash.experiments.models import Configuration, Setting, Experiment
 from mash.experiments.models import GoalPlanningResult, GoalPlanningRound
 from mash.factory.models import FactoryTask, FactoryTaskResult, DebuggingEntry
+from mash.factory.utilities import menu_status
 from mash.instruments.models import DataReport
 from mash.instruments.views import get_snippets_static_files
 from mash.instruments.views import get_or_create_snippet
@@ -49,6 +50,8 @@ from mash.instruments.views import snippet as html_snippet
 from mash.instruments.models import View
 from pymash.gitrepository import GitRepository
 from pymash.messages import Message
+from pymash.recorded_data import RecordedDataReader, RecordedDataIndex, encodePNG
+from pymash.actions_cache import ActionsCache
 from servers import acquireExperimentsScheduler, releaseExperimentsScheduler
 from datetime import datetime, date, timedelta
 import os
@@ -126,65 +129,6 @@ def text_response(content):
     return response
 
 
-def menu_status(user):
-    status = {
-        'compilation': 0,
-        'experiments': 0,
-        'recorded_data': None,
-        'heuristic_unchecked': 0,
-        'nb_compilation_errors': 0,
-        'nb_total_numbers_heuristics': 0,
-        'heuristic_ids': {
-            'errors': [],
-            'in_progress': [],
-        },
-    }
-
-    if not(user.is_anonymous()):
-
-        heuristic_test_status = HeuristicTestStatus.objects.filter(heuristic_version__heuristic__simple=True,
-                                                                   heuristic_version__heuristic__author=user,
-                                                                   heuristic_version__checked=False,
-                                                                   error=False)
-        status['compilation'] = heuristic_test_status.count()
-
-        task_results = FactoryTaskResult.objects.filter(experiment__user=user)
-        status['experiments'] = task_results.filter(Q(experiment__status=Experiment.STATUS_SCHEDULED) |
-                                                    Q(experiment__status=Experiment.STATUS_RUNNING)).count()
-
-        status['heuristic_ids']['errors'] = \
-                map(lambda x: x.heuristic_version.id,
-                    HeuristicTestStatus.objects.filter(heuristic_version__heuristic__author__id=user.id,
-                                                       heuristic_version__heuristic__simple=True,
-                                                       heuristic_version__checked=False,
-                                                       error=True))
-
-        status['heuristic_ids']['in_progress'] = \
-                map(lambda x: x.heuristic_version.id,
-                    HeuristicTestStatus.objects.filter(heuristic_version__heuristic__author__id=user.id,
-                                                       heuristic_version__heuristic__simple=True,
-                                                       heuristic_version__checked=False,
-                                                       error=False))
-
-        status['nb_compilation_errors'] = len(status['heuristic_ids']['errors'])
-        status['nb_total_numbers_heuristics'] = HeuristicVersion.objects.filter(heuristic__simple=True,
-                                                                                heuristic__author=user).count()
-
-        try:
-            debugging_entry = DebuggingEntry.objects.get(heuristic_version__heuristic__author=user)
-            if (debugging_entry.status == DebuggingEntry.STATUS_DONE) or \
-               (debugging_entry.status == DebuggingEntry.STATUS_FAILED):
-                status['recorded_data'] = 'done'
-            else:
-                status['recorded_data'] = 'running'
-        except:
-            pass
-
-    status['heuristic_unchecked'] = HeuristicVersion.objects.filter(heuristic__author__id=user.id, heuristic__simple=True).exclude(checked=True).count()
-
-    return status
-
-
 def factory(request):
     tutorialMode = int(0)
     debugMode    = int(0)
@@ -906,6 +850,7 @@ def test(request):
                     possibleRemoveDir = settings.DATA_REPORTS_ROOT+currentReportPos
                     if j == len(reportSplits)-1:
                         os.remove("%s"%fullReportDataPath)
+                        ActionsCache.remove(fullReportDataPath)
                     if possibleRemoveDir == settings.DATA_REPORTS_ROOT:
                         pass
                     else:
@@ -1203,6 +1148,7 @@ def singleTest(request, task_number):
                         possibleRemoveDir = settings.DATA_REPORTS_ROOT+currentReportPos
                         if j == len(reportSplits)-1:
                             os.remove("%s"%fullReportDataPath)
+                            ActionsCache.remove(fullReportDataPath)
                         if possibleRemoveDir == settings.DATA_REPORTS_ROOT:
                             pass
                         else:
@@ -1464,191 +1410,6 @@ def sequence_details_tutorial(request, task, sequence):
 
 def recorded_data(request, task, sequence, frame_index):
 
-    def _fill_buffer(data_file, buffer, offset, size, target_size=None):
-        if len(buffer) - offset < size:
-            buffer = buffer[offset:]
-
-            if target_size is None:
-                target_size = size
-            else:
-                target_size = max(size, target_size)
-
-            buffer += data_file.read(target_size - len(buffer))
-            offset = 0
-
-        return (buffer, offset)
-
-
-    def _next_frame(data_file, buffer, offset, store=True):
-        (buffer, offset) = _fill_buffer(data_file, buffer, offset, 1024 * 1024 * 1024)
-
-        frame = {
-            'limit_reached': False,
-        }
-
-        # FRAME <index>
-        stop_offset = buffer.find('\n', offset)
-        if stop_offset == -1:
-            return (None, None, None)
-
-        line = buffer[offset:stop_offset]
-        if not(line.startswith('FRAME ')):
-            return (None, None, None)
-
-        frame['index'] = int(line[6:])
-
-        offset = stop_offset + 1
-
-        # SRC_IMAGE <width>x<height> <binary data>
-        stop_offset = buffer.find(' ', offset)
-        if stop_offset == -1:
-            return (None, None, None)
-
-        tag = buffer[offset:stop_offset]
-        if tag != 'SRC_IMAGE':
-            return (None, None, None)
-
-        offset = stop_offset + 1
-
-        stop_offset = buffer.find(' ', offset)
-        if stop_offset == -1:
-            return (None, None, None)
-
-        size = buffer[offset:stop_offset]
-        dim = map(lambda x: int(x), size.split('x'))
-        if len(dim) != 2:
-            return (None, None, None)
-
-        offset = stop_offset + 1
-
-        (buffer, offset) = _fill_buffer(data_file, buffer, offset, dim[0] * dim[1] * 3)
-
-        if len(buffer) - offset < dim[0] * dim[1] * 3:
-            return (None, None, None)
-
-        stop_offset = offset + dim[0] * dim[1] * 3
-
-        if store:
-            frame['src_image'] = {
-                'width': dim[0],
-                'height': dim[1],
-                'pixels': base64.encodestring(buffer[offset:stop_offset]),
-            }
-
-        offset = stop_offset
-
-        # User-dependent tags
-        (buffer, offset) = _fill_buffer(data_file, buffer, offset, 1024 * 1024 * 1024)
-
-        frame['user_data'] = []
-
-        while True:
-            (buffer, offset) = _fill_buffer(data_file, buffer, offset, 512 * 1024 * 1024, 1024 * 1024 * 1024)
-
-            stop_offset1 = buffer.find(' ', offset, offset + 14)
-            stop_offset2 = buffer.find('\n', offset, offset + 14)
-
-            if (stop_offset1 == -1) and (stop_offset2 == -1):
-                return (None, None, None)
-            elif (stop_offset1 != -1) and (stop_offset2 != -1):
-                stop_offset = min(stop_offset1, stop_offset2)
-            else:
-                stop_offset = max(stop_offset1, stop_offset2)
-
-            tag = buffer[offset:stop_offset]
-            offset = stop_offset + 1
-
-            # TEXT <size> <text>
-            if tag == 'TEXT':
-                stop_offset = buffer.find(' ', offset)
-                size = int(buffer[offset:stop_offset])
-
-                offset = stop_offset + 1
-
-                (buffer, offset) = _fill_buffer(data_file, buffer, offset, size, 1024 * 1024 * 1024)
-
-                if len(buffer) - offset < size:
-                    return (None, None, None)
-
-                stop_offset = offset + size
-
-                if store:
-                    frame['user_data'].append({
-                        'type': 'text',
-                        'text': buffer[offset:stop_offset],
-                    })
-
-                offset = stop_offset
-
-            # IMAGERGB <width>x<height> <binary data>
-            elif tag == 'IMAGERGB':
-                stop_offset = buffer.find(' ', offset)
-                if stop_offset == -1:
-                    return (None, None, None)
-
-                size = buffer[offset:stop_offset]
-                dim = map(lambda x: int(x), size.split('x'))
-                if len(dim) != 2:
-                    return (None, None, None)
-
-                offset = stop_offset + 1
-
-                (buffer, offset) = _fill_buffer(data_file, buffer, offset, dim[0] * dim[1] * 3)
-
-                if len(buffer) - offset < dim[0] * dim[1] * 3:
-                    return (None, None, None)
-
-                stop_offset = offset + dim[0] * dim[1] * 3
-
-                if store:
-                    frame['user_data'].append({
-                        'type': 'rgb',
-                        'width': dim[0],
-                        'height': dim[1],
-                        'pixels': base64.encodestring(buffer[offset:stop_offset]),
-                    })
-
-                offset = stop_offset
-
-            # IMAGEGRAY <width>x<height> <binary data>
-            elif tag == 'IMAGEGRAY':
-                stop_offset = buffer.find(' ', offset)
-                if stop_offset == -1:
-                    return (None, None, None)
-
-                size = buffer[offset:stop_offset]
-                dim = map(lambda x: int(x), size.split('x'))
-                if len(dim) != 2:
-                    return (None, None, None)
-
-                offset = stop_offset + 1
-
-                (buffer, offset) = _fill_buffer(data_file, buffer, offset, dim[0] * dim[1])
-
-                if len(buffer) - offset < dim[0] * dim[1]:
-                    return (None, None, None)
-
-                stop_offset = offset + dim[0] * dim[1]
-
-                if store:
-                    frame['user_data'].append({
-                        'type': 'gray',
-                        'width': dim[0],
-                        'height': dim[1],
-                        'pixels': base64.encodestring(buffer[offset:stop_offset]),
-                    })
-
-                offset = stop_offset
-
-            # LIMIT_REACHED
-            elif tag == 'LIMIT_REACHED':
-                frame['limit_reached'] = True
-
-            # END_FRAME
-            elif tag == 'END_FRAME':
-                return (buffer, offset, frame)
-
-
     must_return_actions = False
     if request.POST.has_key('actions'):
          must_return_actions = (int(request.POST['actions']) == 1)
@@ -1704,74 +1465,64 @@ def recorded_data(request, task, sequence, frame_index):
     else:
         response['status'] = 'done'
 
-        # Open the file
-        data_file = open(os.path.join(settings.HEURISTICS_DEBUGGING_ROOT, debugging_entry.filename()), "rb")
+        # Retrieve the index of the frames (built when the recording is done,
+        # or now if it is missing)
+        data_filename = os.path.join(settings.HEURISTICS_DEBUGGING_ROOT, debugging_entry.filename())
 
-        buffer = ''
-        offset = 0
-        json_frame = None
-
-        if request.POST.has_key('clue'):
-            clue = int(request.POST['clue'])
-
-            data_file.seek(clue, os.SEEK_SET)
+        try:
+            frames_index = RecordedDataIndex.open(data_filename)
+        except IOError:
+            raise Http404
 
-            (buffer, offset, json_frame) = _next_frame(data_file, buffer, offset)
-            if (json_frame is None) or (json_frame['index'] != int(frame_index)):
-                data_file.seek(0, os.SEEK_SET)
-                buffer = ''
-                offset = 0
-                json_frame = None
+        position = int(frame_index)
+        if position >= frames_index.nbFrames():
+            raise Http404
 
-        # Skip frames
-        if json_frame is None:
-            for i in range(0, int(frame_index)):
-                (buffer, offset, json_frame) = _next_frame(data_file, buffer, offset, False)
-                if json_frame is None:
-                    raise Http404
+        # Read the frame requested by the client. Only the texts are sent, the
+        # images are retrieved separately (see recorded_data_image())
+        reader = RecordedDataReader(data_filename)
 
-            # Retrieve the frame requested by the client
-            (buffer, offset, json_frame) = _next_frame(data_file, buffer, offset)
+        try:
+            json_frame = frames_index.readFrame(reader, position)
             if json_frame is None:
                 raise Http404
 
-        response['frames'].append(json_frame)
+            for user_data in json_frame['user_data']:
+                if user_data['type'] == 'text':
+                    user_data['text'] = user_data['text'].tobytes()
+        finally:
+            reader.close()
 
-        response['eof'] = json_frame['limit_reached'] or ((len(buffer) == offset) and (len(data_file.read(1)) == 0))
-        response['clue'] = data_file.tell() - len(buffer) + offset
+        url = '/factory/recorded_data_image/%d/%d/%d/%%d/?v=%d' % (task.taskNumber, debugging_entry.sequence,
+                                                                  position, int(os.path.getmtime(data_filename)))
 
-        try:
-            if must_return_actions:
-                task_result = FactoryTaskResult.objects.get(task=task, experiment__user=user)
+        elements = frames_index.frameElements(position)
+        images = filter(lambda x: elements[x][0] != RecordedDataReader.ELEMENT_TEXT, range(len(elements)))
 
-                if (task_result.experiment.data_report.instruments_set.filter(author__username='MASH', name='actions').count() == 1):
-                    # Setup the locking mechanism
-                    filename = os.path.join(settings.SNIPPETS_ROOT, 'snippets.lock')
-                    lock_file = open(filename, 'wb')
-                    try:
-                        os.chmod(filename, 0766)
-                    except:
-                        pass
-                    locks.lock(lock_file, locks.LOCK_EX)
+        json_frame['src_image']['url'] = url % images[0]
+        del json_frame['src_image']['pixels']
 
-                    # Uncompress the file we are interested in from the report
-                    tar = tarfile.open(os.path.join(settings.DATA_REPORTS_ROOT, task_result.experiment.data_report.filename), 'r:gz')
-                    actions_file = tar.extractfile(tar.getmember('mash/actions.data'))
-                    content = actions_file.read()
-                    tar.close()
+        for (user_data, image_index) in zip(filter(lambda x: x['type'] != 'text', json_frame['user_data']), images[1:]):
+            user_data['url'] = url % image_index
+            del user_data['pixels']
 
-                    locks.unlock(lock_file)
+        response['frames'].append(json_frame)
 
-                    while content[0] == '#':
-                        start = content.find('\n')
-                        content = content[start+1:]
+        response['eof'] = json_frame['limit_reached'] or (position == frames_index.nbFrames() - 1)
+        response['clue'] = frames_index.frames[position][2]
 
-                    start = content.find('SEQUENCE %d\n' % debugging_entry.sequence)
-                    end = content.find('SEQUENCE_END\n', start)
+        try:
+            if must_return_actions:
+                task_result = FactoryTaskResult.objects.get(task=task, experiment__user=user)
 
-                    lines = content[start:end].split('\n')[1:-1]
+                if (task_result.experiment.data_report.instruments_set.filter(author__username='MASH', name='actions').count() == 1):
+                    # The actions are extracted from the report when it is
+                    # stored (or now, for older reports)
+                    actions = ActionsCache.load(os.path.join(settings.DATA_REPORTS_ROOT, task_result.experiment.data_report.filename),
+                                                debugging_entry.sequence)
 
-                    response['actions'] = map(lambda x: map(lambda y: int(y), x.split(' ')[2:]), lines)
+                    if actions is not None:
+                        response['actions'] = map(lambda x: map(lambda y: int(y), x), actions)
         except:
             pass
 
@@ -1782,6 +1533,99 @@ def recorded_data(request, task, sequence, frame_index):
     return json_response(response)
 
 
+def recorded_data_image(request, task, sequence, frame_index, image_index):
+
+    user = process_cookie(request)
+
+    # Retrieve the task and the results
+    try:
+        task = FactoryTask.objects.get(taskNumber=task)
+        debugging_entry = DebuggingEntry.objects.get(heuristic_version__heuristic__author=user)
+    except:
+        raise Http404
+
+    if (debugging_entry.task != task) or (debugging_entry.sequence != int(sequence)) or \
+       (debugging_entry.status != DebuggingEntry.STATUS_DONE):
+        raise Http404
+
+    # Retrieve the image (the source image of the frame has the index 0, the
+    # other elements of the frame follow)
+    data_filename = os.path.join(settings.HEURISTICS_DEBUGGING_ROOT, debugging_entry.filename())
+
+    try:
+        frames_index = RecordedDataIndex.open(data_filename)
+    except IOError:
+        raise Http404
+
+    position = int(frame_index)
+    image_index = int(image_index)
+
+    if position >= frames_index.nbFrames():
+        raise Http404
+
+    elements = frames_index.frameElements(position)
+    if (image_index >= len(elements)) or (elements[image_index][0] == RecordedDataReader.ELEMENT_TEXT):
+        raise Http404
+
+    element = elements[image_index]
+    (element_type, offset, length, width, height) = element
+
+    if element_type == RecordedDataReader.ELEMENT_GRAY:
+        nb_channels = 1
+    else:
+        nb_channels = 3
+
+    # Raw pixels, if explicitly requested by the client
+    if 'application/octet-stream' in request.META.get('HTTP_ACCEPT', ''):
+        reader = RecordedDataReader(data_filename)
+        try:
+            response = HttpResponse(str(reader.rawContent(element)), mimetype='application/octet-stream')
+        finally:
+            reader.close()
+
+        response['X-Image-Width'] = str(width)
+        response['X-Image-Height'] = str(height)
+        response['X-Image-Channels'] = str(nb_channels)
+
+    # PNG image, cached next to the recorded file
+    else:
+        cache_filename = os.path.join(RecordedDataReader.imagesCacheFolder(data_filename),
+                                      '%d_%d.png' % (position, image_index))
+
+        if os.path.exists(cache_filename) and \
+           (os.path.getmtime(cache_filename) >= os.path.getmtime(data_filename)):
+            cache_file = open(cache_filename, 'rb')
+            content = cache_file.read()
+            cache_file.close()
+        else:
+            reader = RecordedDataReader(data_filename)
+            try:
+                content = encodePNG(reader.rawContent(element), width, height, nb_channels)
+            finally:
+                reader.close()
+
+            try:
+                if not(os.path.exists(os.path.dirname(cache_filename))):
+                    os.makedirs(os.path.dirname(cache_filename))
+
+                temp_filename = '%s.%d' % (cache_filename, os.getpid())
+
+                cache_file = open(temp_filename, 'wb')
+                cache_file.write(content)
+                cache_file.close()
+
+                os.rename(temp_filename, cache_filename)
+            except (IOError, OSError):
+                pass
+
+        response = HttpResponse(content, mimetype='image/png')
+
+    # The URLs sent by recorded_data() change with each recording
+    response['Cache-Control'] = 'private, max-age=86400'
+
+    return response
+
+
 def recorded_data_tutorial(request, task, sequence, frame_index):
     tutorial_step = 0
     output = {}
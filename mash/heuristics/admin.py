@@ -73,7 +73,7 @@ admin.site.register(HeuristicTestStatus, HeuristicTestStatusAdmin)
 
 class HeuristicEvaluationResultsAdmin(admin.ModelAdmin):
 
-    list_display        = ('id', 'heuristic_version', 'evaluation_config', 'experiment', 'rank')
+    list_display        = ('id', 'heuristic_version', 'evaluation_config', 'experiment', 'rank', 'train_error_mean', 'test_error_mean')
     search_fields       = ['heuristic_version__absolutename', 'configuration__name', 'experiment_name']
     list_display_links  = ('id', 'heuristic_version')
 
@@ -0,0 +1,59 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+"""
+A management command which computes the statistics (mean and standard deviation
+of the errors) stored in the evaluation results of the heuristics
+
+"""
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from mash.heuristics.models import HeuristicEvaluationResults
+
+
+class Command(BaseCommand):
+    help = "Computes the statistics stored in the evaluation results of the heuristics"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', dest='all', default=False,
+                    help='Recompute the statistics of all the evaluation results (by default, '
+                         'only the ones without statistics are processed)'),
+    )
+
+
+    def handle(self, *args, **options):
+        evaluation_results_list = HeuristicEvaluationResults.objects.filter(steps__isnull=False).distinct()
+
+        if not(options.get('all', False)):
+            evaluation_results_list = evaluation_results_list.filter(test_error_mean__isnull=True)
+
+        nb_updated = 0
+        for evaluation_results in evaluation_results_list.iterator():
+            evaluation_results.update_statistics()
+            nb_updated += 1
+
+        return "Statistics of %d evaluation results updated" % nb_updated
@@ -261,41 +261,104 @@ class HeuristicEvaluationResults(models.Model):
     experiment          = models.OneToOneField('experiments.Experiment', related_name='evaluation_results')
     rank                = models.IntegerField(blank=True, null=True)
 
+    # Statistics of the steps (see update_statistics())
+    train_error_mean        = models.FloatField(blank=True, null=True)
+    train_error_deviation   = models.FloatField(blank=True, null=True)
+    test_error_mean         = models.FloatField(blank=True, null=True)
+    test_error_deviation    = models.FloatField(blank=True, null=True)
+
 
     def __unicode__(self):
         return u"Evaluation results of heuristic '%s', configuration '%s'" % \
                     (self.heuristic_version.fullname(), self.evaluation_config.fullname())
 
     def mean_train_error(self):
-        steps = self.steps.filter(train_error__isnull=False)
-        return reduce(lambda x, y: x + y.train_error, steps, 0.0) / steps.count()
+        self.compute_statistics()
+        return self.train_error_mean
 
     def mean_test_error(self):
-        steps = self.steps.filter(test_error__isnull=False)
-        return reduce(lambda x, y: x + y.test_error, steps, 0.0) / steps.count()
+        self.compute_statistics()
+        return self.test_error_mean
 
     def train_error_standard_deviation(self):
-        steps = self.steps.filter(train_error__isnull=False)
-        return HeuristicEvaluationResults.standard_deviation(map(lambda x: x.train_error, steps))
+        self.compute_statistics()
+        return self.train_error_deviation
 
     def test_error_standard_deviation(self):
-        steps = self.steps.filter(test_error__isnull=False)
-        return HeuristicEvaluationResults.standard_deviation(map(lambda x: x.test_error, steps))
+        self.compute_statistics()
+        return self.test_error_deviation
+
+    def compute_statistics(self):
+        """Computes the statistics of the steps (without saving them) if they weren't
+        stored yet. They are only computed once per instance, even if there isn't
+        any step (the means and deviations are then None)."""
+        if getattr(self, '_statistics_computed', False):
+            return
+
+        if (self.train_error_mean is None) or (self.test_error_mean is None):
+            self.update_statistics(save=False)
+
+        self._statistics_computed = True
+
+    def update_statistics(self, save=True):
+        """Computes the statistics of the steps (must be called each time the steps
+        are modified). Only the statistics are saved, not the other fields."""
+        self._statistics_computed = True
+
+        errors = self.steps.values_list('train_error', 'test_error')
+
+        train_errors = [ x[0] for x in errors if x[0] is not None ]
+        test_errors = [ x[1] for x in errors if x[1] is not None ]
+
+        self.train_error_mean = HeuristicEvaluationResults.mean(train_errors)
+        self.train_error_deviation = HeuristicEvaluationResults.standard_deviation(train_errors)
+        self.test_error_mean = HeuristicEvaluationResults.mean(test_errors)
+        self.test_error_deviation = HeuristicEvaluationResults.standard_deviation(test_errors)
+
+        if save:
+            HeuristicEvaluationResults.objects.filter(id=self.id).update(
+                                    train_error_mean=self.train_error_mean,
+                                    train_error_deviation=self.train_error_deviation,
+                                    test_error_mean=self.test_error_mean,
+                                    test_error_deviation=self.test_error_deviation)
 
     def train_text(self):
-        return '%.2f%% (%.3f)' % (self.mean_train_error() * 100, self.train_error_standard_deviation() * 100)
+        return HeuristicEvaluationResults.error_text(self.mean_train_error(), self.train_error_standard_deviation())
 
     def test_text(self):
-        return '%.2f%% (%.3f)' % (self.mean_test_error() * 100, self.test_error_standard_deviation() * 100)
+        return HeuristicEvaluationResults.error_text(self.mean_test_error(), self.test_error_standard_deviation())
+
+    @staticmethod
+    def error_text(mean, deviation):
+        if mean is None:
+            return '-'
+
+        if deviation is None:
+            return '%.2f%%' % (mean * 100)
+
+        return '%.2f%% (%.3f)' % (mean * 100, deviation * 100)
+
+    @staticmethod
+    def mean(data):
+        if len(data) == 0:
+            return None
+
+        return reduce(lambda x, y: x + y, data, 0.0) / len(data)
 
     @staticmethod
     def standard_deviation(data):
+        if len(data) == 0:
+            return None
+
+        if len(data) == 1:
+            return 0.0
+
         errors_sum = reduce(lambda x, y: x + y, data, 0.0)
         errors_squared_sum = reduce(lambda x, y: x + y**2, data, 0.0)
         
         mean = errors_sum / len(data)
         variance = (errors_squared_sum - errors_sum * mean) / (len(data) - 1)
-        return math.sqrt(variance)
+        return math.sqrt(max(variance, 0.0))     # Rounding errors with identical values
 
     class Meta:
         verbose_name_plural = "Heuristic evaluation results"
@@ -951,10 +951,16 @@ def status(request, version_id):
                 result_configs += '    <statustext>In progress...</statustext>'
 
             if evaluation_results.experiment.isDone():
-                result_configs += '    <meantrainerror>%.2f</meantrainerror>' % (evaluation_results.mean_train_error() * 100)
-                result_configs += '    <meantesterror>%.2f</meantesterror>' % (evaluation_results.mean_test_error() * 100)
-                result_configs += '    <trainerrorvariance>%.3f</trainerrorvariance>' % (evaluation_results.train_error_standard_deviation() * 100)
-                result_configs += '    <testerrorvariance>%.3f</testerrorvariance>' % (evaluation_results.test_error_standard_deviation() * 100)
+                values = [ ('meantrainerror', '%.2f', evaluation_results.mean_train_error()),
+                           ('meantesterror', '%.2f', evaluation_results.mean_test_error()),
+                           ('trainerrorvariance', '%.3f', evaluation_results.train_error_standard_deviation()),
+                           ('testerrorvariance', '%.3f', evaluation_results.test_error_standard_deviation()),
+                         ]
+
+                # The statistics are missing if the evaluation has no step
+                for (tag, format, value) in values:
+                    if value is not None:
+                        result_configs += ('    <%s>' + format + '</%s>') % (tag, value * 100, tag)
 
             if evaluation_results.rank is not None:
                 result_configs += '    <rank>' + str(evaluation_results.rank) + '</rank>'
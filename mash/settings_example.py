@@ -86,6 +86,18 @@ if os.getenv('MASH_TEST_MODE', None) == 'ON':
     DATABASE_NAME += '-test'
 
 
+####################################################################################################
+#
+# CACHE
+#
+####################################################################################################
+
+# The cached data is invalidated by the scheduler too, so the cache must be shared
+# between the processes (memcached requires the 'python-memcached' module). With a
+# backend local to a process ('locmem://', 'dummy://'), the data isn't cached.
+CACHE_BACKEND               = 'memcached://127.0.0.1:11211/'
+
+
 ####################################################################################################
 #
 # MEDIA
@@ -136,6 +148,10 @@ COMMIT_AUTHOR               = 'MASH <mash@mash-project.eu>'
 SCHEDULER_ADDRESS   = '127.0.0.1'
 SCHEDULER_PORT      = 14000
 
+SCHEDULER_NOTIFICATIONS_DELAY   = 5     # Maximum time (in seconds) during which the
+                                        # notifications of the experiments are kept in
+                                        # memory before being saved in the database
+
 
 ####################################################################################################
 #
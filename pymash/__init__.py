@@ -26,7 +26,10 @@
 from client import *
 from server import *
 from networkutils import *
+from receive_buffer import *
 from communication_channel import *
 from outstream import *
 from data_report import *
+from actions_cache import *
+from recorded_data import *
 from messages import *
@@ -0,0 +1,213 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+import os
+import shutil
+import tarfile
+import thread
+from array import array
+
+
+#-------------------------------------------------------------------------------
+# Cache of the actions performed during the sequences of a goal-planning
+# experiment
+#
+# The actions are recorded by the 'MASH/actions' instrument in the file
+# 'mash/actions.data' of the data report of the experiment (a '.tar.gz'
+# archive). Extracting them requires to decompress the archive, so they are
+# extracted once and saved in a folder next to the data report, as two files
+# per sequence:
+#
+#   - '<sequence>.data': the actions of all the frames, as 32-bits integers
+#   - '<sequence>.rows': the offset of the first action of each frame in
+#                        '<sequence>.data' (followed by the total number of
+#                        actions), as 32-bits integers
+#-------------------------------------------------------------------------------
+class ActionsCache(object):
+
+    # Constants
+    ACTIONS_MEMBER  = 'mash/actions.data'
+
+
+    #---------------------------------------------------------------------------
+    # Returns the cache folder of a data report
+    #
+    # @param report_fullpath    Full path of the data report
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def folder(report_fullpath):
+        if report_fullpath.endswith('.tar.gz'):
+            report_fullpath = report_fullpath[:-7]
+
+        return report_fullpath + '.actions'
+
+    #---------------------------------------------------------------------------
+    # Indicates if the actions of a data report are cached
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def exists(report_fullpath):
+        return os.path.exists(ActionsCache.folder(report_fullpath))
+
+    #---------------------------------------------------------------------------
+    # Returns the actions performed during a sequence, as a list with one row
+    # per frame. Returns None if the actions of the sequence aren't known.
+    #
+    # When the cache doesn't exist yet, the actions are extracted from the
+    # data report (and cached).
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def load(report_fullpath, sequence):
+        if not(ActionsCache.exists(report_fullpath)):
+            return ActionsCache.build(report_fullpath).get(sequence, None)
+
+        folder = ActionsCache.folder(report_fullpath)
+
+        rows_filename = os.path.join(folder, '%d.rows' % sequence)
+        if not(os.path.exists(rows_filename)):
+            return None
+
+        offsets = ActionsCache._read(rows_filename)
+        data    = ActionsCache._read(os.path.join(folder, '%d.data' % sequence))
+
+        return map(lambda x: data[offsets[x]:offsets[x + 1]].tolist(), range(len(offsets) - 1))
+
+    #---------------------------------------------------------------------------
+    # Extract the actions of all the sequences from a data report, and cache
+    # them. Returns a dictionary { <sequence>: <list of actions> }.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def build(report_fullpath):
+        tar = tarfile.open(report_fullpath, 'r:gz')
+
+        try:
+            try:
+                actions_file = tar.extractfile(tar.getmember(ActionsCache.ACTIONS_MEMBER))
+                actions = ActionsCache.parse(actions_file)
+            except KeyError:
+                # No actions in this report (the cache will be empty)
+                actions = {}
+        finally:
+            tar.close()
+
+        # Write the files in a temporary folder first, so a concurrent reader
+        # never sees an incomplete cache (one per process and thread, the cache
+        # can be built by the worker threads of the scheduler)
+        folder = ActionsCache.folder(report_fullpath)
+        temp_folder = '%s.%d.%d' % (folder, os.getpid(), thread.get_ident())
+
+        if os.path.exists(temp_folder):
+            shutil.rmtree(temp_folder)
+
+        os.makedirs(temp_folder)
+
+        try:
+            for (sequence, rows) in actions.items():
+                offsets = array('i', [0])
+                data    = array('i')
+
+                for row in rows:
+                    data.extend(row)
+                    offsets.append(len(data))
+
+                ActionsCache._write(os.path.join(temp_folder, '%d.data' % sequence), data)
+                ActionsCache._write(os.path.join(temp_folder, '%d.rows' % sequence), offsets)
+
+            try:
+                os.rename(temp_folder, folder)
+            except OSError:
+                # Already built by someone else
+                pass
+        finally:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+        return actions
+
+    #---------------------------------------------------------------------------
+    # Parse the content of an 'actions.data' file
+    #
+    # The file starts with some comment lines (beginning with '#'), followed
+    # by blocks like:
+    #
+    #   SEQUENCE <sequence>
+    #   <frame> <...> <action 1> <action 2> ...
+    #   ...
+    #   SEQUENCE_END
+    #
+    # @param lines  Iterable over the lines of the file
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def parse(lines):
+        actions = {}
+        current = None
+
+        for line in lines:
+            line = line.rstrip('\n')
+
+            if line.startswith('#') or (len(line) == 0):
+                continue
+
+            if line.startswith('SEQUENCE_END'):
+                current = None
+            elif line.startswith('SEQUENCE '):
+                current = []
+                actions[int(line[9:])] = current
+            elif current is not None:
+                current.append(map(lambda x: int(x), line.split(' ')[2:]))
+
+        return actions
+
+    #---------------------------------------------------------------------------
+    # Remove the cache of a data report
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def remove(report_fullpath):
+        shutil.rmtree(ActionsCache.folder(report_fullpath), ignore_errors=True)
+
+    #---------------------------------------------------------------------------
+    # Write an array of integers in a file
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def _write(filename, values):
+        out_file = open(filename, 'wb')
+        try:
+            values.tofile(out_file)
+        finally:
+            out_file.close()
+
+    #---------------------------------------------------------------------------
+    # Read an array of integers from a file
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def _read(filename):
+        values = array('i')
+
+        in_file = open(filename, 'rb')
+        try:
+            values.fromstring(in_file.read())
+        finally:
+            in_file.close()
+
+        return values
@@ -0,0 +1,862 @@
+#! /usr/bin/env python
+
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+################################################################################
+#                                                                              #
+# Coroutine-based variants of the pymash client and server                     #
+#                                                                              #
+# They use the same protocol than Client and ServerListener (text or framed    #
+# mode, see NetworkUtils), so they can talk with all the existing servers and  #
+# clients.                                                                     #
+#                                                                              #
+# The coroutines are plain Python generators, run by an EventLoop:             #
+#                                                                              #
+#   - a coroutine calls another one with 'result = yield coroutine(...)'       #
+#   - a coroutine returns a value with 'raise Return(value)'                   #
+#   - 'yield sleep(delay)' suspends a coroutine for some time                  #
+#   - 'results = yield gather(coroutine1, coroutine2, ...)' runs several       #
+#     coroutines concurrently, and returns their results once all are done    #
+#                                                                              #
+# For instance, to contact several servers at once:                            #
+#                                                                              #
+#   def getStatus(address, port):                                              #
+#       client = AsyncClient()                                                 #
+#       if not(yield client.connect(address, port, timeout=5)):                #
+#           raise Return(None)                                                 #
+#       yield client.sendCommand('STATUS')                                     #
+#       response = yield client.waitResponse(timeout=5)                        #
+#       client.close()                                                         #
+#       raise Return(response)                                                 #
+#                                                                              #
+#   loop = EventLoop()                                                         #
+#   statuses = loop.runUntilComplete(gather(getStatus(a1, p1),                 #
+#                                           getStatus(a2, p2)))                #
+#                                                                              #
+################################################################################
+
+from pymash.networkutils import NetworkUtils
+from pymash.receive_buffer import ReceiveBuffer
+from pymash.messages import Message
+from pymash.server import ServerListener
+from collections import deque
+import heapq
+import select
+import socket
+import errno
+import fcntl
+import types
+import time
+import sys
+import os
+import traceback
+
+
+#-------------------------------------------------------------------------------
+# Raised by a coroutine to return a value (generators can't return values in
+# Python 2)
+#-------------------------------------------------------------------------------
+class Return(Exception):
+
+    def __init__(self, value=None):
+        Exception.__init__(self)
+        self.value = value
+
+
+#-------------------------------------------------------------------------------
+# Requests yielded by the coroutines to the event loop
+#-------------------------------------------------------------------------------
+class _Wait(object):
+
+    def __init__(self, descriptor, events, deadline):
+        self.descriptor = descriptor
+        self.events     = events
+        self.deadline   = deadline
+
+
+class _Sleep(object):
+
+    def __init__(self, delay):
+        self.delay = delay
+
+
+class _Gather(object):
+
+    def __init__(self, coroutines):
+        self.coroutines = coroutines
+
+
+#-------------------------------------------------------------------------------
+# Suspend the current coroutine until a file descriptor is ready
+#
+# @param descriptor     The file descriptor (or an object with a 'fileno()'
+#                       method)
+# @param events         select.POLLIN and/or select.POLLOUT
+# @param deadline       (Optional) Time (see time.time()) after which the wait
+#                       is abandoned
+# @return               (When yielded) 'True' if the descriptor is ready,
+#                       'False' if the deadline was reached
+#-------------------------------------------------------------------------------
+def wait(descriptor, events, deadline=None):
+    if hasattr(descriptor, 'fileno'):
+        descriptor = descriptor.fileno()
+
+    return _Wait(descriptor, events, deadline)
+
+
+#-------------------------------------------------------------------------------
+# Suspend the current coroutine for some time (in seconds)
+#-------------------------------------------------------------------------------
+def sleep(delay):
+    return _Sleep(delay)
+
+
+#-------------------------------------------------------------------------------
+# Run several coroutines concurrently
+#
+# @return   (Coroutine) The list of their results, in the same order. If
+#           some of them raised an exception, the first one is raised once
+#           all of them are done.
+#-------------------------------------------------------------------------------
+def gather(*coroutines):
+    results = yield _Gather(coroutines)
+    raise Return(results)
+
+
+#-------------------------------------------------------------------------------
+# Returns the deadline corresponding to a timeout (None: no timeout)
+#-------------------------------------------------------------------------------
+def deadline(timeout):
+    if timeout is None:
+        return None
+
+    return time.time() + timeout
+
+
+
+#-------------------------------------------------------------------------------
+# Represents a coroutine running in an event loop
+#-------------------------------------------------------------------------------
+class Task(object):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #---------------------------------------------------------------------------
+    def __init__(self, loop, coroutine):
+        self.loop       = loop
+        self.stack      = [coroutine]   # The coroutine and the ones it called
+        self.done       = False
+        self.result     = None
+        self.exc_info   = None
+        self.callbacks  = []            # Called once the task is done
+        self.wait_id    = 0             # Identifies the current wait
+        self.descriptor = None          # The descriptor waited, if any
+
+
+    #---------------------------------------------------------------------------
+    # Returns the result of the task, or raises its exception
+    #---------------------------------------------------------------------------
+    def getResult(self):
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+
+        return self.result
+
+
+    #---------------------------------------------------------------------------
+    # Resume the coroutine until it yields a request it must wait for
+    #
+    # @param value      The value to send to the coroutine
+    # @param exc_info   (Optional) The exception to raise in the coroutine
+    #---------------------------------------------------------------------------
+    def step(self, value=None, exc_info=None):
+        while True:
+            coroutine = self.stack[-1]
+
+            try:
+                if exc_info is not None:
+                    request = coroutine.throw(*exc_info)
+                else:
+                    request = coroutine.send(value)
+            except StopIteration:
+                (value, exc_info) = (None, None)
+            except Return, e:
+                (value, exc_info) = (e.value, None)
+            except:
+                (value, exc_info) = (None, sys.exc_info())
+            else:
+                (value, exc_info) = (None, None)
+
+                if isinstance(request, types.GeneratorType):
+                    self.stack.append(request)
+                elif isinstance(request, _Wait):
+                    self.loop._wait(self, request)
+                    return
+                elif isinstance(request, _Sleep):
+                    self.loop._sleep(self, request.delay)
+                    return
+                elif isinstance(request, _Gather):
+                    self.loop._gather(self, request.coroutines)
+                    return
+                elif request is None:
+                    self.loop._resume(self)
+                    return
+                else:
+                    try:
+                        raise TypeError("Invalid object yielded by a coroutine: %r" % request)
+                    except TypeError:
+                        exc_info = sys.exc_info()
+
+                continue
+
+            # The coroutine is done
+            self.stack.pop()
+
+            if len(self.stack) == 0:
+                self.done     = True
+                self.result   = value
+                self.exc_info = exc_info
+
+                for callback in self.callbacks:
+                    callback(self)
+
+                self.callbacks = []
+                return
+
+
+
+#-------------------------------------------------------------------------------
+# Runs coroutines, and wakes them up when the file descriptors they wait for
+# are ready (using poll)
+#
+# The loop is not thread-safe, except for the 'stop()' method.
+#-------------------------------------------------------------------------------
+class EventLoop(object):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #---------------------------------------------------------------------------
+    def __init__(self):
+        self.ready       = deque()  # (task, value, exc_info) to resume
+        self.timers      = []       # Heap of (deadline, counter, task, wait_id, value)
+        self.descriptors = {}       # Descriptor -> (task, wait_id)
+        self.counter     = 0
+        self.stopping    = False
+        self.poller      = select.poll()
+
+        # Used to interrupt the loop from another thread
+        (self.wakeupRead, self.wakeupWrite) = os.pipe()
+        flags = fcntl.fcntl(self.wakeupRead, fcntl.F_GETFL)
+        fcntl.fcntl(self.wakeupRead, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.poller.register(self.wakeupRead, select.POLLIN)
+
+
+    #---------------------------------------------------------------------------
+    # Release the resources used by the loop
+    #---------------------------------------------------------------------------
+    def close(self):
+        if self.wakeupRead is not None:
+            os.close(self.wakeupRead)
+            os.close(self.wakeupWrite)
+            self.wakeupRead = None
+            self.wakeupWrite = None
+
+
+    #---------------------------------------------------------------------------
+    # Start to run a coroutine (once the loop runs), and returns its task
+    #---------------------------------------------------------------------------
+    def spawn(self, coroutine):
+        task = Task(self, coroutine)
+        self.ready.append((task, None, None))
+        return task
+
+
+    #---------------------------------------------------------------------------
+    # Run a coroutine until it is done, and returns its result (or raises its
+    # exception)
+    #---------------------------------------------------------------------------
+    def runUntilComplete(self, coroutine):
+        task = self.spawn(coroutine)
+
+        while not(task.done) and not(self.stopping):
+            self.runOnce()
+
+        self.stopping = False
+
+        return task.getResult()
+
+
+    #---------------------------------------------------------------------------
+    # Run the coroutines until stop() is called
+    #---------------------------------------------------------------------------
+    def runForever(self):
+        while not(self.stopping):
+            self.runOnce()
+
+        self.stopping = False
+
+
+    #---------------------------------------------------------------------------
+    # Stop the loop (can be called from another thread)
+    #---------------------------------------------------------------------------
+    def stop(self):
+        self.stopping = True
+        os.write(self.wakeupWrite, 'S')
+
+
+    #---------------------------------------------------------------------------
+    # Wait (at most until the next deadline) for the file descriptors, then
+    # resume the coroutines that are ready
+    #---------------------------------------------------------------------------
+    def runOnce(self):
+        if (len(self.ready) > 0) or self.stopping:
+            timeout = 0
+        elif len(self.timers) > 0:
+            timeout = max(int((self.timers[0][0] - time.time()) * 1000) + 1, 0)
+        else:
+            timeout = -1
+
+        try:
+            events = self.poller.poll(timeout)
+        except select.error, e:
+            if e.args[0] != errno.EINTR:
+                raise
+            events = []
+
+        for (descriptor, event) in events:
+            if descriptor == self.wakeupRead:
+                try:
+                    while len(os.read(self.wakeupRead, 4096)) > 0:
+                        pass
+                except OSError:
+                    pass
+                continue
+
+            (task, wait_id) = self.descriptors[descriptor]
+            self._unwait(task)
+            self.ready.append((task, True, None))
+
+        now = time.time()
+        while (len(self.timers) > 0) and (self.timers[0][0] <= now):
+            (deadline, counter, task, wait_id, value) = heapq.heappop(self.timers)
+            if task.wait_id == wait_id:
+                self._unwait(task)
+                self.ready.append((task, value, None))
+
+        for i in range(len(self.ready)):
+            (task, value, exc_info) = self.ready.popleft()
+            task.step(value, exc_info)
+
+
+    #_____ Internal methods __________
+
+    def _resume(self, task, value=None, exc_info=None):
+        self.ready.append((task, value, exc_info))
+
+
+    def _wait(self, task, request):
+        if request.descriptor in self.descriptors:
+            try:
+                raise ValueError('The file descriptor %d is already waited by another coroutine' % request.descriptor)
+            except ValueError:
+                self.ready.append((task, None, sys.exc_info()))
+                return
+
+        task.descriptor = request.descriptor
+        self.descriptors[request.descriptor] = (task, task.wait_id)
+        self.poller.register(request.descriptor, request.events)
+
+        if request.deadline is not None:
+            self._addTimer(task, request.deadline, False)
+
+
+    def _sleep(self, task, delay):
+        self._addTimer(task, time.time() + delay, None)
+
+
+    def _gather(self, task, coroutines):
+        if len(coroutines) == 0:
+            self.ready.append((task, [], None))
+            return
+
+        subtasks  = [ self.spawn(coroutine) for coroutine in coroutines ]
+        remaining = [ len(subtasks) ]
+
+        def onDone(subtask):
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+
+            exc_info = None
+            for subtask in subtasks:
+                if subtask.exc_info is not None:
+                    exc_info = subtask.exc_info
+                    break
+
+            self.ready.append((task, [ subtask.result for subtask in subtasks ], exc_info))
+
+        for subtask in subtasks:
+            subtask.callbacks.append(onDone)
+
+
+    def _addTimer(self, task, deadline, value):
+        self.counter += 1
+        heapq.heappush(self.timers, (deadline, self.counter, task, task.wait_id, value))
+
+
+    def _unwait(self, task):
+        # Invalidates the timer of the current wait, if any
+        task.wait_id += 1
+
+        if task.descriptor is not None:
+            del self.descriptors[task.descriptor]
+            self.poller.unregister(task.descriptor)
+            task.descriptor = None
+
+
+
+#-------------------------------------------------------------------------------
+# Base class of the end-points of a connection, handled with coroutines
+#
+# All the methods taking a 'timeout' (in seconds, None: no timeout) are
+# coroutines.
+#-------------------------------------------------------------------------------
+class AsyncConnection(object):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #
+    # @param socket     (Optional) The socket of the connection
+    #---------------------------------------------------------------------------
+    def __init__(self, socket=None, outStream=None):
+        self.socket    = socket
+        self.buffer    = ReceiveBuffer()
+        self.framed    = False
+        self.outStream = outStream
+
+        if self.socket is not None:
+            self.socket.setblocking(0)
+
+
+    #---------------------------------------------------------------------------
+    # Close the connection
+    #---------------------------------------------------------------------------
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+            self.buffer.clear()
+            self.framed = False
+
+
+    #---------------------------------------------------------------------------
+    # Send a message
+    #---------------------------------------------------------------------------
+    def sendMessage(self, message, timeout=None):
+        if self.socket is None:
+            raise Return(False)
+
+        if not(isinstance(message, Message)):
+            message = Message.fromString(message)
+
+        if self.outStream is not None:
+            self.outStream.write("> %s\n" % message.toString())
+
+        result = yield self._write(NetworkUtils.encodeMessage(message, self.framed), deadline(timeout))
+        raise Return(result)
+
+
+    #---------------------------------------------------------------------------
+    # Send some data
+    #---------------------------------------------------------------------------
+    def sendData(self, data, timeout=None):
+        if self.socket is None:
+            raise Return(False)
+
+        if self.outStream is not None:
+            self.outStream.write("> <%d bytes of data>\n" % len(data))
+
+        result = yield self._write(data, deadline(timeout))
+        raise Return(result)
+
+
+    #---------------------------------------------------------------------------
+    # Retrieve the next message
+    #
+    # @return   The message, or None (error, connection closed or timeout)
+    #---------------------------------------------------------------------------
+    def waitMessage(self, timeout=None):
+        end = deadline(timeout)
+
+        while self.socket is not None:
+            message = NetworkUtils.extractMessage(self.buffer, framed=self.framed)
+            if message is not None:
+                if self.outStream is not None:
+                    self.outStream.write("< %s\n" % message.toString())
+                raise Return(message)
+
+            received = yield self._receive(end)
+            if not(received):
+                break
+
+        if self.outStream is not None:
+            self.outStream.write("ERROR: Failed to wait for a message\n")
+
+        raise Return(None)
+
+
+    #---------------------------------------------------------------------------
+    # Retrieve some data
+    #
+    # @param size   The number of bytes to retrieve
+    # @return       The data, or None (error, connection closed or timeout)
+    #---------------------------------------------------------------------------
+    def waitData(self, size, timeout=None):
+        end = deadline(timeout)
+
+        while (self.socket is not None) and (len(self.buffer) < size):
+            received = yield self._receive(end)
+            if not(received):
+                break
+
+        if (self.socket is None) or (len(self.buffer) < size):
+            if self.outStream is not None:
+                self.outStream.write("ERROR: Failed to wait for %d bytes of data\n" % size)
+            raise Return(None)
+
+        if self.outStream is not None:
+            self.outStream.write("< <%d bytes of data>\n" % size)
+
+        raise Return(self.buffer.take(size).tobytes())
+
+
+    #---------------------------------------------------------------------------
+    # Indicates if the next message is already in the internal buffer
+    #---------------------------------------------------------------------------
+    def hasMessage(self):
+        return NetworkUtils.hasMessage(self.buffer, framed=self.framed)
+
+
+    #_____ Internal methods __________
+
+    def _write(self, data, end):
+        view = memoryview(data)
+        offset = 0
+
+        while offset < len(view):
+            try:
+                offset += self.socket.send(view[offset:])
+            except socket.error, e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    if self.outStream is not None:
+                        self.outStream.write("ERROR: Failed to send some data, reason: %s\n" % traceback.format_exc())
+                    raise Return(False)
+
+                ready = yield wait(self.socket, select.POLLOUT, end)
+                if not(ready):
+                    if self.outStream is not None:
+                        self.outStream.write("ERROR: Timeout while sending some data\n")
+                    raise Return(False)
+
+        raise Return(True)
+
+
+    def _receive(self, end):
+        while True:
+            try:
+                nb = self.buffer.receive(self.socket)
+                raise Return(nb > 0)
+            except socket.error, e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    if self.outStream is not None:
+                        self.outStream.write("ERROR: Failed to receive some data, reason: %s\n" % traceback.format_exc())
+                    raise Return(False)
+
+            ready = yield wait(self.socket, select.POLLIN, end)
+            if not(ready):
+                if self.outStream is not None:
+                    self.outStream.write("ERROR: Timeout while waiting for some data\n")
+                raise Return(False)
+
+
+
+#-------------------------------------------------------------------------------
+# Represents a client, connected to a server through a network connection
+#
+# Coroutine-based equivalent of the Client class
+#-------------------------------------------------------------------------------
+class AsyncClient(AsyncConnection):
+
+    #---------------------------------------------------------------------------
+    # Establish a connection with a server
+    #---------------------------------------------------------------------------
+    def connect(self, address, port, timeout=None):
+        if self.socket is not None:
+            self.close()
+
+        if self.outStream is not None:
+            self.outStream.write("Trying to establish a connection to '%s:%d'\n" % (address, port))
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setblocking(0)
+
+        result = self.socket.connect_ex((address, port))
+        if result in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+            ready = yield wait(self.socket, select.POLLOUT, deadline(timeout))
+            if ready:
+                result = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            else:
+                result = errno.ETIMEDOUT
+
+        if result != 0:
+            self.close()
+            if self.outStream is not None:
+                self.outStream.write("ERROR - Failed to establish a connection with the server\n")
+            raise Return(False)
+
+        if self.outStream is not None:
+            self.outStream.write("Connection established with the server\n")
+
+        raise Return(True)
+
+
+    #---------------------------------------------------------------------------
+    # Send a command to the server
+    #---------------------------------------------------------------------------
+    def sendCommand(self, command, timeout=None):
+        return self.sendMessage(command, timeout)
+
+
+    #---------------------------------------------------------------------------
+    # Retrieve the next response from the server
+    #---------------------------------------------------------------------------
+    def waitResponse(self, timeout=None):
+        return self.waitMessage(timeout)
+
+
+    #---------------------------------------------------------------------------
+    # Indicates if the next response from the server is already in the internal
+    # buffer
+    #---------------------------------------------------------------------------
+    def hasResponse(self):
+        return self.hasMessage()
+
+
+    #---------------------------------------------------------------------------
+    # Ask the server to switch the connection to framed mode (see
+    # Client.useFramedMode())
+    #---------------------------------------------------------------------------
+    def useFramedMode(self, timeout=None):
+        if self.framed:
+            raise Return(True)
+
+        result = yield self.sendCommand(Message(NetworkUtils.FRAMED_MODE_COMMAND), timeout)
+        if not(result):
+            raise Return(False)
+
+        response = yield self.waitResponse(timeout)
+        if (response is None) or (response.name != 'OK'):
+            raise Return(False)
+
+        self.framed = True
+
+        raise Return(True)
+
+
+
+#-------------------------------------------------------------------------------
+# Represents a server listener, which handle the requests sent by a client
+#
+# Coroutine-based equivalent of the ServerListener class: the application must
+# provide a class inheriting this one, and implementing the 'handleCommand()'
+# coroutine (returning one of the ServerListener.ACTION_* constants).
+#-------------------------------------------------------------------------------
+class AsyncServerListener(AsyncConnection):
+
+    # Indicates if the clients can switch the connection to framed mode
+    SUPPORTS_FRAMED_MODE = True
+
+
+    #---------------------------------------------------------------------------
+    # Handle the commands sent by the client, until the connection is closed
+    #---------------------------------------------------------------------------
+    def run(self):
+        while True:
+            command = yield self.waitMessage()
+            if command is None:
+                break
+
+            if (command.name == NetworkUtils.FRAMED_MODE_COMMAND) and self.SUPPORTS_FRAMED_MODE:
+                result = yield self.sendResponse('OK')
+                if not(result):
+                    break
+
+                self.framed = True
+                continue
+
+            try:
+                action = yield self.handleCommand(command)
+            except Exception:
+                if self.outStream is not None:
+                    self.outStream.write("ERROR: Failed to handle a command, reason: %s\n" % traceback.format_exc())
+                break
+
+            if action == ServerListener.ACTION_CLOSE_CONNECTION:
+                break
+
+        self.close()
+
+
+    #---------------------------------------------------------------------------
+    # Send a response to the client
+    #---------------------------------------------------------------------------
+    def sendResponse(self, response, timeout=None):
+        return self.sendMessage(response, timeout)
+
+
+    #---------------------------------------------------------------------------
+    # Coroutine to be implemented by the listener class, to handle a command
+    # sent by the client
+    #---------------------------------------------------------------------------
+    def handleCommand(self, command):
+        raise Return(ServerListener.ACTION_NONE)
+        yield
+
+
+
+#-------------------------------------------------------------------------------
+# The server listener used by the server to handle commands when the server is
+# busy (see BusyListener)
+#-------------------------------------------------------------------------------
+class AsyncBusyListener(AsyncServerListener):
+
+    def handleCommand(self, command):
+        if command.name == 'DONE':
+            yield self.sendResponse('GOODBYE')
+        else:
+            yield self.sendResponse('BUSY')
+
+        raise Return(ServerListener.ACTION_CLOSE_CONNECTION)
+
+
+
+#-------------------------------------------------------------------------------
+# Represents a server, running in an event loop
+#
+# Each client is handled by a coroutine running the 'run()' method of a new
+# listener.
+#-------------------------------------------------------------------------------
+class AsyncServer(object):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #
+    # @param listenerClass  The class of the listeners (inheriting
+    #                       AsyncServerListener)
+    # @param loop           The event loop running the server
+    # @param nbMaxClients   The maximum number of clients handled at the same
+    #                       time (0: no limit)
+    #---------------------------------------------------------------------------
+    def __init__(self, listenerClass, loop, nbMaxClients=0, outStream=None):
+        self.listenerClass = listenerClass
+        self.loop          = loop
+        self.nbMaxClients  = nbMaxClients
+        self.outStream     = outStream
+        self.serversocket  = None
+        self.listeners     = set()
+
+
+    #---------------------------------------------------------------------------
+    # Start to listen for incoming connections (the connections are accepted
+    # by the event loop)
+    #---------------------------------------------------------------------------
+    def listen(self, host, port):
+        if self.outStream is not None:
+            self.outStream.write("Start to listen for incoming connections on '%s:%d'\n" % (host, port))
+
+        try:
+            self.serversocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.serversocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.serversocket.bind((host, port))
+            self.serversocket.listen(max(self.nbMaxClients * 2, 10))
+            self.serversocket.setblocking(0)
+        except socket.error:
+            if self.outStream is not None:
+                self.outStream.write("ERROR - Failed to listen for incoming connections\n")
+            self.serversocket = None
+            return False
+
+        self.loop.spawn(self._accept(self.serversocket))
+
+        return True
+
+
+    #---------------------------------------------------------------------------
+    # Stop the server and close all the connections (the event loop must not
+    # be running)
+    #---------------------------------------------------------------------------
+    def close(self):
+        if self.serversocket is not None:
+            self.serversocket.close()
+            self.serversocket = None
+
+        for listener in list(self.listeners):
+            listener.close()
+
+        self.listeners = set()
+
+
+    #_____ Internal methods __________
+
+    def _accept(self, serversocket):
+        while self.serversocket is serversocket:
+            try:
+                (clientsocket, address) = serversocket.accept()
+            except socket.error, e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    if self.outStream is not None:
+                        self.outStream.write("Failed to accept a connection, reason: %s\n" % traceback.format_exc())
+                    break
+
+                yield wait(serversocket, select.POLLIN)
+                continue
+
+            if self.outStream is not None:
+                self.outStream.write("Incoming connection from %s\n" % str(address))
+
+            if (self.nbMaxClients > 0) and (len(self.listeners) >= self.nbMaxClients):
+                listener = AsyncBusyListener(clientsocket)
+            else:
+                listener = self.listenerClass(clientsocket)
+
+            self.listeners.add(listener)
+            self.loop.spawn(self._handle(listener))
+
+
+    def _handle(self, listener):
+        try:
+            yield listener.run()
+        finally:
+            self.listeners.discard(listener)
@@ -28,7 +28,9 @@
 from pymash.networkutils import NetworkUtils
 from pymash.messages import Message
 from pymash.outstream import OutStream
+from pymash.receive_buffer import ReceiveBuffer
 import socket
+import os
 import traceback
 
 
@@ -42,7 +44,9 @@ class Client:
     #---------------------------------------------------------------------------
     def __init__(self, outStream=None):
         self.socket = None
-        self.buffer = ''
+        self.buffer = ReceiveBuffer()
+        self.framed = False
+        self.framedModeSupported = None     # None: not negotiated yet
         self.outStream = outStream
 
 
@@ -78,7 +82,9 @@ class Client:
         if self.socket:
             self.socket.close()
             self.socket = None
-            self.buffer = ''
+            self.buffer.clear()
+            self.framed = False
+            self.framedModeSupported = None
 
 
     #---------------------------------------------------------------------------
@@ -97,7 +103,7 @@ class Client:
             self.outStream.write("> %s\n" % command.toString())
 
         try:
-            result = NetworkUtils.sendMessage(self.socket, command)
+            result = NetworkUtils.sendMessage(self.socket, command, framed=self.framed)
         except socket.error:
             result = None
             if self.outStream is not None:
@@ -128,12 +134,48 @@ class Client:
         return result
 
 
+    #---------------------------------------------------------------------------
+    # Send the content of a file to the server, without loading it in memory
+    #
+    # @param  inFile    The file (opened in binary mode), or its path
+    # @param  size      (Optional) Number of bytes to send, starting at the
+    #                   current position in the file. By default, everything
+    #                   up to the end of the file.
+    #---------------------------------------------------------------------------
+    def sendFileStream(self, inFile, size=None):
+        if self.socket is None:
+            return False
+
+        mustClose = not(hasattr(inFile, 'read'))
+        if mustClose:
+            inFile = open(inFile, 'rb')
+
+        if size is None:
+            size = os.fstat(inFile.fileno()).st_size - inFile.tell()
+
+        if self.outStream is not None:
+            self.outStream.write("> <%d bytes of data>\n" % size)
+
+        try:
+            result = NetworkUtils.sendFile(self.socket, inFile, size)
+        except socket.error:
+            result = False
+            if self.outStream is not None:
+                self.outStream.write("ERROR: Failed to send the file, reason: %s\n" % traceback.format_exc())
+
+        if mustClose:
+            inFile.close()
+
+        return result
+
+
     #---------------------------------------------------------------------------
     # Retrieve the next response from the server (blocking call)
     #---------------------------------------------------------------------------
     def waitResponse(self):
         try:
-            (response, self.buffer) = NetworkUtils.waitMessage(self.socket, self.buffer)
+            (response, self.buffer) = NetworkUtils.waitMessage(self.socket, self.buffer,
+                                                                framed=self.framed)
         except socket.error:
             if self.outStream is not None:
                 self.outStream.write("ERROR: Failed to wait for a response, reason: %s\n" % traceback.format_exc())
@@ -152,8 +194,12 @@ class Client:
 
     #---------------------------------------------------------------------------
     # Retrieve the some data from the server (blocking call)
+    #
+    # If 'copy' is False, the data is returned as a view on the internal buffer
+    # of the client, only valid until the next call to 'waitResponse()' or
+    # 'waitData()'
     #---------------------------------------------------------------------------
-    def waitData(self, size):
+    def waitData(self, size, copy=True):
         try:
             (data, self.buffer) = NetworkUtils.waitData(self.socket, self.buffer, size)
         except socket.error:
@@ -169,12 +215,86 @@ class Client:
         if self.outStream is not None:
             self.outStream.write("< <%d bytes of data>\n" % size)
 
+        if copy:
+            return data.tobytes()
+
         return data
 
 
+    #---------------------------------------------------------------------------
+    # Retrieve some data from the server and write it directly in a file
+    # (blocking call)
+    #
+    # @param  outFile   The file (opened in binary mode), or its path
+    # @param  size      Number of bytes to receive
+    # @return           The MD5 checksum of the data (as an hexadecimal
+    #                   string), or None in case of error
+    #---------------------------------------------------------------------------
+    def receiveToFile(self, outFile, size):
+        if self.socket is None:
+            return None
+
+        mustClose = not(hasattr(outFile, 'write'))
+        if mustClose:
+            outFile = open(outFile, 'wb')
+
+        try:
+            (checksum, self.buffer) = NetworkUtils.receiveToFile(self.socket, self.buffer, outFile, size)
+        except (socket.error, IOError):
+            checksum = None
+            if self.outStream is not None:
+                self.outStream.write("ERROR: Failed to receive %d bytes of data, reason: %s\n" % (size, traceback.format_exc()))
+
+        if mustClose:
+            outFile.close()
+
+        if checksum is None:
+            if self.outStream is not None:
+                self.outStream.write("ERROR: Failed to receive %d bytes of data\n" % size)
+            return None
+
+        if self.outStream is not None:
+            self.outStream.write("< <%d bytes of data, MD5: %s>\n" % (size, checksum))
+
+        return checksum
+
+
     #---------------------------------------------------------------------------
     # Indicates if the next response from the server is already in the internal
     # buffer
     #---------------------------------------------------------------------------
     def hasResponse(self):
-        return (self.buffer.find('\n') != -1)
+        return NetworkUtils.hasMessage(self.buffer, framed=self.framed)
+
+
+    #---------------------------------------------------------------------------
+    # Ask the server to switch the connection to framed mode (see NetworkUtils)
+    #
+    # Must be called after the INFO/PROTOCOL handshake. If the server doesn't
+    # support the framed mode, the connection stays in text mode.
+    #
+    # The mode is only negotiated once per connection: the result is remembered
+    # until the connection is closed (the connections are reused, see
+    # ServerConnectionPool in the scheduler).
+    #
+    # @return   'True' if the connection is now in framed mode
+    #---------------------------------------------------------------------------
+    def useFramedMode(self):
+        if self.framedModeSupported is not None:
+            return self.framed
+
+        if not(self.sendCommand(Message(NetworkUtils.FRAMED_MODE_COMMAND))):
+            return False
+
+        response = self.waitResponse()
+        if (response is None) or (response.name != 'OK'):
+            if response is not None:
+                self.framedModeSupported = False
+            if self.outStream is not None:
+                self.outStream.write("The server doesn't support the framed mode, using the text mode\n")
+            return False
+
+        self.framed = True
+        self.framedModeSupported = True
+
+        return True
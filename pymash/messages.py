@@ -24,10 +24,23 @@
 ################################################################################
 
 
- Represents a message
+import struct
+
+
+#-------------------------------------------------------------------------------
+# Represents a message
 #-------------------------------------------------------------------------------
 class Message(object):
 
+    # Constants
+    FRAME_TYPE_INT      = 'i'
+    FRAME_TYPE_FLOAT    = 'f'
+    FRAME_TYPE_STRING   = 's'
+
+    FRAME_INT_MIN       = -2 ** 63
+    FRAME_INT_MAX       = 2 ** 63 - 1
+
+
     #---------------------------------------------------------------------------
     # Constructor
     #
@@ -95,21 +108,7 @@ class Message(object):
                     parameters.append(part[1:])
                     quotedString = True
                 else:
-                    decoded = Message._decode(part)
-
-                    try:
-                        parameters.append(int(decoded))
-                        continue
-                    except ValueError:
-                        pass
-
-                    try:
-                        parameters.append(float(decoded))
-                        continue
-                    except ValueError:
-                        pass
-
-                    parameters.append(decoded)
+                    parameters.append(Message._convert(Message._decode(part)))
             else:
                 if part.endswith("'") and ((len(part) == 1) or not(part.endswith("\\'"))):
                     parameters[-1] += ' ' + part[:-1]
@@ -120,6 +119,107 @@ class Message(object):
 
         return Message(name, parameters)
 
+    #---------------------------------------------------------------------------
+    # Returns a binary representation of the message, used when the connection
+    # is in framed mode
+    #
+    # The payload is made of the name of the message followed by its typed
+    # parameters (integer, float or string), so the receiver doesn't need to
+    # guess the type of each parameter. The length header of the frame is not
+    # included (see NetworkUtils).
+    #
+    # The parameters are decoded only once: the ones of a message given as a
+    # text are converted by fromString() before being framed (see
+    # NetworkUtils.encodeMessage()), and fromFrame() keeps the string parameters
+    # as they are, like the quoted parameters of fromString().
+    #---------------------------------------------------------------------------
+    def toFrame(self):
+        name = self.name
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+
+        parts = [struct.pack('!H', len(name)), name]
+
+        if self.parameters is None:
+            parts.append(struct.pack('!H', 0))
+            return ''.join(parts)
+
+        parts.append(struct.pack('!H', len(self.parameters)))
+
+        for param in self.parameters:
+            if isinstance(param, (int, long)) and \
+               (Message.FRAME_INT_MIN <= param <= Message.FRAME_INT_MAX):
+                parts.append(struct.pack('!cq', Message.FRAME_TYPE_INT, param))
+            elif isinstance(param, float):
+                parts.append(struct.pack('!cd', Message.FRAME_TYPE_FLOAT, param))
+            else:
+                if isinstance(param, unicode):
+                    param = param.encode('utf-8')
+                else:
+                    param = str(param)
+
+                parts.append(struct.pack('!cI', Message.FRAME_TYPE_STRING, len(param)))
+                parts.append(param)
+
+        return ''.join(parts)
+
+    #---------------------------------------------------------------------------
+    # Returns a message from a binary representation (see toFrame())
+    #
+    # @param payload    The payload of the frame (a string or any object
+    #                   supporting the buffer interface)
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def fromFrame(payload):
+        if isinstance(payload, memoryview):
+            payload = payload.tobytes()
+
+        (length,) = struct.unpack_from('!H', payload, 0)
+        offset = 2
+        name = payload[offset:offset + length]
+        offset += length
+
+        (nb_parameters,) = struct.unpack_from('!H', payload, offset)
+        offset += 2
+
+        parameters = []
+        for i in range(nb_parameters):
+            param_type = payload[offset]
+            offset += 1
+
+            if param_type == Message.FRAME_TYPE_INT:
+                parameters.append(struct.unpack_from('!q', payload, offset)[0])
+                offset += 8
+            elif param_type == Message.FRAME_TYPE_FLOAT:
+                parameters.append(struct.unpack_from('!d', payload, offset)[0])
+                offset += 8
+            elif param_type == Message.FRAME_TYPE_STRING:
+                (length,) = struct.unpack_from('!I', payload, offset)
+                offset += 4
+                parameters.append(payload[offset:offset + length])
+                offset += length
+            else:
+                raise ValueError("Invalid parameter type in frame: '%s'" % param_type)
+
+        return Message(name, parameters)
+
+    #---------------------------------------------------------------------------
+    # Convert an (unquoted) parameter to a number if possible
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def _convert(text):
+        try:
+            return int(text)
+        except ValueError:
+            pass
+
+        try:
+            return float(text)
+        except ValueError:
+            pass
+
+        return text
+
     #---------------------------------------------------------------------------
     # Encode a string
     #---------------------------------------------------------------------------
@@ -26,8 +26,12 @@
 
 
 from pymash.messages import Message
+from pymash.receive_buffer import ReceiveBuffer
+import hashlib
 import select
 import socket
+import struct
+import os
 
 
 #-------------------------------------------------------------------------------
@@ -35,17 +39,25 @@ import socket
 #-------------------------------------------------------------------------------
 class NetworkUtils:
 
+    # Constants
+    FRAMED_MODE_COMMAND = 'USE_FRAMED_MODE'     # Command used to switch a
+                                                # connection to framed mode
+    FRAME_HEADER        = '!I'                  # Length of the payload
+    FRAME_HEADER_SIZE   = struct.calcsize(FRAME_HEADER)
+
+    FILE_CHUNK_SIZE     = 1024 * 1024           # Size of the chunks used to
+                                                # stream files
+
+
     #---------------------------------------------------------------------------
     # Send a message
     #
     # @param  message   The message
+    # @param  framed    Indicates if the connection is in framed mode
     #---------------------------------------------------------------------------
     @staticmethod
-    def sendMessage(thesocket, message):
-        if isinstance(message, Message):
-            message = message.toString()
-
-        message += '\n'
+    def sendMessage(thesocket, message, framed=False):
+        message = NetworkUtils.encodeMessage(message, framed)
 
         # Send the message
         try:
@@ -58,6 +70,27 @@ class NetworkUtils:
         return True
 
 
+    #---------------------------------------------------------------------------
+    # Returns the bytes to send on the network for a message
+    #
+    # @param  message   The message
+    # @param  framed    Indicates if the connection is in framed mode
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def encodeMessage(message, framed=False):
+        if framed:
+            if not(isinstance(message, Message)):
+                message = Message.fromString(message)
+
+            payload = message.toFrame()
+            return struct.pack(NetworkUtils.FRAME_HEADER, len(payload)) + payload
+
+        if isinstance(message, Message):
+            message = message.toString()
+
+        return message + '\n'
+
+
     #---------------------------------------------------------------------------
     # Send a buffer of data
     #
@@ -77,21 +110,117 @@ class NetworkUtils:
         return True
 
 
+    #---------------------------------------------------------------------------
+    # Send the content of a file, without loading it in memory
+    #
+    # Uses 'os.sendfile()' when available, otherwise the file is sent by chunks
+    # read into a reusable buffer.
+    #
+    # @param  inFile    The file (opened in binary mode)
+    # @param  size      Number of bytes to send, starting at the current
+    #                   position in the file
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def sendFile(thesocket, inFile, size):
+
+        offset = inFile.tell()
+
+        try:
+            if hasattr(os, 'sendfile'):
+                while size > 0:
+                    nb = os.sendfile(thesocket.fileno(), inFile.fileno(), offset,
+                                     min(size, NetworkUtils.FILE_CHUNK_SIZE))
+                    if nb <= 0:
+                        return False
+
+                    offset += nb
+                    size -= nb
+
+                inFile.seek(offset, os.SEEK_SET)
+            else:
+                chunk = bytearray(min(size, NetworkUtils.FILE_CHUNK_SIZE))
+                view = memoryview(chunk)
+
+                while size > 0:
+                    nb = inFile.readinto(view[0:min(size, len(chunk))])
+                    if nb <= 0:
+                        return False
+
+                    thesocket.sendall(view[0:nb])
+                    size -= nb
+        except socket.error:
+            raise
+
+        return True
+
+
+    #---------------------------------------------------------------------------
+    # Retrieve some data and write it directly in a file (blocking call)
+    #
+    # The data already in the buffer is written first, then the rest is
+    # received by chunks into a reusable buffer. A MD5 checksum of the data is
+    # computed on the fly.
+    #
+    # @param  outFile   The file (opened in binary mode)
+    # @param  size      Number of bytes to receive
+    # @return           (checksum, buffer), the checksum being None if the
+    #                   connection was closed before all the data was received
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def receiveToFile(thesocket, buffer, outFile, size):
+
+        if not(isinstance(buffer, ReceiveBuffer)):
+            buffer = ReceiveBuffer(buffer)
+
+        checksum = hashlib.md5()
+
+        if len(buffer) > 0:
+            data = buffer.take(min(size, len(buffer)))
+            outFile.write(data)
+            checksum.update(data)
+            size -= len(data)
+
+        if size > 0:
+            chunk = bytearray(min(size, NetworkUtils.FILE_CHUNK_SIZE))
+            view = memoryview(chunk)
+
+            try:
+                while size > 0:
+                    nb = thesocket.recv_into(view, min(size, len(chunk)))
+                    if nb <= 0:
+                        return (None, buffer)
+
+                    outFile.write(view[0:nb])
+                    checksum.update(view[0:nb])
+                    size -= nb
+            except socket.error:
+                raise
+
+        return (checksum.hexdigest(), buffer)
+
+
     #---------------------------------------------------------------------------
     # Retrieve the next message (can be a blocking or a non-blocking call)
     #
     # An optional 'interrupt channel' can be provided. If some data can be read
     # using it, the wait is over.
+    #
+    # When 'framed' is True, the messages are expected to be sent in framed
+    # mode (see sendMessage())
+    #
+    # The buffer is a ReceiveBuffer (a string is accepted for convenience, in
+    # which case a new ReceiveBuffer is created and returned)
     #---------------------------------------------------------------------------
     @staticmethod
-    def waitMessage(thesocket, buffer, interrupt_channel=None, block=True):
+    def waitMessage(thesocket, buffer, interrupt_channel=None, block=True, framed=False):
 
-        MAXDATASIZE = 256
+        if not(isinstance(buffer, ReceiveBuffer)):
+            buffer = ReceiveBuffer(buffer)
 
         try:
-            (message, buffer) = NetworkUtils._extractMessageFromBuffer(buffer)
+            message = NetworkUtils.extractMessage(buffer, framed)
             if message is not None:
-                return (Message.fromString(message), buffer)
+                return (message, buffer)
 
             select_list = [thesocket]
             if interrupt_channel is not None:
@@ -106,15 +235,12 @@ class NetworkUtils:
                 ready_to_read, ready_to_write, in_error = select.select(select_list, [], select_list)
 
                 if thesocket in ready_to_read:
-                    data = thesocket.recv(MAXDATASIZE)
-                    if len(data) <= 0:
+                    if buffer.receive(thesocket) <= 0:
                         break
 
-                    buffer += data
-
-                    (message, buffer) = NetworkUtils._extractMessageFromBuffer(buffer)
+                    message = NetworkUtils.extractMessage(buffer, framed)
                     if message is not None:
-                        return (Message.fromString(message), buffer)
+                        return (message, buffer)
 
                 elif (interrupt_channel is not None) and (interrupt_channel.readPipe in ready_to_read):
                     break
@@ -133,23 +259,24 @@ class NetworkUtils:
     #
     # An optional 'interrupt channel' can be provided. If some data can be read
     # using it, the wait is over.
+    #
+    # The data is returned as a view on the buffer (only valid until the next
+    # read using the same buffer), or None if the connection was closed before
+    # all the data was received
     #---------------------------------------------------------------------------
     @staticmethod
     def waitData(thesocket, buffer, size, interrupt_channel=None):
 
-        total = 0
-        bytesleft = size
-        data = ''
+        if not(isinstance(buffer, ReceiveBuffer)):
+            buffer = ReceiveBuffer(buffer)
 
         try:
             if len(buffer) >= size:
-                return (buffer[0:size], buffer[size:])
+                return (buffer.take(size), buffer)
 
-            elif len(buffer) > 0:
-                data = buffer
-                total = len(buffer)
-                bytesleft -= total;
-                buffer = ''
+            # Ensure that all the data will fit in the buffer, so we can return
+            # a view on it
+            buffer.reserve(size - len(buffer))
 
             select_list = [thesocket]
             if interrupt_channel is not None:
@@ -159,17 +286,11 @@ class NetworkUtils:
                 ready_to_read, ready_to_write, in_error = select.select(select_list, [], select_list)
 
                 if thesocket in ready_to_read:
-                    received_data = thesocket.recv(bytesleft)
-
-                    if len(received_data) <= 0:
+                    if buffer.receive(thesocket) <= 0:
                         break
 
-                    data += received_data
-                    total += len(received_data)
-                    bytesleft -= len(received_data)
-
-                    if bytesleft == 0:
-                        return (data, buffer)
+                    if len(buffer) >= size:
+                        return (buffer.take(size), buffer)
 
                 elif (interrupt_channel is not None) and (interrupt_channel.readPipe in ready_to_read):
                     break
@@ -177,24 +298,37 @@ class NetworkUtils:
         except socket.error:
             raise
 
-        return (data, buffer)
+        return (None, buffer)
 
 
     #---------------------------------------------------------------------------
-    # Retrieves the next message in the provided buffer of data
+    # Indicates if a complete message is available in the provided buffer of
+    # data
     #---------------------------------------------------------------------------
     @staticmethod
-    def _extractMessageFromBuffer(buffer):
+    def hasMessage(buffer, framed=False):
+        if not(isinstance(buffer, ReceiveBuffer)):
+            buffer = ReceiveBuffer(buffer)
 
-        offset = buffer.find('\n')
-        while offset != -1:
-            line = buffer[0:offset]
-            buffer = buffer[offset+1:];
+        if framed:
+            return buffer.hasFrame(NetworkUtils.FRAME_HEADER)
 
-            if offset == 0:
-                offset = buffer.find('\n')
-                continue
+        return buffer.hasLine()
 
-            return (line, buffer)
 
-        return (None, buffer)
+    #---------------------------------------------------------------------------
+    # Retrieves and decodes the next message in the provided buffer of data
+    # (non-blocking, returns None if no complete message is available)
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def extractMessage(buffer, framed=False):
+        if framed:
+            payload = buffer.extractFrame(NetworkUtils.FRAME_HEADER)
+            if payload is not None:
+                return Message.fromFrame(payload)
+        else:
+            line = buffer.extractLine()
+            if line is not None:
+                return Message.fromString(line.tobytes())
+
+        return None
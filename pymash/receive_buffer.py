@@ -0,0 +1,214 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+import struct
+
+
+#-------------------------------------------------------------------------------
+# Buffer used to store the data received through a network connection
+#
+# The data is received directly into a preallocated bytearray (using
+# 'socket.recv_into()'), and the extracted message lines and binary payloads
+# are returned as memoryviews on this bytearray, without copying them.
+#
+# The views returned by the extraction methods are only valid until the next
+# call to 'receive()' or 'reserve()': the content of the buffer is moved to
+# its beginning (compaction) only when there isn't enough free space at its
+# end to receive more data.
+#-------------------------------------------------------------------------------
+class ReceiveBuffer:
+
+    # Constants
+    DEFAULT_CAPACITY    = 64 * 1024
+    MIN_RECEIVE_SIZE    = 4 * 1024
+
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #
+    # @param data       (Optional) Initial content of the buffer
+    # @param capacity   Initial capacity of the buffer (in bytes)
+    #---------------------------------------------------------------------------
+    def __init__(self, data='', capacity=DEFAULT_CAPACITY):
+        self.data  = bytearray(max(capacity, len(data)))
+        self.view  = memoryview(self.data)
+        self.start = 0
+        self.end   = 0
+
+        if len(data) > 0:
+            self.append(data)
+
+
+    #---------------------------------------------------------------------------
+    # Returns the number of bytes available in the buffer
+    #---------------------------------------------------------------------------
+    def __len__(self):
+        return self.end - self.start
+
+
+    #---------------------------------------------------------------------------
+    # Returns a copy of the content of the buffer
+    #---------------------------------------------------------------------------
+    def __str__(self):
+        return self.view[self.start:self.end].tobytes()
+
+
+    #---------------------------------------------------------------------------
+    # Remove all the data from the buffer
+    #---------------------------------------------------------------------------
+    def clear(self):
+        self.start = 0
+        self.end   = 0
+
+
+    #---------------------------------------------------------------------------
+    # Ensure that at least 'size' bytes can be written at the end of the buffer,
+    # by compacting or growing it if necessary
+    #---------------------------------------------------------------------------
+    def reserve(self, size):
+        if len(self.data) - self.end >= size:
+            return
+
+        length = self.end - self.start
+
+        # Compaction: enough space once the consumed data is discarded
+        if len(self.data) - length >= size:
+            self.data[0:length] = self.view[self.start:self.end]
+
+        # Otherwise, allocate a bigger buffer (the old one is kept alive by the
+        # views previously returned, if any)
+        else:
+            data = bytearray(max(len(self.data) * 2, length + size))
+            data[0:length] = self.view[self.start:self.end]
+
+            self.data = data
+            self.view = memoryview(self.data)
+
+        self.start = 0
+        self.end   = length
+
+
+    #---------------------------------------------------------------------------
+    # Append some data at the end of the buffer
+    #---------------------------------------------------------------------------
+    def append(self, data):
+        self.reserve(len(data))
+        self.data[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+
+    #---------------------------------------------------------------------------
+    # Receive data from a socket directly into the buffer
+    #
+    # @param thesocket  The socket
+    # @param size       (Optional) Minimum number of bytes that the buffer must
+    #                   be able to receive
+    # @return           The number of bytes received (0 if the connection was
+    #                   closed)
+    #---------------------------------------------------------------------------
+    def receive(self, thesocket, size=None):
+        self.reserve(max(size, ReceiveBuffer.MIN_RECEIVE_SIZE))
+
+        nb = thesocket.recv_into(self.view[self.end:])
+        self.end += nb
+
+        return nb
+
+
+    #---------------------------------------------------------------------------
+    # Returns a view on the first 'size' bytes of the buffer, without removing
+    # them
+    #---------------------------------------------------------------------------
+    def peek(self, size):
+        return self.view[self.start:self.start + min(size, len(self))]
+
+
+    #---------------------------------------------------------------------------
+    # Removes the first 'size' bytes of the buffer, and returns a view on them
+    #---------------------------------------------------------------------------
+    def take(self, size):
+        size = min(size, len(self))
+
+        data = self.view[self.start:self.start + size]
+        self.start += size
+
+        if self.start == self.end:
+            self.start = 0
+            self.end   = 0
+
+        return data
+
+
+    #---------------------------------------------------------------------------
+    # Indicates if a complete line is available in the buffer
+    #---------------------------------------------------------------------------
+    def hasLine(self):
+        return (self.data.find('\n', self.start, self.end) != -1)
+
+
+    #---------------------------------------------------------------------------
+    # Removes the next non-empty line from the buffer and returns a view on it
+    # (without the end-of-line character), or None
+    #---------------------------------------------------------------------------
+    def extractLine(self):
+        offset = self.data.find('\n', self.start, self.end)
+        while offset != -1:
+            line = self.view[self.start:offset]
+            self.start = offset + 1
+
+            if len(line) == 0:
+                offset = self.data.find('\n', self.start, self.end)
+                continue
+
+            return line
+
+        return None
+
+
+    #---------------------------------------------------------------------------
+    # Indicates if a complete frame (whose payload size is given by a header of
+    # the provided format) is available in the buffer
+    #---------------------------------------------------------------------------
+    def hasFrame(self, header):
+        header_size = struct.calcsize(header)
+        if len(self) < header_size:
+            return False
+
+        (size,) = struct.unpack_from(header, self.data, self.start)
+        return (len(self) >= header_size + size)
+
+
+    #---------------------------------------------------------------------------
+    # Removes the next frame from the buffer and returns a view on its payload,
+    # or None
+    #---------------------------------------------------------------------------
+    def extractFrame(self, header):
+        if not(self.hasFrame(header)):
+            return None
+
+        (size,) = struct.unpack_from(header, self.data, self.start)
+        self.start += struct.calcsize(header)
+
+        return self.take(size)
@@ -0,0 +1,505 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+import os
+import mmap
+import thread
+import struct
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+#-------------------------------------------------------------------------------
+# Reader of a file of recorded debugging data (see HeuristicDebugger)
+#
+# The recorded file is a sequence of frames, each one of them made of:
+#
+#   FRAME <index>\n
+#   SRC_IMAGE <width>x<height> <binary data>
+#
+# followed by any number of user-dependent tags:
+#
+#   TEXT <size> <text>
+#   IMAGERGB <width>x<height> <binary data>
+#   IMAGEGRAY <width>x<height> <binary data>
+#   LIMIT_REACHED
+#
+# and terminated by 'END_FRAME'.
+#
+# The file is memory-mapped, and the content of the elements of the frames
+# (pixels and texts) is returned as memoryviews on the mapping: nothing is
+# copied until the caller needs it. Those views are only valid until the
+# reader is closed.
+#-------------------------------------------------------------------------------
+class RecordedDataReader(object):
+
+    # Constants
+    ELEMENT_SRC_IMAGE   = 'S'
+    ELEMENT_TEXT        = 'T'
+    ELEMENT_RGB         = 'R'
+    ELEMENT_GRAY        = 'G'
+
+    MAX_TOKEN_LENGTH    = 32
+
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #
+    # @param filename   Path of the recorded file
+    #---------------------------------------------------------------------------
+    def __init__(self, filename):
+        self.map  = None
+        self.view = None
+        self.size = 0
+
+        data_file = open(filename, 'rb')
+
+        try:
+            self.size = os.fstat(data_file.fileno()).st_size
+
+            # Empty files can't be mapped
+            if self.size > 0:
+                self.map  = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(buffer(self.map))
+        finally:
+            data_file.close()
+
+    #---------------------------------------------------------------------------
+    # Returns the folder in which the encoded images of a recorded file are
+    # cached
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def imagesCacheFolder(data_filename):
+        return data_filename + '.images'
+
+    #---------------------------------------------------------------------------
+    # Close the reader (the views previously returned become invalid)
+    #---------------------------------------------------------------------------
+    def close(self):
+        self.view = None
+
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    #---------------------------------------------------------------------------
+    # Iterate over the (complete) frames of the file
+    #
+    # @param offset     Offset of the first frame to read
+    #---------------------------------------------------------------------------
+    def frames(self, offset=0):
+        while True:
+            result = self.scanFrame(offset)
+            if result is None:
+                return
+
+            (frame_index, limit_reached, elements, offset) = result
+
+            yield self.makeFrame(frame_index, limit_reached, elements)
+
+    #---------------------------------------------------------------------------
+    # Parse the frame starting at the given offset. Returns a tuple
+    # (<index>, <limit_reached>, <elements>, <end offset>), or None if there
+    # is no complete frame at that offset. Each element is a tuple
+    # (<type>, <offset>, <length>, <width>, <height>).
+    #---------------------------------------------------------------------------
+    def scanFrame(self, offset):
+        # FRAME <index>
+        (tag, offset) = self._readToken(offset)
+        if tag != 'FRAME':
+            return None
+
+        (token, offset) = self._readToken(offset)
+        try:
+            frame_index = int(token)
+        except (TypeError, ValueError):
+            return None
+
+        # SRC_IMAGE <width>x<height> <binary data>
+        (tag, offset) = self._readToken(offset)
+        if tag != 'SRC_IMAGE':
+            return None
+
+        (element, offset) = self._scanImage(offset, RecordedDataReader.ELEMENT_SRC_IMAGE, 3)
+        if element is None:
+            return None
+
+        elements = [element]
+        limit_reached = 0
+
+        # User-dependent tags
+        while True:
+            (tag, offset) = self._readToken(offset)
+
+            # TEXT <size> <text>
+            if tag == 'TEXT':
+                (token, offset) = self._readToken(offset)
+                try:
+                    size = int(token)
+                except (TypeError, ValueError):
+                    return None
+
+                (element, offset) = self._skipPayload(offset, RecordedDataReader.ELEMENT_TEXT, size, 0, 0)
+
+            # IMAGERGB <width>x<height> <binary data>
+            elif tag == 'IMAGERGB':
+                (element, offset) = self._scanImage(offset, RecordedDataReader.ELEMENT_RGB, 3)
+
+            # IMAGEGRAY <width>x<height> <binary data>
+            elif tag == 'IMAGEGRAY':
+                (element, offset) = self._scanImage(offset, RecordedDataReader.ELEMENT_GRAY, 1)
+
+            # LIMIT_REACHED
+            elif tag == 'LIMIT_REACHED':
+                limit_reached = 1
+                continue
+
+            # END_FRAME
+            elif tag == 'END_FRAME':
+                return (frame_index, limit_reached, elements, offset)
+
+            else:
+                return None
+
+            if element is None:
+                return None
+
+            elements.append(element)
+
+    #---------------------------------------------------------------------------
+    # Returns the content of an element, as a memoryview on the file
+    #---------------------------------------------------------------------------
+    def content(self, element):
+        (element_type, offset, length, width, height) = element
+        return self.view[offset:offset + length]
+
+    #---------------------------------------------------------------------------
+    # Returns the content of an element, as a (read-only) buffer object on the
+    # file. Unlike memoryviews, those are accepted by numpy.frombuffer() on
+    # Python 2.
+    #---------------------------------------------------------------------------
+    def rawContent(self, element):
+        (element_type, offset, length, width, height) = element
+        return buffer(self.map, offset, length)
+
+    #---------------------------------------------------------------------------
+    # Build the description of a frame from its elements. The pixels of the
+    # images and the texts are memoryviews on the file.
+    #---------------------------------------------------------------------------
+    def makeFrame(self, frame_index, limit_reached, elements):
+        frame = {
+            'index':            frame_index,
+            'limit_reached':    (limit_reached != 0),
+            'user_data':        [],
+        }
+
+        for element in elements:
+            (element_type, offset, length, width, height) = element
+
+            if element_type == RecordedDataReader.ELEMENT_SRC_IMAGE:
+                frame['src_image'] = {
+                    'width':  width,
+                    'height': height,
+                    'pixels': self.content(element),
+                }
+
+            elif element_type == RecordedDataReader.ELEMENT_TEXT:
+                frame['user_data'].append({
+                    'type': 'text',
+                    'text': self.content(element),
+                })
+
+            else:
+                frame['user_data'].append({
+                    'type':   (element_type == RecordedDataReader.ELEMENT_RGB) and 'rgb' or 'gray',
+                    'width':  width,
+                    'height': height,
+                    'pixels': self.content(element),
+                })
+
+        return frame
+
+    #---------------------------------------------------------------------------
+    # Scan an image element (<width>x<height> <binary data>)
+    #---------------------------------------------------------------------------
+    def _scanImage(self, offset, element_type, nb_channels):
+        (token, offset) = self._readToken(offset)
+        if token is None:
+            return (None, offset)
+
+        try:
+            (width, height) = map(lambda x: int(x), token.split('x'))
+        except ValueError:
+            return (None, offset)
+
+        return self._skipPayload(offset, element_type, width * height * nb_channels, width, height)
+
+    #---------------------------------------------------------------------------
+    # Skip the binary payload of an element, and returns its description
+    #---------------------------------------------------------------------------
+    def _skipPayload(self, offset, element_type, length, width, height):
+        if offset + length > self.size:
+            return (None, offset)
+
+        return ((element_type, offset, length, width, height), offset + length)
+
+    #---------------------------------------------------------------------------
+    # Read the token starting at the given offset (delimited by a space or a
+    # newline). Returns the token and the offset following its delimiter.
+    #---------------------------------------------------------------------------
+    def _readToken(self, offset):
+        if self.map is None:
+            return (None, offset)
+
+        end = min(offset + RecordedDataReader.MAX_TOKEN_LENGTH, self.size)
+
+        delimiters = filter(lambda x: x != -1, [self.map.find(' ', offset, end),
+                                                self.map.find('\n', offset, end)])
+        if len(delimiters) == 0:
+            return (None, offset)
+
+        stop_offset = min(delimiters)
+
+        return (self.map[offset:stop_offset], stop_offset + 1)
+
+
+#-------------------------------------------------------------------------------
+# Index of the frames contained in a file of recorded debugging data
+#
+# The index stores the byte offsets of each frame and of the payload of each
+# of its elements, so a frame can be retrieved without parsing the previous
+# ones. It is saved in a compact binary 'sidecar' file next to the recorded
+# one.
+#-------------------------------------------------------------------------------
+class RecordedDataIndex(object):
+
+    # Constants
+    MAGIC           = 'MASHIDX2'
+    HEADER_FORMAT   = '<II'             # <nb_frames> <nb_elements>
+    FRAME_FORMAT    = '<iQQIIB'         # <index> <start> <end> <first_element> <nb_elements> <limit_reached>
+    ELEMENT_FORMAT  = '<cQIII'          # <type> <offset> <length> <width> <height> (no
+                                        # size for the texts)
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #---------------------------------------------------------------------------
+    def __init__(self):
+        self.frames   = []
+        self.elements = []
+
+    #---------------------------------------------------------------------------
+    # Returns the number of (complete) frames in the recorded file
+    #---------------------------------------------------------------------------
+    def nbFrames(self):
+        return len(self.frames)
+
+    #---------------------------------------------------------------------------
+    # Returns the elements of a frame, as a list of tuples
+    # (<type>, <offset>, <length>, <width>, <height>)
+    #---------------------------------------------------------------------------
+    def frameElements(self, position):
+        (index, start, end, first_element, nb_elements, limit_reached) = self.frames[position]
+        return self.elements[first_element:first_element + nb_elements]
+
+    #---------------------------------------------------------------------------
+    # Returns the name of the index file of a recorded file
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def filename(data_filename):
+        return data_filename + '.index'
+
+    #---------------------------------------------------------------------------
+    # Returns the index of a recorded file, building (and saving) it if needed
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def open(data_filename):
+        index_filename = RecordedDataIndex.filename(data_filename)
+
+        if os.path.exists(index_filename) and \
+           (os.path.getmtime(index_filename) >= os.path.getmtime(data_filename)):
+            index = RecordedDataIndex.load(index_filename)
+            if index is not None:
+                return index
+
+        index = RecordedDataIndex.build(data_filename)
+
+        try:
+            index.save(index_filename)
+        except (IOError, OSError):
+            pass
+
+        return index
+
+    #---------------------------------------------------------------------------
+    # Build the index of a recorded file
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def build(data_filename):
+        index = RecordedDataIndex()
+
+        reader = RecordedDataReader(data_filename)
+
+        try:
+            start = 0
+
+            while True:
+                result = reader.scanFrame(start)
+                if result is None:
+                    break
+
+                (frame_index, limit_reached, elements, end) = result
+
+                index.frames.append((frame_index, start, end, len(index.elements),
+                                     len(elements), limit_reached))
+                index.elements.extend(elements)
+
+                start = end
+        finally:
+            reader.close()
+
+        return index
+
+    #---------------------------------------------------------------------------
+    # Load an index file. Returns None if the file isn't valid.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def load(index_filename):
+        index_file = open(index_filename, 'rb')
+        content = index_file.read()
+        index_file.close()
+
+        if not(content.startswith(RecordedDataIndex.MAGIC)):
+            return None
+
+        offset = len(RecordedDataIndex.MAGIC)
+
+        header_size  = struct.calcsize(RecordedDataIndex.HEADER_FORMAT)
+        frame_size   = struct.calcsize(RecordedDataIndex.FRAME_FORMAT)
+        element_size = struct.calcsize(RecordedDataIndex.ELEMENT_FORMAT)
+
+        if len(content) < offset + header_size:
+            return None
+
+        (nb_frames, nb_elements) = struct.unpack_from(RecordedDataIndex.HEADER_FORMAT, content, offset)
+        offset += header_size
+
+        if len(content) != offset + nb_frames * frame_size + nb_elements * element_size:
+            return None
+
+        index = RecordedDataIndex()
+
+        for i in range(nb_frames):
+            index.frames.append(struct.unpack_from(RecordedDataIndex.FRAME_FORMAT, content, offset))
+            offset += frame_size
+
+        for i in range(nb_elements):
+            index.elements.append(struct.unpack_from(RecordedDataIndex.ELEMENT_FORMAT, content, offset))
+            offset += element_size
+
+        return index
+
+    #---------------------------------------------------------------------------
+    # Save the index in a file
+    #---------------------------------------------------------------------------
+    def save(self, index_filename):
+        parts = [RecordedDataIndex.MAGIC,
+                 struct.pack(RecordedDataIndex.HEADER_FORMAT, len(self.frames), len(self.elements))]
+
+        parts.extend(map(lambda x: struct.pack(RecordedDataIndex.FRAME_FORMAT, *x), self.frames))
+        parts.extend(map(lambda x: struct.pack(RecordedDataIndex.ELEMENT_FORMAT, *x), self.elements))
+
+        # Write in a temporary file first, so a concurrent reader never sees
+        # an incomplete index (the index might be built by the scheduler and
+        # the website at the same time)
+        temp_filename = '%s.%d.%d.tmp' % (index_filename, os.getpid(), thread.get_ident())
+
+        index_file = open(temp_filename, 'wb')
+        index_file.write(''.join(parts))
+        index_file.close()
+
+        os.rename(temp_filename, index_filename)
+
+    #---------------------------------------------------------------------------
+    # Read a frame from a recorded file, using its index (see
+    # RecordedDataReader.makeFrame())
+    #
+    # @param reader     Reader of the recorded file
+    # @param position   Position of the frame in the file
+    #---------------------------------------------------------------------------
+    def readFrame(self, reader, position):
+        (index, start, end, first_element, nb_elements, limit_reached) = self.frames[position]
+
+        if end > reader.size:
+            return None
+
+        return reader.makeFrame(index, limit_reached, self.frameElements(position))
+
+
+#-------------------------------------------------------------------------------
+# Encode the pixels of an image (as found in a recorded file) in the PNG format
+#
+# @param pixels         The pixels (8 bits per channel, no padding between the
+#                       rows)
+# @param width          Width of the image
+# @param height         Height of the image
+# @param nb_channels    Number of channels (3 for RGB, 1 for grayscale)
+#-------------------------------------------------------------------------------
+def encodePNG(pixels, width, height, nb_channels):
+
+    def _chunk(chunk_type, data):
+        return struct.pack('!I', len(data)) + chunk_type + data + \
+               struct.pack('!I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+
+    stride = width * nb_channels
+
+    # Each row is preceded by the type of its filter: with NumPy, the 'Sub'
+    # filter (difference with the previous pixel of the row) is used, since
+    # it compresses much better; otherwise the rows are left unfiltered
+    if numpy is not None:
+        rows = numpy.frombuffer(pixels, dtype=numpy.uint8, count=stride * height).reshape(height, stride)
+
+        filtered = numpy.empty((height, stride + 1), dtype=numpy.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:nb_channels + 1] = rows[:, :nb_channels]
+        filtered[:, nb_channels + 1:] = rows[:, nb_channels:] - rows[:, :-nb_channels]
+
+        data = filtered.tostring()
+    else:
+        data = ''.join(map(lambda x: '\x00' + pixels[x * stride:(x + 1) * stride], range(height)))
+
+    if nb_channels == 3:
+        color_type = 2
+    else:
+        color_type = 0
+
+    return '\x89PNG\r\n\x1a\n' + \
+           _chunk('IHDR', struct.pack('!IIBBBBB', width, height, 8, color_type, 0, 0, 0)) + \
+           _chunk('IDAT', zlib.compress(data, 6)) + \
+           _chunk('IEND', '')
@@ -29,7 +29,9 @@ from pymash.networkutils import NetworkUtils
 from pymash.communication_channel import CommunicationChannel
 from pymash.outstream import OutStream
 from pymash.messages import Message
+from pymash.receive_buffer import ReceiveBuffer
 from threading import Thread
+import Queue
 import socket
 import os
 import sys
@@ -56,6 +58,9 @@ class ServerListener(Thread):
     ACTION_CLOSE_CONNECTION = 1     # Close the connection with the client
     ACTION_SLEEP            = 2     # The server must go to sleep
 
+    # Indicates if the clients can switch the connection to framed mode
+    SUPPORTS_FRAMED_MODE    = True
+
 
     #---------------------------------------------------------------------------
     # Constructor
@@ -66,7 +71,8 @@ class ServerListener(Thread):
         self.socket     = socket
         self.channel    = channel
         self.outStream  = OutStream()
-        self.buffer     = ''
+        self.buffer     = ReceiveBuffer()
+        self.framed     = False
         self.identifier = socket.fileno()
 
 
@@ -76,7 +82,8 @@ class ServerListener(Thread):
     def run(self):
         while (True):
             try:
-                (command, self.buffer) = NetworkUtils.waitMessage(self.socket, self.buffer, self.channel)
+                (command, self.buffer) = NetworkUtils.waitMessage(self.socket, self.buffer, self.channel,
+                                                                  framed=self.framed)
             except socket.error:
                 command = None
                 if self.outStream is not None:
@@ -91,9 +98,7 @@ class ServerListener(Thread):
             if command is None:
                 break
 
-            self.outStream.write("< %s\n" % command.toString())
-
-            action = self.handleCommand(command)
+            action = self.processCommand(command)
 
             if action == ServerListener.ACTION_SLEEP:
                 self.channel.sendMessage(Message('SLEEP', [self.identifier]))
@@ -114,10 +119,33 @@ class ServerListener(Thread):
             return False
 
 
+    #---------------------------------------------------------------------------
+    # Process a command received from the client (the commands related to the
+    # connection itself are handled here, the other ones by 'handleCommand()')
+    #
+    # @param command    The command
+    # @return           The action to perform
+    #---------------------------------------------------------------------------
+    def processCommand(self, command):
+        self.outStream.write("< %s\n" % command.toString())
+
+        if (command.name == NetworkUtils.FRAMED_MODE_COMMAND) and self.SUPPORTS_FRAMED_MODE:
+            if not(self.sendResponse('OK')):
+                return ServerListener.ACTION_CLOSE_CONNECTION
+
+            self.framed = True
+            return ServerListener.ACTION_NONE
+
+        return self.handleCommand(command)
+
+
     #---------------------------------------------------------------------------
     # Wait for data from the client
+    #
+    # If 'copy' is False, the data is returned as a view on the internal buffer
+    # of the listener, only valid until the next read
     #---------------------------------------------------------------------------
-    def waitData(self, size):
+    def waitData(self, size, copy=True):
         try:
             (data, self.buffer) = NetworkUtils.waitData(self.socket, self.buffer, size)
         except socket.error:
@@ -133,6 +161,9 @@ class ServerListener(Thread):
         if self.outStream is not None:
             self.outStream.write("< <%d bytes of data>\n" % size)
 
+        if copy:
+            return data.tobytes()
+
         return data
 
 
@@ -146,7 +177,7 @@ class ServerListener(Thread):
         self.outStream.write("> %s\n" % response.toString())
 
         try:
-            result = NetworkUtils.sendMessage(self.socket, response)
+            result = NetworkUtils.sendMessage(self.socket, response, framed=self.framed)
         except socket.error:
             result = False
             if self.outStream is not None:
@@ -234,8 +265,9 @@ class Server:
         self.host           = None
         self.port           = None
         self.serversocket   = None
-        self.listeners      = []
+        self.listeners      = {}
         self.clientsCounter = 0
+        self.nextIdentifier = 0
 
         (self.listener_channel, self.server_channel) = \
                 CommunicationChannel.create(CommunicationChannel.CHANNEL_TYPE_FULL_DUPLEX)
@@ -353,6 +385,9 @@ class Server:
             if message is None:
                 break
 
+            if self.onListenerMessage(message):
+                continue
+
             if message.name == 'SLEEP':
                 self.outStream.write("Going to sleep...\n")
                 self.state = Server.STATE_GOING_TO_SLEEP
@@ -360,7 +395,8 @@ class Server:
             done_listeners.append(message.parameters[0])
 
         nbListeners = len(self.listeners)
-        self.listeners = filter(lambda x: x.identifier not in done_listeners, self.listeners)
+        for identifier in done_listeners:
+            self.listeners.pop(identifier, None)
 
         if len(self.listeners) != nbListeners:
             diff = nbListeners - len(self.listeners)
@@ -404,14 +440,19 @@ class Server:
                 else:
                     self.outStream.write("The server is available (%d client(s) connected)\n" % len(self.listeners))
 
-                # Create a new thread to handle the connection
+                # Create a new listener to handle the connection
                 if (self.state == Server.STATE_NORMAL) and not(busy):
                     listener = listenerClass(clientsocket, self.listener_channel)
                 else:
                     listener = BusyListener(clientsocket, self.listener_channel, listenerClass)
 
-                listener.start()
-                self.listeners.append(listener)
+                # The file descriptor of the socket can be reused as soon as
+                # it is closed, so we use our own identifiers
+                listener.identifier = self.nextIdentifier
+                self.nextIdentifier += 1
+
+                self.listeners[listener.identifier] = listener
+                self.startListener(listener)
 
                 self.clientsCounter += 1
             except socket.error:
@@ -444,12 +485,269 @@ class Server:
         return True
 
 
+    #---------------------------------------------------------------------------
+    # Start to handle the requests of a new client (in its own thread)
+    #---------------------------------------------------------------------------
+    def startListener(self, listener):
+        listener.start()
+
+
+    #---------------------------------------------------------------------------
+    # Called for each message sent by the listeners through the communication
+    # channel
+    #
+    # @return   'True' if the message was handled, 'False' if the default
+    #           processing (for 'DONE' and 'SLEEP') must be done
+    #---------------------------------------------------------------------------
+    def onListenerMessage(self, message):
+        return False
+
+
     def terminateListeners(self):
-        for listener in self.listeners:
+        for listener in self.listeners.values():
             if listener.stop():
                 listener.join()
 
-        self.listeners = []
+        self.listeners = {}
+
+
+#-------------------------------------------------------------------------------
+# Represents a server handling all its clients from one event loop
+#
+# Instead of creating one thread per client, the server waits for the data sent
+# by all the clients at once (using epoll when available, poll otherwise). When
+# a complete command was received from a client, its listener is handed to a
+# bounded pool of worker threads, which calls 'handleCommand()'. The socket of
+# the client isn't watched by the event loop until the command is handled, so
+# the blocking methods of the listener ('waitData()', ...) can still be used
+# in 'handleCommand()'.
+#
+# The listeners are the same than the ones used by the Server class, but their
+# threads are never started.
+#-------------------------------------------------------------------------------
+class EventLoopServer(Server):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #---------------------------------------------------------------------------
+    def __init__(self, nbMaxClients=0, name='Server', logLimit=100, logFolder='logs',
+                 nbWorkers=8):
+        Server.__init__(self, nbMaxClients=nbMaxClients, name=name, logLimit=logLimit,
+                        logFolder=logFolder)
+
+        self.nbWorkers   = nbWorkers
+        self.workers     = []
+        self.queue       = Queue.Queue()
+        self.poller      = None
+        self.connections = {}   # Identifier -> listener, for all the clients
+        self.descriptors = {}   # File descriptor -> listener, for the clients
+                                # whose socket is watched by the event loop
+
+
+    #---------------------------------------------------------------------------
+    # Listen for incoming connections and handle them (blocking call)
+    #---------------------------------------------------------------------------
+    def run(self, host, port, listenerClass):
+
+        if not (self.listen(host, port)):
+            return False
+
+        # Install the TERM signal handler
+        try:
+            signal.signal(signal.SIGTERM, term_signal_handler)
+        except ValueError:
+            # Happens when not in the main thread
+            pass
+
+        self.controlPipe = os.pipe()
+
+        if hasattr(select, 'epoll'):
+            self.poller = select.epoll()
+        else:
+            self.poller = select.poll()
+
+        server_descriptors = {
+            self.serversocket.fileno(): self.serversocket,
+            self.server_channel.readPipe: self.server_channel.readPipe,
+            self.controlPipe[0]: self.controlPipe[0],
+        }
+
+        for descriptor in server_descriptors.keys():
+            self.poller.register(descriptor, select.POLLIN)
+
+        for i in range(self.nbWorkers):
+            worker = Thread(target=self.processRequests)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+        try:
+            while True:
+                ready_to_read = []
+
+                for (descriptor, event) in self.poller.poll():
+                    if descriptor in server_descriptors:
+                        ready_to_read.append(server_descriptors[descriptor])
+                    elif descriptor in self.descriptors:
+                        self.receive(self.descriptors[descriptor])
+
+                if (len(ready_to_read) > 0) and not(self.processEvents(ready_to_read, listenerClass)):
+                    break
+
+        except KeyboardInterrupt:
+            self.shutdown()
+            raise
+
+        self.shutdown()
+
+        return True
+
+
+    #---------------------------------------------------------------------------
+    # Start to handle the requests of a new client (by watching its socket)
+    #---------------------------------------------------------------------------
+    def startListener(self, listener):
+        self.connections[listener.identifier] = listener
+        self.watch(listener)
+
+
+    #---------------------------------------------------------------------------
+    # Called for each message sent by the listeners through the communication
+    # channel
+    #---------------------------------------------------------------------------
+    def onListenerMessage(self, message):
+
+        # A worker is done with the commands received from the client
+        if message.name == 'RESUME':
+            listener = self.connections.get(message.parameters[0])
+            if listener is not None:
+                if NetworkUtils.hasMessage(listener.buffer, framed=listener.framed):
+                    self.queue.put(listener)
+                else:
+                    self.watch(listener)
+            return True
+
+        if message.name == 'DONE':
+            self.connections.pop(message.parameters[0], None)
+
+        return False
+
+
+    def terminateListeners(self):
+        # Closing the sockets interrupts the workers waiting for some data
+        for listener in self.connections.values():
+            listener.stop()
+
+        for worker in self.workers:
+            self.queue.put(None)
+
+        for worker in self.workers:
+            worker.join()
+
+        self.workers     = []
+        self.connections = {}
+        self.descriptors = {}
+        self.listeners   = {}
+
+
+    #---------------------------------------------------------------------------
+    # Watch the socket of a client in the event loop
+    #---------------------------------------------------------------------------
+    def watch(self, listener):
+        descriptor = listener.socket.fileno()
+        self.descriptors[descriptor] = listener
+        self.poller.register(descriptor, select.POLLIN)
+
+
+    #---------------------------------------------------------------------------
+    # Stop to watch the socket of a client in the event loop
+    #---------------------------------------------------------------------------
+    def unwatch(self, listener):
+        descriptor = listener.socket.fileno()
+        del self.descriptors[descriptor]
+        self.poller.unregister(descriptor)
+
+
+    #---------------------------------------------------------------------------
+    # Receive the data available on the socket of a client, and hand the
+    # listener to the workers if a complete command was received
+    #---------------------------------------------------------------------------
+    def receive(self, listener):
+        try:
+            nb = listener.buffer.receive(listener.socket)
+        except socket.error:
+            nb = 0
+
+        if nb <= 0:
+            self.unwatch(listener)
+            self.closeConnection(listener)
+            return
+
+        if NetworkUtils.hasMessage(listener.buffer, framed=listener.framed):
+            self.unwatch(listener)
+            self.queue.put(listener)
+
+
+    #---------------------------------------------------------------------------
+    # Close the connection with a client (its socket must not be watched
+    # anymore)
+    #---------------------------------------------------------------------------
+    def closeConnection(self, listener):
+        listener.socket.close()
+        listener.outStream.delete()
+        listener.channel.sendMessage(Message('DONE', [listener.identifier]))
+
+
+    #---------------------------------------------------------------------------
+    # Main method of the worker threads
+    #---------------------------------------------------------------------------
+    def processRequests(self):
+        while True:
+            listener = self.queue.get()
+            if listener is None:
+                break
+
+            self.processCommands(listener)
+
+
+    #---------------------------------------------------------------------------
+    # Handle all the complete commands received from a client (called by a
+    # worker thread)
+    #---------------------------------------------------------------------------
+    def processCommands(self, listener):
+        while True:
+            try:
+                command = NetworkUtils.extractMessage(listener.buffer, framed=listener.framed)
+                if command is None:
+                    listener.channel.sendMessage(Message('RESUME', [listener.identifier]))
+                    return
+
+                action = listener.processCommand(command)
+            except:
+                listener.outStream.write("ERROR: Failed to handle a command, reason: %s\n" % traceback.format_exc())
+                action = ServerListener.ACTION_CLOSE_CONNECTION
+
+            if action == ServerListener.ACTION_SLEEP:
+                listener.channel.sendMessage(Message('SLEEP', [listener.identifier]))
+            elif action != ServerListener.ACTION_NONE:
+                break
+
+        self.closeConnection(listener)
+
+
+    #---------------------------------------------------------------------------
+    # Release all the resources used by the server
+    #---------------------------------------------------------------------------
+    def shutdown(self):
+        self.serversocket.close()
+        self.terminateListeners()
+
+        if hasattr(self.poller, 'close'):
+            self.poller.close()
+        self.poller = None
+
+        os.close(self.controlPipe[0])
+        os.close(self.controlPipe[1])
 
 
 #-------------------------------------------------------------------------------
@@ -458,14 +756,21 @@ class Server:
 class ThreadedServer(Thread):
 
     def __init__ (self, hostname, port, listenerClass, nbMaxClients=0,
-                  name='Server', logLimit=100, logFolder='logs'):
+                  name='Server', logLimit=100, logFolder='logs',
+                  eventLoop=False, nbWorkers=8):
        Thread.__init__(self)
        self.deamon = True
        self.hostname = hostname
        self.port = port
        self.listenerClass = listenerClass
-       self.server = Server(nbMaxClients=nbMaxClients, name=name,
-                            logLimit=logLimit, logFolder=logFolder)
+
+       if eventLoop:
+           self.server = EventLoopServer(nbMaxClients=nbMaxClients, name=name,
+                                         logLimit=logLimit, logFolder=logFolder,
+                                         nbWorkers=nbWorkers)
+       else:
+           self.server = Server(nbMaxClients=nbMaxClients, name=name,
+                                logLimit=logLimit, logFolder=logFolder)
 
     def run(self):
         self.server.run(self.hostname, self.port, self.listenerClass)
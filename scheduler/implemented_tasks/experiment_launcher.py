@@ -28,8 +28,9 @@ from tasks.jobs import Job
 from tasks.jobs import JobList
 from utilities.logs import getServerLogs
 from utilities.io import generateUniqueFolderName
-from pymash import Client
+from utilities.db_executor import bulkInsert
 from pymash import Message
+from pymash import ActionsCache
 from django.conf import settings
 from django.template import defaultfilters
 from django.core.files import locks
@@ -41,7 +42,6 @@ from heuristics.models import HeuristicEvaluationStep
 from experiments.models import Experiment
 from experiments.models import Configuration
 from experiments.models import Setting
-from experiments.models import Notification
 from experiments.models import ClassificationResults
 from experiments.models import GoalPlanningResult,GoalPlanningRound
 from instruments.models import Instrument
@@ -51,6 +51,7 @@ from goalplanners.models import Goalplanner
 from tools.models import PluginErrorReport
 from mash.tasks.models import Task as DBTask
 from datetime import datetime
+from collections import OrderedDict
 import os
 import time
 import tarfile
@@ -67,6 +68,39 @@ class Section(object):
         self.next_operation     = None
 
 
+#-------------------------------------------------------------------------------
+# Holds the state of an evaluation experiment whose seeds are shared between
+# several jobs (each one using its own Experiment Server)
+#
+# The first job of the experiment (the parent) creates the other ones (the
+# shards). Each job takes the next seed not started yet when it is ready to
+# perform a round, until there isn't any left. The parent waits for all the
+# jobs to be done, and their results to be saved, to finalize the experiment.
+#-------------------------------------------------------------------------------
+class EvaluationShards(object):
+
+    def __init__(self, parent, nb_seeds):
+        self.parent     = parent
+        self.remaining  = range(nb_seeds)   # Indices of the seeds not started yet
+        self.running    = set()             # Jobs performing a round
+        self.flushing   = 0                 # Number of jobs whose results are
+                                            # being saved
+        self.failed     = False
+        self.finished   = False
+
+    #---------------------------------------------------------------------------
+    # Returns the index of the next seed to be used by a job, or None if there
+    # isn't any left (the job isn't considered running anymore)
+    #---------------------------------------------------------------------------
+    def nextSeed(self, job):
+        if len(self.remaining) == 0:
+            self.running.discard(job)
+            return None
+
+        self.running.add(job)
+        return self.remaining.pop(0)
+
+
 #-------------------------------------------------------------------------------
 # The class of the jobs of the 'ExperimentLauncher' task
 #-------------------------------------------------------------------------------
@@ -81,6 +115,32 @@ class ExperimentLauncherJob(Job):
         self.seeds                       = None
         self.current_section             = None
         self.instruments_to_send         = None
+        self.evaluation_steps            = OrderedDict()    # Steps not saved yet (seed -> step)
+        self.goalplanning_rounds         = []               # Rounds not saved yet
+        self.goalplanning_summary        = None             # Only used by the database operations
+        self.evaluation                  = None             # See EvaluationShards
+        self.parent                      = None             # The parent job (for the shards)
+        self.pipelined_setup             = False            # See ExperimentLauncher.sendPipelined()
+        self.pending_responses           = None             # Errors related to the commands
+                                                            # waiting for a response
+        self.pipeline_next               = None             # Operation once all the responses
+                                                            # are received
+        self.pipeline_failure            = None             # (error, response) of the first
+                                                            # command that failed
+        self.data_report_filename        = None             # Name of the received data report
+
+    #---------------------------------------------------------------------------
+    # Save the job and the status of its experiment in the database (the shards
+    # of an evaluation don't modify the experiment, only their parent does)
+    #---------------------------------------------------------------------------
+    def _saveState(self, experiment_status, clearNotifications=False):
+        if self.parent is None:
+            super(ExperimentLauncherJob, self)._saveState(experiment_status, clearNotifications)
+            return
+
+        self.notifications = OrderedDict()
+        self.notifications_deadline = None
+        self.persist(self.server_job.save)
 
 
 
@@ -94,6 +154,17 @@ class ExperimentLauncher(Task):
                          }
     SUPPORTED_EVENTS   = {}
 
+    # Constants
+    GOALPLANNING_ROUNDS_BATCH = 100     # Number of goal-planning rounds saved at once
+    EVALUATION_STEPS_BATCH = 100        # Number of evaluation steps saved at once
+    SHARD_COMMAND = 'RUN_EVALUATION_SHARD'  # Command of the shards of the evaluations
+                                            # (never received from the clients)
+    INTERNAL_COMMANDS = { SHARD_COMMAND: 'RUN_EXPERIMENT' }    # The shards are restarted
+                                                                # with their parent
+    PIPELINED_SETUP_COMMAND = 'USE_PIPELINED_SETUP' # Command used to ask the Experiment
+                                                    # Server if it supports the pipelined
+                                                    # setup (see sendPipelined())
+
 
     #---------------------------------------------------------------------------
     # Constructor
@@ -103,6 +174,16 @@ class ExperimentLauncher(Task):
         self.jobs = JobList(jobs_class=ExperimentLauncherJob)
 
 
+    #---------------------------------------------------------------------------
+    # Stop the task
+    #---------------------------------------------------------------------------
+    def stop(self):
+        for job in self.jobs.getJobs(status=ServerJob.STATUS_RUNNING):
+            self.flushResults(job)
+
+        super(ExperimentLauncher, self).stop()
+
+
     #---------------------------------------------------------------------------
     # Starts the job-specific processing
     #
@@ -117,10 +198,17 @@ class ExperimentLauncher(Task):
             self.processError(job, 'Unknown experiment ID: %d' % job.command.parameters[0])
             return
 
+        # A shard is useless if the other jobs already took all the seeds
+        if job.command.name == ExperimentLauncher.SHARD_COMMAND:
+            if (job.evaluation is None) or job.evaluation.finished or (len(job.evaluation.remaining) == 0):
+                job.outStream.write("No seed left to evaluate\n")
+                job.markAsDone()
+                return
+
         job.markAsRunning(experiment=experiment)
 
         # Job-specific processing
-        if job.command.name == 'RUN_EXPERIMENT':
+        if job.command.name in ('RUN_EXPERIMENT', ExperimentLauncher.SHARD_COMMAND):
 
             # Task-dependent processing
             if (experiment.configuration.task.type == DBTask.TYPE_CLASSIFICATION) or \
@@ -165,6 +253,15 @@ class ExperimentLauncher(Task):
             job_to_cancel.markAsCancelled()
             self.jobs.removeJobs([job_to_cancel])
 
+            if job_to_cancel.evaluation is not None:
+                job_to_cancel.evaluation.finished = True
+
+            # Cancel the shards of the experiment (if any)
+            shards = self.jobs.getJobs(command=Message(ExperimentLauncher.SHARD_COMMAND, [experiment_id]))
+            for shard in shards:
+                shard.markAsCancelled()
+            self.jobs.removeJobs(shards)
+
             # Send an event about the cancelling of the experiment
             self.channel.sendMessage(Message('EVT_EXPERIMENT_CANCELLED', [experiment_id]))
 
@@ -187,23 +284,14 @@ class ExperimentLauncher(Task):
 
         servers = Server.objects.filter(server_type=Server.APPLICATION_SERVER, subtype=Server.SUBTYPE_IMAGES,
                                         provided_databases__name__in=[db_name])
-        job.application_server = None
-        for server in servers:
-            job.outStream.write("    Contacting '%s:%d'...\n" % (server.address, server.port))
-
-            client = Client()
-            if client.connect(server.address, server.port):
-                client.sendCommand('STATUS')
-                response = client.waitResponse()
-                if response.name == 'READY':
-                    job.outStream.write("    Image Server found\n")
-                    job.application_server = server
-
-            client.close()
-            del client
 
-            if job.application_server is not None:
-                break
+        # Note: the connections aren't kept in the connection pool, since the
+        # Experiment Server must be able to connect to the Application Server
+        job.application_server = None
+        for (server, client) in self.connection_pool.probe(servers, outStream=job.outStream, first=True):
+            job.outStream.write("    Image Server found\n")
+            job.application_server = server
+            self.connection_pool.discard(client)
 
         if job.application_server is None:
             job.outStream.write("Failed to find a free Image Server providing the database '%s'\n" % db_name)
@@ -215,9 +303,10 @@ class ExperimentLauncher(Task):
             return
 
         # Store the date/time of the start of the experiment
-        job.server_job.experiment.start = datetime.now()
-        job.server_job.experiment.end = None
-        job.server_job.experiment.save()
+        if job.parent is None:
+            job.server_job.experiment.start = datetime.now()
+            job.server_job.experiment.end = None
+            job.server_job.experiment.save()
 
         # Tell the Experiment Server about the type of experiment
         if job.server_job.experiment.configuration.task.type == DBTask.TYPE_CLASSIFICATION:
@@ -254,23 +343,14 @@ class ExperimentLauncher(Task):
         servers = Server.objects.filter(server_type=Server.APPLICATION_SERVER, subtype=Server.SUBTYPE_INTERACTIVE,
                                         provided_goals__name__in=[goal_name],
                                         provided_goals__environments__name__in=[environment_name])
-        job.application_server = None
-        for server in servers:
-            job.outStream.write("    Contacting '%s:%d'...\n" % (server.address, server.port))
-
-            client = Client()
-            if client.connect(server.address, server.port):
-                client.sendCommand('STATUS')
-                response = client.waitResponse()
-                if response.name == 'READY':
-                    job.outStream.write("    Interactive Application Server found\n")
-                    job.application_server = server
 
-            client.close()
-            del client
-
-            if job.application_server is not None:
-                break
+        # Note: the connections aren't kept in the connection pool, since the
+        # Experiment Server must be able to connect to the Application Server
+        job.application_server = None
+        for (server, client) in self.connection_pool.probe(servers, outStream=job.outStream, first=True):
+            job.outStream.write("    Interactive Application Server found\n")
+            job.application_server = server
+            self.connection_pool.discard(client)
 
         if job.application_server is None:
             job.outStream.write("Failed to find a free Interactive Application providing " \
@@ -336,6 +416,20 @@ class ExperimentLauncher(Task):
 
         # Tell the Experiment Server about the global seed to use
         if job.server_job.experiment.configuration.experiment_type == Configuration.EVALUATION:
+
+            # The seeds of an evaluation are shared with other jobs (if there
+            # are other Experiment Servers available)
+            if job.evaluation is None:
+                self.shardEvaluation(job)
+
+            if job not in job.evaluation.running:
+                index = job.evaluation.nextSeed(job)
+                if index is None:
+                    self.leaveEvaluation(job)
+                    return
+
+                job.nb_evaluation_rounds_done = index
+
             seed = job.seeds[job.nb_evaluation_rounds_done]
         else:
             seed = job.seeds[0]
@@ -363,6 +457,28 @@ class ExperimentLauncher(Task):
         section.settings_to_send = map(lambda x: (x.name[len(section.name) + 1:], x.value),
                                        Setting.objects.filter(configuration=job.server_job.experiment.configuration,
                                                               name__startswith=section.name + '/'))
+
+        # Pipelined setup: send the section and all the instruments at once
+        if job.pipelined_setup:
+            commands = self.sectionCommands(job, section)
+
+            for instrument in self.listInstruments(job):
+                section_full_name = 'INSTRUMENT_SETUP/%s/' % instrument.fullname()
+
+                instrument_section                  = Section()
+                instrument_section.name             = 'INSTRUMENT_SETUP'
+                instrument_section.parameters       = [instrument.fullname()]
+                instrument_section.settings_to_send = map(lambda x: (x.name[len(section_full_name):], x.value),
+                                                          Setting.objects.filter(configuration=job.server_job.experiment.configuration,
+                                                                                 name__startswith=section_full_name))
+
+                commands.append((Message('USE_INSTRUMENT', [instrument.fullname()]),
+                                 "Failed to select the instrument '%s'" % instrument.fullname()))
+                commands.extend(self.sectionCommands(job, instrument_section))
+
+            self.sendPipelined(job, commands, ExperimentLauncher.sendPredictorModel)
+            return
+
         job.current_section = section
 
         self.sendSection(job, first=True)
@@ -378,9 +494,7 @@ class ExperimentLauncher(Task):
             return
 
         # Setup the job
-        job.instruments_to_send = list(Instrument.objects.filter(configuration=job.server_job.experiment.configuration).exclude(
-                                                                 status=Instrument.DISABLED).exclude(
-                                                                 status=Instrument.BUILTIN))
+        job.instruments_to_send = self.listInstruments(job)
         job.current_section = None
 
         if len(job.instruments_to_send) > 0:
@@ -538,6 +652,24 @@ class ExperimentLauncher(Task):
         section.settings_to_send = map(lambda x: (x.name[len(section.name) + 1:], x.value),
                                        Setting.objects.filter(configuration=job.server_job.experiment.configuration,
                                                               name__startswith=section.name + '/'))
+
+        # Pipelined setup: send the section, the repository and the whole list
+        # of heuristics at once
+        if job.pipelined_setup:
+            heuristics = self.listHeuristics(job)
+            if len(heuristics) == 0:
+                self.processError(job, 'No enabled heuristic version available')
+                return
+
+            commands = self.sectionCommands(job, section)
+            commands.append((Message('USE_HEURISTICS_REPOSITORY', [settings.REPOSITORY_HEURISTICS_URL]),
+                             "Failed to send the URL of the repository of heuristics"))
+            commands.append((Message('USE_HEURISTICS', map(lambda x: x.fullname(), heuristics)),
+                             "Failed to send the list of heuristics"))
+
+            self.sendPipelined(job, commands, ExperimentLauncher.trainPredictor)
+            return
+
         job.current_section = section
 
         self.sendSection(job, first=True)
@@ -573,8 +705,7 @@ class ExperimentLauncher(Task):
             return
 
         # Setup the job
-        job.heuristics_to_send = list(job.server_job.experiment.configuration.heuristics_set.filter(
-                                                                        status=HeuristicVersion.STATUS_OK))
+        job.heuristics_to_send = self.listHeuristics(job)
         job.current_section = None
 
         if len(job.heuristics_to_send) > 0:
@@ -610,11 +741,12 @@ class ExperimentLauncher(Task):
     #---------------------------------------------------------------------------
     # Ask the predictor to train itself
     #---------------------------------------------------------------------------
-    def trainPredictor(self, job):
-        response = job.client.waitResponse()
-        if response.name != 'OK':
-            self.processError(job, "Failed to send the list of heuristics", response)
-            return
+    def trainPredictor(self, job, no_waiting=False):
+        if not(no_waiting):
+            response = job.client.waitResponse()
+            if response.name != 'OK':
+                self.processError(job, "Failed to send the list of heuristics", response)
+                return
 
         if not(job.client.sendCommand(Message('TRAIN_PREDICTOR'))):
             self.processError(job, "Failed to tell the predictor to train itself")
@@ -646,27 +778,7 @@ class ExperimentLauncher(Task):
             return
 
         # Save the results
-        if job.server_job.experiment.configuration.experiment_type != Configuration.EVALUATION:
-            try:
-                results = job.server_job.experiment.classification_results
-            except:
-                results = ClassificationResults()
-                results.experiment = job.server_job.experiment
-
-            results.train_error = float(response.parameters[0])
-            results.save()
-        else:
-            evaluation_results = job.server_job.experiment.evaluation_results
-
-            try:
-                step = evaluation_results.steps.get(seed=job.seeds[job.nb_evaluation_rounds_done])
-            except:
-                step = HeuristicEvaluationStep()
-                step.evaluation_results = evaluation_results
-                step.seed = job.seeds[job.nb_evaluation_rounds_done]
-
-            step.train_error = float(response.parameters[0])
-            step.save()
+        self.saveImageBasedResult(job, 'train_error', float(response.parameters[0]))
 
         # Test the predictor
         if not(job.client.sendCommand(Message('TEST_PREDICTOR'))):
@@ -695,27 +807,7 @@ class ExperimentLauncher(Task):
             return
 
         # Save the results
-        if job.server_job.experiment.configuration.experiment_type != Configuration.EVALUATION:
-            try:
-                results = job.server_job.experiment.classification_results
-            except:
-                results = ClassificationResults()
-                results.experiment = job.server_job.experiment
-
-            results.test_error = float(response.parameters[0])
-            results.save()
-        else:
-            evaluation_results = job.server_job.experiment.evaluation_results
-
-            try:
-                step = evaluation_results.steps.get(seed=job.seeds[job.nb_evaluation_rounds_done])
-            except:
-                step = HeuristicEvaluationStep()
-                step.evaluation_results = evaluation_results
-                step.seed = job.seeds[job.nb_evaluation_rounds_done]
-
-            step.test_error = float(response.parameters[0])
-            step.save()
+        self.saveImageBasedResult(job, 'test_error', float(response.parameters[0]))
 
         # Retrieve the data report, if necessary
         if (job.server_job.experiment.configuration.experiment_type != Configuration.EVALUATION) or \
@@ -730,6 +822,120 @@ class ExperimentLauncher(Task):
             self.finalizeExperiment(job)
 
 
+    #---------------------------------------------------------------------------
+    # Save a result of an image-based experiment (in the results of the
+    # experiment, or in the current step of an evaluation experiment)
+    #
+    # @param job    The job
+    # @param field  The name of the field ('train_error' or 'test_error')
+    # @param value  The value
+    #---------------------------------------------------------------------------
+    def saveImageBasedResult(self, job, field, value):
+        experiment = job.server_job.experiment
+
+        if experiment.configuration.experiment_type != Configuration.EVALUATION:
+            def save():
+                try:
+                    results = experiment.classification_results
+                except:
+                    results = ClassificationResults()
+                    results.experiment = experiment
+
+                setattr(results, field, value)
+                results.save()
+
+            job.persist(save)
+        else:
+            # The steps are kept in memory and saved in batch, once complete
+            # (see flushEvaluationSteps())
+            seed = job.seeds[job.nb_evaluation_rounds_done]
+
+            step = job.evaluation_steps.get(seed)
+            if step is None:
+                step = HeuristicEvaluationStep()
+                step.seed = seed
+                job.evaluation_steps[seed] = step
+
+            setattr(step, field, value)
+
+            if (field == 'test_error') and \
+               (len(job.evaluation_steps) >= ExperimentLauncher.EVALUATION_STEPS_BATCH):
+                self.flushEvaluationSteps(job)
+
+
+    #---------------------------------------------------------------------------
+    # Save the results of a job kept in memory
+    #---------------------------------------------------------------------------
+    def flushResults(self, job):
+        self.flushEvaluationSteps(job)
+        self.flushGoalPlanningRounds(job)
+
+
+    #---------------------------------------------------------------------------
+    # Save the steps of an evaluation experiment kept in memory (replacing the
+    # ones with the same seeds, saved by a previous attempt)
+    #---------------------------------------------------------------------------
+    def flushEvaluationSteps(self, job):
+        if len(job.evaluation_steps) == 0:
+            return
+
+        steps = job.evaluation_steps.values()
+        job.evaluation_steps = OrderedDict()
+
+        experiment = job.server_job.experiment
+
+        def save():
+            evaluation_results = experiment.evaluation_results
+            evaluation_results.steps.filter(seed__in=map(lambda x: x.seed, steps)).delete()
+
+            for step in steps:
+                step.evaluation_results = evaluation_results
+
+            bulkInsert(steps)
+
+        job.persist(save)
+
+
+    #---------------------------------------------------------------------------
+    # Save the rounds of a goal-planning experiment kept in memory
+    #---------------------------------------------------------------------------
+    def flushGoalPlanningRounds(self, job):
+        if len(job.goalplanning_rounds) == 0:
+            return
+
+        rounds = job.goalplanning_rounds
+        job.goalplanning_rounds = []
+
+        def save():
+            summary = self.getGoalPlanningSummary(job)
+
+            for goalplanning_round in rounds:
+                goalplanning_round.summary = summary
+
+            bulkInsert(rounds)
+
+        job.persist(save)
+
+
+    #---------------------------------------------------------------------------
+    # Returns the summary of the results of a goal-planning experiment (created
+    # if it doesn't exist yet), must be called from a database operation of the
+    # job
+    #---------------------------------------------------------------------------
+    def getGoalPlanningSummary(self, job):
+        if job.goalplanning_summary is None:
+            experiment = job.server_job.experiment
+
+            summaries = list(GoalPlanningResult.objects.filter(experiment=experiment)[:1])
+            if len(summaries) == 0:
+                job.goalplanning_summary = GoalPlanningResult(experiment=experiment)
+                job.goalplanning_summary.save()
+            else:
+                job.goalplanning_summary = summaries[0]
+
+        return job.goalplanning_summary
+
+
     #---------------------------------------------------------------------------
     # Process the training result of a goal-planning experiment
     #---------------------------------------------------------------------------
@@ -782,19 +988,12 @@ class ExperimentLauncher(Task):
             job.operation = ExperimentLauncher.processGoalPlanningTestResult
             return
 
-        #create a summary result if it doesn't exist yet for current experiment
-        validExperience = GoalPlanningResult.objects.filter(experiment=job.server_job.experiment)
-        if not validExperience:
-            GPsummary = GoalPlanningResult(experiment = job.server_job.experiment)
-            GPsummary.save()
-        else:
-            GPsummary = GoalPlanningResult.objects.get(experiment = job.server_job.experiment)
-
         #Get values
+        #(the rounds are kept in memory and saved in batch, see flushGoalPlanningRounds())
         #Process the rounds
         if response.name == 'TEST_ROUND':
             #create a GP round result
-            results = GoalPlanningRound(summary=GPsummary)
+            results = GoalPlanningRound()
             results.round = int(response.parameters[0])
 
             #process batch messages
@@ -818,7 +1017,9 @@ class ExperimentLauncher(Task):
                     results.nbNotRecommandedActions = int(response.parameters[0])
                 elif response.name == 'TEST_ROUND_END':
                     # Save round results
-                    results.save()
+                    job.goalplanning_rounds.append(results)
+                    if len(job.goalplanning_rounds) >= ExperimentLauncher.GOALPLANNING_ROUNDS_BATCH:
+                        self.flushGoalPlanningRounds(job)
                     job.operation = ExperimentLauncher.processGoalPlanningTestResult
                     return
                 else:
@@ -828,22 +1029,32 @@ class ExperimentLauncher(Task):
 
         #Process the summary and save in it
         elif response.name == 'TEST_SUMMARY':
+            values = {}
+
             #process batch messages
             while True:
                 response = job.client.waitResponse()
 
                 if response.name == 'NB_GOALS_REACHED':
-                    GPsummary.nbGoalsReached = int(response.parameters[0])
+                    values['nbGoalsReached'] = int(response.parameters[0])
                 elif response.name == 'NB_TASKS_FAILED':
-                    GPsummary.nbTasksFailed = int(response.parameters[0])
+                    values['nbTasksFailed'] = int(response.parameters[0])
                 elif response.name == 'NB_ACTIONS_DONE':
-                    GPsummary.nbActionsDone = int(response.parameters[0])
+                    values['nbActionsDone'] = int(response.parameters[0])
                 elif response.name == 'NB_MIMICKING_ERRORS':
-                    GPsummary.nbMimickingErrors = int(response.parameters[0])
+                    values['nbMimickingErrors'] = int(response.parameters[0])
                 elif response.name == 'NB_NOT_RECOMMENDED_ACTIONS':
-                    GPsummary.nbNotRecommandedActions = int(response.parameters[0])
+                    values['nbNotRecommandedActions'] = int(response.parameters[0])
                 elif response.name == 'TEST_SUMMARY_END':
-                    GPsummary.save()
+                    self.flushGoalPlanningRounds(job)
+
+                    def saveSummary():
+                        GPsummary = self.getGoalPlanningSummary(job)
+                        for (name, value) in values.items():
+                            setattr(GPsummary, name, value)
+                        GPsummary.save()
+
+                    job.persist(saveSummary)
                     break
                 else:
                     self.processError(job, "Failed to test the predictor", response)
@@ -898,32 +1109,51 @@ class ExperimentLauncher(Task):
 
         lock_file.close()
 
-        size = response.parameters[0]
-        max_size = 10 * 1024
-        while size > 0:
-            nb = min(size, max_size)
+        checksum = job.client.receiveToFile(outFile, response.parameters[0])
+        outFile.close()
 
-            data = job.client.waitData(nb)
-            if data is None:
-                outFile.close()
-                os.remove(fullpath)
-                self.finalizeExperiment(job)
-                return
+        if checksum is None:
+            os.remove(fullpath)
+            self.finalizeExperiment(job)
+            return
 
-            outFile.write(data)
+        job.outStream.write("Data report saved in '%s' (MD5: %s)\n" % (report_filename, checksum))
 
-            size -= nb
+        job.data_report_filename = report_filename
 
-        outFile.close()
+        experiment = job.server_job.experiment
+
+        def saveReport():
+            report                 = DataReport()
+            report.experiment      = experiment
+            report.filename        = report_filename
+            report.save()
+
+            report.instruments_set = list(Instrument.objects.filter(configuration=experiment.configuration).exclude(
+                                                                    status=Instrument.DISABLED))
+            report.save()
+
+        job.persist(saveReport)
 
-        report                 = DataReport()
-        report.experiment      = job.server_job.experiment
-        report.filename        = report_filename
-        report.save()
+        # Extract the actions performed during the sequences of the factory
+        # experiments once for all, so the website doesn't have to decompress
+        # the report each time it displays them. The report is decompressed by
+        # the worker threads, outside of the loop of the scheduler (the website
+        # builds the cache itself if it isn't there yet)
+        if experiment.configuration.experiment_type == Configuration.FACTORY:
+            errors = []
 
-        report.instruments_set = list(Instrument.objects.filter(configuration=job.server_job.experiment.configuration).exclude(
-                                                                status=Instrument.DISABLED))
-        report.save()
+            def buildActionsCache():
+                try:
+                    ActionsCache.build(fullpath)
+                except:
+                    errors.append(traceback.format_exc())
+
+            def reportActionsCacheErrors():
+                for error in errors:
+                    self.outStream.write("WARNING - Failed to cache the actions of '%s'\n%s\n" % (report_filename, error))
+
+            job.persist(buildActionsCache, reportActionsCacheErrors)
 
         self.finalizeExperiment(job)
 
@@ -935,26 +1165,57 @@ class ExperimentLauncher(Task):
         configuration = job.server_job.experiment.configuration
 
         job.server_job.logs = getServerLogs(job.client, job.server_job.logs, filter_list=['Predictor.log'])
-        job.server_job.save()
+        job.persist(job.server_job.save)
 
         # Evaluation experiment: determine if another experiment must be performed
+        # by this job
         if configuration.experiment_type == Configuration.EVALUATION:
-            job.nb_evaluation_rounds_done += 1
-            if job.nb_evaluation_rounds_done < len(job.seeds):
+            index = job.evaluation.nextSeed(job)
+            if index is not None:
+                job.nb_evaluation_rounds_done = index
                 if not(job.client.sendCommand(Message('RESET'))):
                     self.processError(job, "Failed to reset the Experiment Server")
                 else:
                     job.operation = ExperimentLauncher.sendGlobalSeed
                 return
 
+            self.flushResults(job)
+            self.leaveEvaluation(job)
+            return
+
+        self.flushResults(job)
+        self.completeExperiment(job)
+
+
+    #---------------------------------------------------------------------------
+    # Store the end of an experiment and mark its job as done
+    #---------------------------------------------------------------------------
+    def completeExperiment(self, job):
+        configuration = job.server_job.experiment.configuration
+
         # Base contest experiment: create the configuration of the contest, based on
         # the results of the base experiment
         if configuration.experiment_type == Configuration.CONTEST_BASE:
-            self.createContestConfiguration(job)
+            # Note: the configuration is created by a worker thread, which must not
+            # touch the job (modified by the loop meanwhile): it only receives the
+            # values it needs, and its log is written once it is done
+            report_filename = job.data_report_filename
+            log = []
+
+            def reportContestConfiguration():
+                self.outStream.write(''.join(log))
+
+            job.persist(lambda: self.createContestConfiguration(configuration, report_filename, log),
+                        reportContestConfiguration)
+
+        # Evaluation experiment: compute the statistics of the steps (all the
+        # steps are in the database at this point, see checkEvaluation())
+        elif configuration.experiment_type == Configuration.EVALUATION:
+            job.persist(lambda: job.server_job.experiment.evaluation_results.update_statistics())
 
         # Store the date/time of the end of the experiment
         job.server_job.experiment.end = datetime.now()
-        job.server_job.experiment.save()
+        job.persist(job.server_job.experiment.save)
 
         # The experiment is done
         if (configuration.experiment_type != Configuration.EVALUATION) and (job.nb_evaluation_rounds_done > 0):
@@ -962,7 +1223,150 @@ class ExperimentLauncher(Task):
         else:
             job.markAsDone()
 
-        # Send an event about the success of the experiment, if necessary
+        # Send an event about the success of the experiment, if necessary (once
+        # the results are in the database)
+        job.persist(callback=lambda: self.sendExperimentDoneEvent(job, configuration))
+
+
+    #---------------------------------------------------------------------------
+    # Share the seeds of an evaluation experiment between the job and new ones
+    # (one per other Experiment Server suitable for the experiment, at most one
+    # per seed)
+    #
+    # @param job    The job (the parent of the new ones)
+    #---------------------------------------------------------------------------
+    def shardEvaluation(self, job):
+        job.evaluation = EvaluationShards(job, len(job.seeds))
+
+        nb_shards = min(len(self.listExperimentServers(job)), len(job.seeds)) - 1
+        if nb_shards <= 0:
+            return
+
+        job.outStream.write("Sharing the %d seeds with %d other job(s)\n" % (len(job.seeds), nb_shards))
+
+        for i in range(nb_shards):
+            shard = self.jobs.addJob(command=Message(ExperimentLauncher.SHARD_COMMAND,
+                                                     [job.server_job.experiment.id]))
+            shard.parent     = job
+            shard.evaluation = job.evaluation
+            shard.seeds      = job.seeds
+
+            self.new_jobs.append(shard)
+
+
+    #---------------------------------------------------------------------------
+    # Called when a job has no seed of an evaluation left to process
+    #
+    # The shards are done, the parent releases its Experiment Server and waits
+    # for the other jobs (see checkEvaluation())
+    #---------------------------------------------------------------------------
+    def leaveEvaluation(self, job):
+        evaluation = job.evaluation
+        evaluation.running.discard(job)
+
+        if job.parent is None:
+            job.closeClient()
+            job.operation = ExperimentLauncher.waitEvaluation
+        else:
+            job.markAsDone()
+
+        self.waitEvaluationResults(job)
+
+
+    #---------------------------------------------------------------------------
+    # Operation of the parent of a shared evaluation while it waits for the
+    # other jobs: the job stays running without any client, until
+    # checkEvaluation() completes it (nothing to do if it is processed
+    # meanwhile)
+    #---------------------------------------------------------------------------
+    def waitEvaluation(self, job):
+        pass
+
+
+    #---------------------------------------------------------------------------
+    # Called when a job of a shared evaluation failed: the other jobs stop after
+    # their current round
+    #---------------------------------------------------------------------------
+    def onEvaluationJobFailed(self, job):
+        evaluation = job.evaluation
+        evaluation.failed = True
+        evaluation.remaining = []
+        evaluation.running.discard(job)
+
+        self.waitEvaluationResults(job)
+
+
+    #---------------------------------------------------------------------------
+    # Check the shared evaluation of a job once the results of the job are in
+    # the database (the operations of the other jobs are executed separately,
+    # so the evaluation waits for all of them)
+    #---------------------------------------------------------------------------
+    def waitEvaluationResults(self, job):
+        evaluation = job.evaluation
+        evaluation.flushing += 1
+
+        def onFlushed():
+            evaluation.flushing -= 1
+            self.checkEvaluation(evaluation)
+
+        job.persist(callback=onFlushed)
+
+
+    #---------------------------------------------------------------------------
+    # Finalize a shared evaluation once all its jobs are done (and their
+    # results in the database)
+    #---------------------------------------------------------------------------
+    def checkEvaluation(self, evaluation):
+        if evaluation.finished or (len(evaluation.running) > 0) or (evaluation.flushing > 0):
+            return
+
+        evaluation.finished = True
+
+        parent = evaluation.parent
+
+        # Cancel the shards that didn't start yet
+        shards = filter(lambda x: x.evaluation is evaluation,
+                        self.jobs.getJobs(command=Message(ExperimentLauncher.SHARD_COMMAND,
+                                                          [parent.server_job.experiment.id])))
+        for shard in shards:
+            shard.markAsCancelled()
+        self.jobs.removeJobs(shards)
+
+        # The parent might have failed itself
+        if parent.server_job.status != ServerJob.STATUS_RUNNING:
+            return
+
+        if evaluation.failed:
+            parent.outStream.write("The evaluation failed on another Experiment Server\n")
+
+            parent.server_job.experiment.end = datetime.now()
+            parent.persist(parent.server_job.experiment.save)
+
+            alert = Alert()
+            alert.message = 'Failed to evaluate some of the seeds of the experiment'
+            parent.markAsFailed(alert=alert)
+        else:
+            self.completeExperiment(parent)
+
+        self.jobs.removeJobs([parent])
+
+
+    #---------------------------------------------------------------------------
+    # Start or continue a job (the failure of a job of a shared evaluation
+    # stops the other ones)
+    #---------------------------------------------------------------------------
+    def _processJob(self, job):
+        super(ExperimentLauncher, self)._processJob(job)
+
+        if (job.evaluation is not None) and not(job.evaluation.finished) and \
+           (job.server_job.status == ServerJob.STATUS_FAILED):
+            self.onEvaluationJobFailed(job)
+
+
+    #---------------------------------------------------------------------------
+    # Send an event about the success of an experiment, if necessary
+    #---------------------------------------------------------------------------
+    def sendExperimentDoneEvent(self, job, configuration):
         if configuration.experiment_type == Configuration.PUBLIC:
             self.channel.sendMessage(Message('EVT_PUBLIC_EXPERIMENT_DONE', [job.server_job.experiment.id]))
         elif configuration.experiment_type == Configuration.EVALUATION:
@@ -1109,6 +1513,8 @@ class ExperimentLauncher(Task):
 
         # Determine if the experiment failed or if we can retry to do it
         if not(can_retry):
+            self.flushResults(job)
+
             job.server_job.logs = getServerLogs(job.client, job.server_job.logs)
             job.server_job.save()
 
@@ -1168,27 +1574,156 @@ class ExperimentLauncher(Task):
             next_setting = job.current_section.settings_to_send[0]
             job.current_section.settings_to_send = job.current_section.settings_to_send[1:]
 
-            if (job.current_section.name == 'EXPERIMENT_SETUP') and (next_setting[0] == 'LABELS'):
+            if not(job.client.sendCommand(self.settingCommand(job, job.current_section, next_setting))):
+                self.processError(job, "Failed to send the setting '%s'" % next_setting[0])
+                return
 
-                all_labels = filter(lambda x: len(x) > 0, next_setting[1].replace('\r', '').split('\n'))
+            job.operation = ExperimentLauncher.sendSection
 
-                if job.server_job.experiment.configuration.experiment_type == Configuration.EVALUATION:
-                    if job.nb_evaluation_rounds_done < len(all_labels):
-                        labels = all_labels[job.nb_evaluation_rounds_done].split(' ')
-                    else:
-                        labels = all_labels[-1].split(' ')
-                else:
-                    labels = all_labels[0].split(' ')
 
-                if not(job.client.sendCommand(Message(next_setting[0], labels))):
-                    self.processError(job, "Failed to send the setting '%s'" % next_setting[0])
-                    return
+    #---------------------------------------------------------------------------
+    # Returns the command used to send a setting of a section
+    #
+    # @param job        The job
+    # @param section    The section
+    # @param setting    The setting, as (name, value)
+    #---------------------------------------------------------------------------
+    def settingCommand(self, job, section, setting):
+        if (section.name == 'EXPERIMENT_SETUP') and (setting[0] == 'LABELS'):
+
+            all_labels = filter(lambda x: len(x) > 0, setting[1].replace('\r', '').split('\n'))
+
+            if job.server_job.experiment.configuration.experiment_type == Configuration.EVALUATION:
+                if job.nb_evaluation_rounds_done < len(all_labels):
+                    labels = all_labels[job.nb_evaluation_rounds_done].split(' ')
+                else:
+                    labels = all_labels[-1].split(' ')
             else:
-                if not(job.client.sendCommand(Message(next_setting[0], [next_setting[1]]))):
-                    self.processError(job, "Failed to send the setting '%s'" % next_setting[0])
-                    return
+                labels = all_labels[0].split(' ')
 
-            job.operation = ExperimentLauncher.sendSection
+            return Message(setting[0], labels)
+
+        return Message(setting[0], [setting[1]])
+
+
+    #---------------------------------------------------------------------------
+    # Returns all the commands needed to send a section, as a list of
+    # (command, error message)
+    #---------------------------------------------------------------------------
+    def sectionCommands(self, job, section):
+        commands = [ (Message('BEGIN_%s' % section.name, section.parameters),
+                      "Failed to start the '%s' section" % section.name) ]
+
+        for setting in section.settings_to_send:
+            commands.append((self.settingCommand(job, section, setting),
+                             "Failed to send the setting '%s'" % setting[0]))
+
+        commands.append((Message('END_%s' % section.name),
+                         "Failed to end the '%s' section" % section.name))
+
+        return commands
+
+
+    #---------------------------------------------------------------------------
+    # Send several commands at once, without waiting for the response of each
+    # one (only if the Experiment Server supports it, see usePipelinedSetup())
+    #
+    # @param job        The job
+    # @param commands   The commands, as a list of (command, error message)
+    # @param operation  The operation to perform (with 'no_waiting=True') once
+    #                   all the commands succeeded
+    #
+    # The responses are matched with the commands, in order, by
+    # processPipelinedResponses()
+    #---------------------------------------------------------------------------
+    def sendPipelined(self, job, commands, operation):
+        job.pending_responses = []
+        job.pipeline_next = operation
+        job.pipeline_failure = None
+
+        for (command, error) in commands:
+            if not(job.client.sendCommand(command)):
+                self.processError(job, error)
+                return
+
+            job.pending_responses.append(error)
+
+        job.operation = ExperimentLauncher.processPipelinedResponses
+
+
+    #---------------------------------------------------------------------------
+    # Process the response to one of the commands sent by sendPipelined()
+    #
+    # After an error, the responses to the remaining commands are still
+    # consumed (one per call), so the error report can be retrieved once the
+    # last one is received
+    #---------------------------------------------------------------------------
+    def processPipelinedResponses(self, job):
+        response = job.client.waitResponse()
+
+        error = job.pending_responses.pop(0)
+
+        if response is None:
+            job.pipeline_failure = (error, response)
+            job.pending_responses = []
+
+        elif (response.name != 'OK') and (job.pipeline_failure is None):
+            job.pipeline_failure = (error, response)
+
+        if len(job.pending_responses) > 0:
+            job.operation = ExperimentLauncher.processPipelinedResponses
+            return
+
+        operation = job.pipeline_next
+        failure = job.pipeline_failure
+
+        job.pending_responses = None
+        job.pipeline_next = None
+        job.pipeline_failure = None
+
+        if failure is not None:
+            self.processError(job, failure[0], failure[1])
+            return
+
+        operation(self, job, no_waiting=True)
+
+
+    #---------------------------------------------------------------------------
+    # Ask the Experiment Server if it supports the pipelined setup
+    #
+    # A server supporting it processes all the commands it receives, even after
+    # an error, and accepts the list of heuristics in one command
+    # ('USE_HEURISTICS <heuristic1> <heuristic2> ...').
+    #
+    # @return   'True' if the pipelined setup can be used
+    #---------------------------------------------------------------------------
+    def usePipelinedSetup(self, job):
+        if not(job.client.sendCommand(Message(ExperimentLauncher.PIPELINED_SETUP_COMMAND))):
+            return False
+
+        response = job.client.waitResponse()
+        if (response is None) or (response.name != 'OK'):
+            job.outStream.write("The Experiment Server doesn't support the pipelined setup\n")
+            return False
+
+        return True
+
+
+    #---------------------------------------------------------------------------
+    # Returns the instruments to send to the Experiment Server
+    #---------------------------------------------------------------------------
+    def listInstruments(self, job):
+        return list(Instrument.objects.filter(configuration=job.server_job.experiment.configuration).exclude(
+                                              status=Instrument.DISABLED).exclude(
+                                              status=Instrument.BUILTIN))
+
+
+    #---------------------------------------------------------------------------
+    # Returns the heuristics to send to the Experiment Server
+    #---------------------------------------------------------------------------
+    def listHeuristics(self, job):
+        return list(job.server_job.experiment.configuration.heuristics_set.filter(
+                                                                status=HeuristicVersion.STATUS_OK))
 
 
     #---------------------------------------------------------------------------
@@ -1209,17 +1744,10 @@ class ExperimentLauncher(Task):
             self.processError(job, "Failed to send the '%s' command" % command_name)
             return False
 
-        max_size = 10 * 1024
-        while size > 0:
-            nb = min(size, max_size)
-            data = inFile.read(size)
-
-            if not(job.client.sendData(data)):
-                inFile.close()
-                self.processError(job, "Failed to send the content of the file '%s'" % filename)
-                return False
-
-            size -= nb
+        if not(job.client.sendFileStream(inFile, size)):
+            inFile.close()
+            self.processError(job, "Failed to send the content of the file '%s'" % filename)
+            return False
 
         inFile.close()
 
@@ -1227,19 +1755,15 @@ class ExperimentLauncher(Task):
 
 
     #---------------------------------------------------------------------------
-    # Update (or create) a notification in the database
+    # Update (or create) a notification in the database (the notifications
+    # are saved in batch, see Job.setNotification(), and the ones of the
+    # shards of an evaluation are ignored)
     #---------------------------------------------------------------------------
     def updateNotification(self, job, parameters):
-        try:
-            notification = job.server_job.experiment.notifications.get(name=parameters[0])
-            notification.value = ' '.join(map(lambda x: str(x), parameters[1:]))
-            notification.save()
-        except:
-            notification            = Notification()
-            notification.name       = parameters[0]
-            notification.value      = ' '.join(map(lambda x: str(x), parameters[1:]))
-            notification.experiment = job.server_job.experiment
-            notification.save()
+        if job.parent is not None:
+            return
+
+        job.setNotification(parameters[0], ' '.join(map(lambda x: str(x), parameters[1:])))
 
 
     #---------------------------------------------------------------------------
@@ -1250,6 +1774,47 @@ class ExperimentLauncher(Task):
     def selectExperimentServer(self, job):
         job.outStream.write("Searching a free Experiment Server suitable for the task\n")
 
+        servers = self.listExperimentServers(job)
+
+        while len(servers) > 0:
+            (server, job.client) = self.connection_pool.acquire(servers, outStream=job.outStream)
+            if job.client is None:
+                break
+
+            servers = filter(lambda x: x is not server, servers)
+
+            job.client.sendCommand('INFO')
+            response = job.client.waitResponse()
+            if (response.name == 'TYPE') and (response.parameters[0] == 'ExperimentServer'):
+                response = job.client.waitResponse()
+                if (response.name == 'PROTOCOL') and (str(response.parameters[0]) == '1.7'):
+                    job.outStream.write("    Image Server found\n")
+
+                    # Notifications and results are streamed by the
+                    # server, use the framed mode if available
+                    job.client.useFramedMode()
+
+                    # Send the setup of the experiment in bursts if possible
+                    job.pipelined_setup = self.usePipelinedSetup(job)
+
+                    job.server_job.server = server
+                    job.server_job.save()
+                    return True
+
+            self.connection_pool.release(job.client)
+            job.client = None
+
+        job.outStream.write("Failed to find a free Experiment Server\n")
+        job.markAsDelayed(60)
+        return False
+
+
+    #---------------------------------------------------------------------------
+    # Returns the Experiment Servers suitable for the experiment of a job
+    #
+    # @param job    The job
+    #---------------------------------------------------------------------------
+    def listExperimentServers(self, job):
         experiment_type = job.server_job.experiment.configuration.experiment_type
         if experiment_type == Configuration.CONTEST_BASE:
             experiment_type = Configuration.CONTEST_ENTRY
@@ -1266,45 +1831,26 @@ class ExperimentLauncher(Task):
                                                   supported_tasks__in=[job.server_job.experiment.configuration.task],
                                                   restrict_experiment__isnull=True)))
 
-        for server in servers:
-            job.outStream.write("    Contacting '%s:%d'...\n" % (server.address, server.port))
-
-            job.client = Client(outStream = job.outStream)
-            if job.client.connect(server.address, server.port):
-                job.client.sendCommand('STATUS')
-                response = job.client.waitResponse()
-                if response.name == 'READY':
-                    job.client.sendCommand('INFO')
-                    response = job.client.waitResponse()
-                    if (response.name == 'TYPE') and (response.parameters[0] == 'ExperimentServer'):
-                        response = job.client.waitResponse()
-                        if (response.name == 'PROTOCOL') and (str(response.parameters[0]) == '1.7'):
-                            job.outStream.write("    Image Server found\n")
-                            job.server_job.server = server
-                            job.server_job.save()
-                            return True
-
-            job.client.close()
-            del job.client
-            job.client = None
-
-        job.outStream.write("Failed to find a free Experiment Server\n")
-        job.markAsDelayed(60)
-        return False
+        return servers
 
 
     #---------------------------------------------------------------------------
     # Create the configuration of a contest, based on the results of a base
-    # experiment
+    # experiment (called by a worker thread)
     #
-    # @param job    The job
+    # @param template           The configuration of the base experiment
+    # @param report_filename    Name of the data report of the base experiment
+    # @param log                List to which the log messages are appended
     #---------------------------------------------------------------------------
-    def createContestConfiguration(self, job):
+    def createContestConfiguration(self, template, report_filename, log):
         try:
-            job.outStream.write("Creating the contest configuration...\n")
+            log.append("Creating the contest configuration...\n")
+
+            if report_filename is None:
+                log.append("No data report to extract the predictor model from\n")
+                return
 
             # Retrieve the trained model
-            report_filename = job.server_job.experiment.data_report.filename
             model_folder = report_filename.replace('.tar.gz', '')
 
             report_fullpath = os.path.join(settings.DATA_REPORTS_ROOT, report_filename)
@@ -1330,12 +1876,10 @@ class ExperimentLauncher(Task):
                     model_internal_path = os.path.join(model_folder, 'predictor.internal')
 
             if model_path is None:
-                job.outStream.write("Failed to extract the predictor model from the data report\n")
+                log.append("Failed to extract the predictor model from the data report\n")
                 return
 
             # Create the configuration
-            template = job.server_job.experiment.configuration
-
             configuration = Configuration()
 
             if template.name.endswith('/base'):
@@ -1399,8 +1943,7 @@ class ExperimentLauncher(Task):
 
             inModel.close()
         except Exception, e:
-            log_message = traceback.format_exc()
-            job.outStream.write(log_message + "\n")
+            log.append(traceback.format_exc() + "\n")
 
 
 
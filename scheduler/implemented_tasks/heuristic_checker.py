@@ -26,7 +26,6 @@
 from tasks.task import Task
 from tasks.jobs import Job
 from utilities.logs import getServerLogs
-from pymash import Client
 from pymash import Message
 from pymash.gitrepository import GitRepository
 from django.conf import settings
@@ -72,26 +71,16 @@ class HeuristicChecker(Task):
         job.outStream.write("Searching a free compilation server...\n")
         
         servers = Server.objects.filter(server_type=Server.COMPILATION_SERVER)
-        for server in filter(lambda x: x.current_job() is None, servers):
-            job.outStream.write("    Contacting '%s:%d'...\n" % (server.address, server.port))
-
-            job.client = Client(outStream = job.outStream)
-            if job.client.connect(server.address, server.port):
-                job.client.sendCommand('STATUS')
-                response = job.client.waitResponse()
-                if response.name == 'READY':
-                    job.outStream.write("    Compilation Server found\n")
-                    job.markAsRunning(server=server, heuristic_version=heuristic_version)
-                    break
-            
-            job.client.close()
-            del job.client
-            job.client = None
+        (server, job.client) = self.connection_pool.acquire(filter(lambda x: x.current_job() is None, servers),
+                                                            outStream=job.outStream)
 
         if job.client is None:
             job.outStream.write("Failed to find a free compilation server\n")
             job.markAsDelayed(60)
             return
+
+        job.outStream.write("    Compilation Server found\n")
+        job.markAsRunning(server=server, heuristic_version=heuristic_version)
         
         # Create the test status
         try:
@@ -316,10 +305,7 @@ class HeuristicChecker(Task):
 
         job.outStream.write("Test OK\n")
 
-        job.client.sendCommand('DONE')
-        job.client.close()
-        del job.client
-        job.client = None
+        job.closeClient()
 
 
         ###### The heuristic is OK, move it into the private space ######
@@ -26,8 +26,9 @@
 from tasks.task import Task
 from tasks.jobs import Job
 from utilities.logs import getServerLogs
-from pymash import Client
 from pymash import Message
+from pymash import RecordedDataReader
+from pymash import RecordedDataIndex
 from pymash.gitrepository import GitRepository
 from django.conf import settings
 from django.template import defaultfilters
@@ -39,6 +40,7 @@ from factory.models import FactoryTask
 from factory.models import DebuggingEntry
 from tools.models import PluginErrorReport
 import os
+import shutil
 import traceback
 from datetime import datetime
 
@@ -92,23 +94,13 @@ class HeuristicDebugger(Task):
                                         provided_goals__name__in=[goal_name],
                                         provided_goals__environments__name__in=[environment_name])
 
+        # Note: the connections aren't kept in the connection pool, since the
+        # Debugging Server must be able to connect to the Application Server
         job.application_server = None
-        for server in servers:
-            job.outStream.write("    Contacting '%s:%d'...\n" % (server.address, server.port))
-
-            client = Client()
-            if client.connect(server.address, server.port):
-                client.sendCommand('STATUS')
-                response = client.waitResponse()
-                if response.name == 'READY':
-                    job.outStream.write("    Interactive Application Server found\n")
-                    job.application_server = server
-
-            client.close()
-            del client
-
-            if job.application_server is not None:
-                break
+        for (server, client) in self.connection_pool.probe(servers, outStream=job.outStream, first=True):
+            job.outStream.write("    Interactive Application Server found\n")
+            job.application_server = server
+            self.connection_pool.discard(client)
 
         if job.application_server is None:
             job.outStream.write("Failed to find a free Interactive Application providing " \
@@ -120,27 +112,17 @@ class HeuristicDebugger(Task):
         job.outStream.write("Searching a free debugging server...\n")
 
         servers = Server.objects.filter(server_type=Server.DEBUGGING_SERVER)
-        for server in filter(lambda x: x.current_job() is None, servers):
-            job.outStream.write("    Contacting '%s:%d'...\n" % (server.address, server.port))
-
-            job.client = Client(outStream = job.outStream)
-            if job.client.connect(server.address, server.port):
-                job.client.sendCommand('STATUS')
-                response = job.client.waitResponse()
-                if response.name == 'READY':
-                    job.outStream.write("    Debugging Server found\n")
-                    job.markAsRunning(server=server, heuristic_version=job.debugging_entry.heuristic_version)
-                    break
-
-            job.client.close()
-            del job.client
-            job.client = None
+        (server, job.client) = self.connection_pool.acquire(filter(lambda x: x.current_job() is None, servers),
+                                                            outStream=job.outStream)
 
         if job.client is None:
             job.outStream.write("Failed to find a free debugging server\n")
             job.markAsDelayed(60)
             return
 
+        job.outStream.write("    Debugging Server found\n")
+        job.markAsRunning(server=server, heuristic_version=job.debugging_entry.heuristic_version)
+
         # Indicates that the debugging entry is being processed
         job.debugging_entry.status = DebuggingEntry.STATUS_RUNNING
         job.debugging_entry.save()
@@ -333,7 +315,23 @@ class HeuristicDebugger(Task):
         # Save the data
         size = response.parameters[0]
 
-        data = job.client.waitData(size)
+        data = job.client.waitData(size, copy=False)
+        if data is None:
+            alert = Alert()
+            alert.message = "Failed to retrieve the debugging data of the heuristic '%s'" % job.server_job.heuristic_version.fullname()
+            alert.details = "Response: %s" % response.toString()
+
+            job.outStream.write("ERROR - %s\n%s\n" % (alert.message, alert.details.encode('ascii', 'ignore')))
+
+            job.debugging_entry.status = DebuggingEntry.STATUS_FAILED
+            job.debugging_entry.error_details = '%s\n%s' % (alert.message, alert.details)
+            job.debugging_entry.save()
+
+            job.server_job.logs = getServerLogs(job.client)
+            job.server_job.save()
+
+            job.markAsFailed(alert=alert)
+            return
 
         fullpath = os.path.join(settings.HEURISTICS_DEBUGGING_ROOT, job.debugging_entry.filename())
         if not(os.path.exists(os.path.dirname(fullpath))):
@@ -343,16 +341,34 @@ class HeuristicDebugger(Task):
         outFile.write(data)
         outFile.close()
 
-        # Save the info in the database
+        # Remove the images cached from a previous recording
+        shutil.rmtree(RecordedDataReader.imagesCacheFolder(fullpath), ignore_errors=True)
+
+        # Index the frames, so they can be retrieved without parsing the
+        # whole file. The file is parsed by a worker thread, outside of the
+        # loop of the scheduler (the website indexes the file itself if the
+        # index isn't there yet)
+        errors = []
+
+        def buildIndex():
+            try:
+                RecordedDataIndex.build(fullpath).save(RecordedDataIndex.filename(fullpath))
+            except:
+                errors.append(traceback.format_exc())
+
+        def reportIndexErrors():
+            for error in errors:
+                self.outStream.write("WARNING - Failed to index the recorded frames of '%s'\n%s\n" % (fullpath, error))
+
+        job.persist(buildIndex, reportIndexErrors)
+
+        # Save the info in the database (once the frames are indexed)
         job.debugging_entry.status = DebuggingEntry.STATUS_DONE
-        job.debugging_entry.save()
+        job.persist(job.debugging_entry.save)
 
         job.outStream.write("Debugging done\n")
 
-        job.client.sendCommand('DONE')
-        job.client.close()
-        del job.client
-        job.client = None
+        job.closeClient()
 
         # Mark the job as done
         job.markAsDone()
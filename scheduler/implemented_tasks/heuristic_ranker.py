@@ -25,6 +25,13 @@
 
 from tasks.task import Task
 from tasks.jobs import Job
+from utilities.db_executor import bulkUpdate
+from utilities.ranking import computeScores
+from utilities.ranking import computeRanks
+from utilities.ranking import ReferenceGroup
+from utilities.ranking import RankIndex
+from servers.models import Alert
+from servers.models import Job as ServerJob
 from heuristics.models import HeuristicVersion
 from heuristics.models import HeuristicEvaluationResults
 from experiments.models import Experiment
@@ -32,7 +39,6 @@ from experiments.models import Configuration
 from contests.models import ContestEntry
 from pymash.messages import Message
 from django.db.models import Q
-import math
 
 
 def compare_evaluation_results(x, y):
@@ -49,21 +55,6 @@ def compare_evaluation_results(x, y):
             return  0
 
 
-class RankingHelper:
-
-    def __init__(self, heuristic_version, modifiable=False):
-        self.heuristic_version = heuristic_version
-        self.score             = 0.0
-        self.error_rate        = 0.0
-        self.modifiable        = modifiable
-
-    def setup(self, evaluation_config):
-        self.error_rate = self.heuristic_version.evaluation_results.get(evaluation_config=evaluation_config).mean_test_error()
-
-    def updateScore(self, score):
-        self.score += score
-
-
 #-------------------------------------------------------------------------------
 # This task computes the ranking of the heuristic versions
 #-------------------------------------------------------------------------------
@@ -77,6 +68,22 @@ class HeuristicRanker(Task):
     SUPPORTED_EVENTS   = { 'EVT_HEURISTIC_EVALUATED': [int],    # <heuristic_version_id>
                          }
 
+    # Evaluating all the heuristics produces one event per heuristic version
+    COALESCED_EVENTS   = { 'EVT_HEURISTIC_EVALUATED': (10, 60),
+                         }
+
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #---------------------------------------------------------------------------
+    def __init__(self):
+        super(HeuristicRanker, self).__init__()
+
+        # Ranked public heuristic versions, used to rank the other ones (only
+        # modified by rankEvaluatedHeuristics())
+        self.rank_indexes      = {}     # Configuration ID -> RankIndex
+        self.public_references = {}     # Configuration IDs -> ReferenceGroup
+
 
     #---------------------------------------------------------------------------
     # Starts the job-specific processing
@@ -116,67 +123,88 @@ class HeuristicRanker(Task):
         job.markAsRunning()
 
         # Reset all the ranks
-        for evaluation_results in HeuristicEvaluationResults.objects.all():
-            evaluation_results.rank = None
-            evaluation_results.save()
-            evaluation_results.heuristic_version.rank = None
-            evaluation_results.heuristic_version.save()
+        HeuristicEvaluationResults.objects.filter(rank__isnull=False).update(rank=None)
+        HeuristicVersion.objects.filter(rank__isnull=False).update(rank=None)
+
+        self.rank_indexes = {}
+        self.public_references = {}
 
         # Retrieve all the evaluation configurations
-        evaluation_configurations = Configuration.objects.filter(experiment_type=Configuration.EVALUATION,
-                                                                 name__startswith='template/')
+        evaluation_configurations = list(Configuration.objects.filter(experiment_type=Configuration.EVALUATION,
+                                                                      name__startswith='template/').order_by('id'))
 
         # Retrieve all the public heuristic versions completely evaluated
-        public_heuristic_versions = filter(lambda x: x.heuristic.latest_public_version.id == x.id,
-                                           HeuristicVersion.objects.filter(public=True, evaluated=True))
+        public_heuristic_versions = filter(lambda x: x.heuristic.latest_public_version_id == x.id,
+                                           HeuristicVersion.objects.filter(public=True, evaluated=True).select_related('heuristic'))
+
+        public_evaluation_results = self._loadEvaluationResults(public_heuristic_versions, evaluation_configurations)
 
         # Compute the ranking for each configuration of the public heuristic versions
+        ranks = {}
         for configuration in evaluation_configurations:
-
-            configuration_evaluation_results = []
-            for heuristic_version in public_heuristic_versions:
-                configuration_evaluation_results.extend(map(lambda x: (x, x.mean_test_error(), x.mean_train_error()),
-                                                            heuristic_version.evaluation_results.filter(evaluation_config=configuration)))
+            configuration_evaluation_results = filter(lambda x: (x is not None) and (x[1] is not None),
+                                                      map(lambda x: public_evaluation_results.get((x.id, configuration.id)),
+                                                          public_heuristic_versions))
 
             configuration_evaluation_results.sort(cmp=compare_evaluation_results)
 
-            for index, evaluation_results in enumerate(map(lambda x: x[0], configuration_evaluation_results)):
-                evaluation_results.rank = index + 1
-                evaluation_results.save()
+            for index, evaluation_results_id in enumerate(map(lambda x: x[0], configuration_evaluation_results)):
+                ranks[evaluation_results_id] = index + 1
+
+            self.rank_indexes[configuration.id] = RankIndex(map(lambda (index, x): (x[1], x[2], index + 1),
+                                                                enumerate(configuration_evaluation_results)))
+
+        bulkUpdate(HeuristicEvaluationResults, 'rank', ranks)
 
         # Compute the global ranking of the public heuristic versions
-        to_rank = map(lambda x: RankingHelper(x, True), public_heuristic_versions)
-        self._computeGlobalRanking(to_rank, evaluation_configurations)
+        public_heuristic_versions = self._withStatistics(public_heuristic_versions, evaluation_configurations,
+                                                         public_evaluation_results)
+
+        public_errors = self._errorsMatrix(public_heuristic_versions, evaluation_configurations,
+                                           public_evaluation_results)
+
+        ranks = computeRanks(computeScores(public_errors))
+        bulkUpdate(HeuristicVersion, 'rank', dict(zip(map(lambda x: x.id, public_heuristic_versions), ranks)))
+
+        reference = ReferenceGroup(public_errors)
+        self.public_references[tuple(map(lambda x: x.id, evaluation_configurations))] = reference
 
         # Compute the ranking for each configuration of the remaining heuristic versions
+        ranks = {}
         for configuration in evaluation_configurations:
-            evaluation_results = HeuristicEvaluationResults.objects.filter(
-                                                            experiment__status=Experiment.STATUS_DONE,
-                                                            evaluation_config=configuration,
-                                                            rank__isnull=True)
+            rank_index = self._rankIndex(configuration.id)
 
-            ranked_evaluation_results = map(lambda x: (x, x.mean_test_error(), x.mean_train_error()),
-                                            filter(lambda x: x.heuristic_version.heuristic.latest_public_version.id == x.heuristic_version.id,
-                                                   HeuristicEvaluationResults.objects.filter(
+            for (id, test_error, train_error) in HeuristicEvaluationResults.objects.filter(
                                                             experiment__status=Experiment.STATUS_DONE,
                                                             evaluation_config=configuration,
-                                                            rank__isnull=False,
-                                                            heuristic_version__public=True).order_by('rank')))
+                                                            rank__isnull=True).values_list(
+                                                            'id', 'test_error_mean', 'train_error_mean'):
+                if (test_error is None) or (train_error is None):
+                    current_evaluation_results = HeuristicEvaluationResults.objects.get(id=id)
+                    test_error = current_evaluation_results.mean_test_error()
+                    train_error = current_evaluation_results.mean_train_error()
 
-            for current_evaluation_results in evaluation_results:
-                mean_test_error = current_evaluation_results.mean_test_error()
-                mean_train_error = current_evaluation_results.mean_train_error()
+                    # No step
+                    if (test_error is None) or (train_error is None):
+                        continue
 
-                current_evaluation_results.rank = self._rankElement(mean_test_error, mean_train_error,
-                                                                    ranked_evaluation_results)
-                current_evaluation_results.save()
+                ranks[id] = rank_index.rank(test_error, train_error)
 
-        # Compute the global ranking of the remaining heuristic versions
-        heuristic_versions = HeuristicVersion.objects.filter(rank__isnull=True, evaluated=True)
-        for heuristic_version in heuristic_versions:
-            to_rank = map(lambda x: RankingHelper(x, False), public_heuristic_versions)
-            to_rank.append(RankingHelper(heuristic_version, True))
-            self._computeGlobalRanking(to_rank, evaluation_configurations)
+        bulkUpdate(HeuristicEvaluationResults, 'rank', ranks)
+
+        # Compute the global ranking of the remaining heuristic versions (each
+        # one against the public heuristic versions)
+        heuristic_versions = list(HeuristicVersion.objects.filter(rank__isnull=True, evaluated=True))
+
+        candidate_evaluation_results = self._loadEvaluationResults(heuristic_versions, evaluation_configurations)
+        heuristic_versions = self._withStatistics(heuristic_versions, evaluation_configurations,
+                                                  candidate_evaluation_results)
+
+        candidate_errors = self._errorsMatrix(heuristic_versions, evaluation_configurations,
+                                              candidate_evaluation_results)
+
+        ranks = reference.rankCandidates(candidate_errors)
+        bulkUpdate(HeuristicVersion, 'rank', dict(zip(map(lambda x: x.id, heuristic_versions), ranks)))
 
         job.markAsDone()
 
@@ -202,44 +230,81 @@ class HeuristicRanker(Task):
         heuristic_version.evaluated = (heuristic_version.evaluation_results.filter(experiment__status=Experiment.STATUS_DONE).count() == heuristic_version.evaluation_results.count())
         heuristic_version.save()
 
-        # First check if we should not recompute all the rankings instead
+        # First check if we should not recompute all the rankings instead (only
+        # once for a burst of events, see Task.coalesceEvent())
         if heuristic_version.public:
-            self.rankEvaluatedHeuristics(job)
+            if self._isFullRankingScheduled(job):
+                job.markAsRunning()
+                job.outStream.write("All the rankings will be recomputed by another job\n")
+                job.markAsDone()
+            else:
+                self.rankEvaluatedHeuristics(job)
             return
 
         job.markAsRunning()
 
+        self._rankPrivateHeuristicVersion(heuristic_version)
+
+        job.markAsDone()
+
+
+    #---------------------------------------------------------------------------
+    # Indicates if another job of the task, not started yet, will recompute all
+    # the rankings
+    #---------------------------------------------------------------------------
+    def _isFullRankingScheduled(self, job):
+        heuristic_version_ids = []
+
+        for other in self.jobs.getJobs(status=ServerJob.STATUS_SCHEDULED):
+            if other is job:
+                continue
+
+            if other.command.name == 'RANK_EVALUATED_HEURISTICS':
+                return True
+            elif other.command.name == 'RANK_HEURISTIC_VERSION':
+                heuristic_version_ids.append(other.command.parameters[0])
+
+        if len(heuristic_version_ids) == 0:
+            return False
+
+        return HeuristicVersion.objects.filter(id__in=heuristic_version_ids, public=True).count() > 0
+
+
+    #---------------------------------------------------------------------------
+    # Compute the ranking of a private heuristic version, against the public
+    # ones
+    #---------------------------------------------------------------------------
+    def _rankPrivateHeuristicVersion(self, heuristic_version):
+
         # Retrieve all the complete evaluation results not ranked yet
         evaluation_results_to_rank = heuristic_version.evaluation_results.filter(
                                             experiment__status=Experiment.STATUS_DONE,
                                             rank__isnull=True)
 
         for evaluation_results in evaluation_results_to_rank:
-            ranked_evaluation_results = map(lambda x: (x, x.mean_test_error(), x.mean_train_error()),
-                                            filter(lambda x: x.heuristic_version.heuristic.latest_public_version.id == x.heuristic_version.id,
-                                                   HeuristicEvaluationResults.objects.filter(
-                                                            experiment__status=Experiment.STATUS_DONE,
-                                                            evaluation_config=evaluation_results.evaluation_config,
-                                                            rank__isnull=False,
-                                                            heuristic_version__public=True).order_by('rank')))
+            test_error = evaluation_results.mean_test_error()
+            train_error = evaluation_results.mean_train_error()
 
-            evaluation_results.rank = self._rankElement(evaluation_results.mean_test_error(),
-                                                        evaluation_results.mean_train_error(),
-                                                        ranked_evaluation_results)
+            # No step
+            if (test_error is None) or (train_error is None):
+                continue
+
+            evaluation_results.rank = self._rankIndex(evaluation_results.evaluation_config_id).rank(test_error,
+                                                                                                    train_error)
             evaluation_results.save()
 
         # Compute the global ranking if possible
         if heuristic_version.evaluated:
-            to_rank = map(lambda x: RankingHelper(x, False),
-                          filter(lambda x: x.heuristic.latest_public_version.id == x.id,
-                                 HeuristicVersion.objects.filter(rank__isnull=False, public=True)))
-
-            evaluated_heuristic_version = RankingHelper(heuristic_version, True)
-            to_rank.append(evaluated_heuristic_version)
+            evaluation_configurations = sorted(map(lambda x: x.evaluation_config, heuristic_version.evaluation_results.iterator()),
+                                               key=lambda x: x.id)
 
-            self._computeGlobalRanking(to_rank, map(lambda x: x.evaluation_config, heuristic_version.evaluation_results.iterator()))
+            evaluation_results = self._loadEvaluationResults([heuristic_version], evaluation_configurations)
+            if len(self._withStatistics([heuristic_version], evaluation_configurations, evaluation_results)) == 0:
+                return
 
-        job.markAsDone()
+            heuristic_version.rank = self._publicReference(evaluation_configurations).rankCandidates(
+                    self._errorsMatrix([heuristic_version], evaluation_configurations, evaluation_results))[0]
+            heuristic_version.save()
 
 
     #---------------------------------------------------------------------------
@@ -278,40 +343,143 @@ class HeuristicRanker(Task):
         job.markAsDone()
 
 
-    def _computeGlobalRanking(self, to_rank, evaluation_configurations):
-        if len(to_rank) == 0:
-            return
+    #---------------------------------------------------------------------------
+    # Retrieve the mean errors of some heuristic versions on some evaluation
+    # configurations, with one query
+    #
+    # @return   A dictionary: (heuristic version ID, configuration ID) ->
+    #           (evaluation results ID, mean test error, mean train error), the
+    #           errors being None for the results without any step
+    #---------------------------------------------------------------------------
+    def _loadEvaluationResults(self, heuristic_versions, evaluation_configurations):
+        if (len(heuristic_versions) == 0) or (len(evaluation_configurations) == 0):
+            return {}
+
+        evaluation_results = HeuristicEvaluationResults.objects.filter(
+                                    heuristic_version__in=map(lambda x: x.id, heuristic_versions),
+                                    evaluation_config__in=map(lambda x: x.id, evaluation_configurations)).values_list(
+                                    'id', 'heuristic_version', 'evaluation_config', 'test_error_mean', 'train_error_mean')
+
+        result = {}
+        missing = []
+        for (id, heuristic_version_id, configuration_id, test_error, train_error) in evaluation_results:
+            result[(heuristic_version_id, configuration_id)] = (id, test_error, train_error)
+
+            if (test_error is None) or (train_error is None):
+                missing.append(id)
+
+        # The statistics of some results might not be computed yet
+        if len(missing) > 0:
+            for current in HeuristicEvaluationResults.objects.filter(id__in=missing):
+                result[(current.heuristic_version_id, current.evaluation_config_id)] = \
+                                (current.id, current.mean_test_error(), current.mean_train_error())
+
+        return result
+
+
+    #---------------------------------------------------------------------------
+    # Returns the heuristic versions whose evaluation results have statistics on
+    # all the evaluation configurations (the other ones can't be ranked)
+    #
+    # @param evaluation_results     See _loadEvaluationResults()
+    #---------------------------------------------------------------------------
+    def _withStatistics(self, heuristic_versions, evaluation_configurations, evaluation_results):
+        result = []
+
+        for heuristic_version in heuristic_versions:
+            incomplete = filter(lambda x: evaluation_results.get((heuristic_version.id, x.id), (None, 0.0))[1] is None,
+                                evaluation_configurations)
+
+            if len(incomplete) > 0:
+                self.outStream.write("Heuristic version '%s' not ranked, no evaluation step on the configuration '%s'\n" % \
+                                     (heuristic_version.fullname(), incomplete[0].name))
+            else:
+                result.append(heuristic_version)
+
+        return result
+
+
+    #---------------------------------------------------------------------------
+    # Returns the mean test errors of some heuristic versions, as a matrix (one
+    # row per heuristic version, one column per evaluation configuration)
+    #
+    # @param evaluation_results     See _loadEvaluationResults()
+    #
+    # The results without statistics are rejected (see _withStatistics())
+    #---------------------------------------------------------------------------
+    def _errorsMatrix(self, heuristic_versions, evaluation_configurations, evaluation_results):
+        errors = []
+
+        for heuristic_version in heuristic_versions:
+            row = []
+            for configuration in evaluation_configurations:
+                try:
+                    test_error = evaluation_results[(heuristic_version.id, configuration.id)][1]
+                except KeyError:
+                    raise HeuristicEvaluationResults.DoesNotExist("No evaluation results for the heuristic version '%s' "
+                                                                  "and the configuration '%s'" % \
+                                                                  (heuristic_version.fullname(), configuration.name))
 
-        for evaluation_config in evaluation_configurations:
+                if test_error is None:
+                    raise ValueError("No statistics in the evaluation results of the heuristic version '%s' "
+                                     "on the configuration '%s'" % (heuristic_version.fullname(), configuration.name))
 
-            [ x.setup(evaluation_config) for x in to_rank ]
+                row.append(test_error)
+            errors.append(row)
 
-            l = map(lambda x: x.error_rate, to_rank)
+        return errors
 
-            errors_sum = sum(l)
-            errors_squared_sum = reduce(lambda x, y: x + y**2, l, 0.0)
 
-            mean = errors_sum / len(l)
-            variance = (errors_squared_sum - errors_sum * mean) / (len(l) - 1)
-            standard_deviation = math.sqrt(variance)
+    #---------------------------------------------------------------------------
+    # Returns the sorted index of the ranked results of the public heuristic
+    # versions on a configuration (retrieved from the database if necessary)
+    #---------------------------------------------------------------------------
+    def _rankIndex(self, configuration_id):
+        rank_index = self.rank_indexes.get(configuration_id)
+        if rank_index is not None:
+            return rank_index
+
+        ranked_evaluation_results = filter(lambda x: x.heuristic_version.heuristic.latest_public_version_id == x.heuristic_version_id,
+                                           HeuristicEvaluationResults.objects.filter(
+                                                    experiment__status=Experiment.STATUS_DONE,
+                                                    evaluation_config__id=configuration_id,
+                                                    rank__isnull=False,
+                                                    heuristic_version__public=True).select_related(
+                                                    'heuristic_version__heuristic').order_by('rank'))
+
+        rank_index = RankIndex(map(lambda x: (x.mean_test_error(), x.mean_train_error(), x.rank),
+                                   ranked_evaluation_results))
+
+        self.rank_indexes[configuration_id] = rank_index
+
+        return rank_index
+
+
+    #---------------------------------------------------------------------------
+    # Returns the group of the ranked public heuristic versions, on some
+    # evaluation configurations (ordered by ID), against which the other
+    # heuristic versions are ranked (retrieved from the database if necessary)
+    #---------------------------------------------------------------------------
+    def _publicReference(self, evaluation_configurations):
+        key = tuple(map(lambda x: x.id, evaluation_configurations))
 
-            [ x.updateScore((-x.error_rate + mean) / standard_deviation) for x in to_rank ]
+        reference = self.public_references.get(key)
+        if reference is not None:
+            return reference
 
-        to_rank.sort(lambda x, y: cmp(y.score, x.score))
+        public_heuristic_versions = filter(lambda x: x.heuristic.latest_public_version_id == x.id,
+                                           HeuristicVersion.objects.filter(rank__isnull=False, public=True).select_related('heuristic'))
 
-        for (index, x) in enumerate(to_rank):
-            if x.modifiable:
-                x.heuristic_version.rank = index + 1
-                x.heuristic_version.save()
+        public_evaluation_results = self._loadEvaluationResults(public_heuristic_versions, evaluation_configurations)
+        public_heuristic_versions = self._withStatistics(public_heuristic_versions, evaluation_configurations,
+                                                         public_evaluation_results)
 
+        reference = ReferenceGroup(self._errorsMatrix(public_heuristic_versions, evaluation_configurations,
+                                                      public_evaluation_results))
 
-    def _rankElement(self, mean_test_error, mean_train_error, ranked_list):
-        for current_ranked in ranked_list:
-            if (mean_test_error < current_ranked[1]) or \
-               (not(mean_test_error > current_ranked[1]) and (mean_train_error < current_ranked[2])):
-                return current_ranked[0].rank
+        self.public_references[key] = reference
 
-        return len(ranked_list) + 1
+        return reference
 
 
     def _contestEntryToTuple(self, contest_entry):
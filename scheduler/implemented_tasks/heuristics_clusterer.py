@@ -26,7 +26,6 @@
 from tasks.task import Task
 from tasks.jobs import Job
 from utilities.logs import getServerLogs
-from pymash import Client
 from pymash import Message
 from django.conf import settings
 from django.template import defaultfilters
@@ -49,6 +48,10 @@ class HeuristicsClusterer(Task):
     SUPPORTED_COMMANDS = { 'CLUSTER_HEURISTICS': [str] }
     SUPPORTED_EVENTS   = { 'EVT_HEURISTIC_SIGNATURE_RECORDED': [int] }
 
+    # Recording the signatures of all the heuristics produces one event per
+    # heuristic version
+    COALESCED_EVENTS   = { 'EVT_HEURISTIC_SIGNATURE_RECORDED': (10, 60) }
+
 
     #---------------------------------------------------------------------------
     # Called when a new command was received. It allows the task to process it
@@ -121,26 +124,16 @@ class HeuristicsClusterer(Task):
         job.outStream.write("Searching a free Clustering Server with the algorithm '%s'...\n" % job.command.parameters[0])
         
         servers = Server.objects.filter(server_type=Server.CLUSTERING_SERVER, clustering_algorithm__name=job.command.parameters[0])
-        for server in filter(lambda x: x.current_job() is None, servers):
-            job.outStream.write("    Contacting '%s:%d'...\n" % (server.address, server.port))
-
-            job.client = Client(outStream = job.outStream)
-            if job.client.connect(server.address, server.port):
-                job.client.sendCommand('STATUS')
-                response = job.client.waitResponse()
-                if response.name == 'READY':
-                    job.outStream.write("    Clustering Server found\n")
-                    job.markAsRunning(server=server)
-                    break
-            
-            job.client.close()
-            del job.client
-            job.client = None
+        (server, job.client) = self.connection_pool.acquire(filter(lambda x: x.current_job() is None, servers),
+                                                            outStream=job.outStream)
 
         if job.client is None:
             job.outStream.write("Failed to find a free Clustering Server\n")
             job.markAsDelayed(60)
             return
+
+        job.outStream.write("    Clustering Server found\n")
+        job.markAsRunning(server=server)
         
         # Tell the server about the signatures
         job.signatures_status = signatures_status
@@ -286,10 +279,7 @@ class HeuristicsClusterer(Task):
             job.markAsFailed(alert=alert)
             return
 
-        job.client.sendCommand('DONE')
-        job.client.close()
-        del job.client
-        job.client = None
+        job.closeClient()
 
         # Mark the signatures as processed
         for signature in job.sent_signatures:
@@ -25,7 +25,6 @@
 
 from tasks.task import Task
 from tasks.jobs import Job
-from pymash import Client
 from pymash import Message
 from servers.models import Server
 from servers.models import Alert
@@ -63,12 +62,14 @@ class ServerIdentificator(Task):
         job.markAsRunning(server=server)
 
         # Establish a connection with the server
-        job.client = Client(job.outStream)
-        if not(job.client.connect(server.address, server.port)):
+        connections = self.connection_pool.probe([server], outStream=job.outStream, checkStatus=False)
+        if len(connections) == 0:
             job.outStream.write("ERROR - Failed to establish a connection with the server\n")
             job.markAsDelayed(60)
             return
 
+        job.client = connections[0][1]
+
         # Retrieve the type of the server
         job.client.sendCommand('INFO')
 
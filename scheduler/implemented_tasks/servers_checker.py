@@ -25,7 +25,6 @@
 
 from tasks.task import Task
 from tasks.jobs import Job
-from pymash import Client
 from servers.models import Server
 from datetime import datetime
 from datetime import timedelta
@@ -60,25 +59,23 @@ class ServersChecker(Task):
         # Retrieve the list of servers
         servers = Server.objects.all()
 
-        # Check the status of each server
-        for server in servers:
-            server.status = Server.SERVER_STATUS_UNKNOWN
-            server.save()
+        # Attempt to connect to all the servers at once
+        job.outStream.write("Attempt to connect to the servers...\n")
 
-            job.outStream.write("Attempt to connect to server '%s' at '%s:%d'... " % \
-                                 (server.name, server.address, server.port))
-
-            client = Client()
+        online = []
+        for (server, client) in self.connection_pool.probe(servers, outStream=job.outStream, checkStatus=False):
+            online.append((server.address, server.port))
+            client.close()
 
-            if client.connect(server.address, server.port):
-                job.outStream.write("ONLINE\n")
+        # Update the status of each server
+        for server in servers:
+            if (server.address, server.port) in online:
+                job.outStream.write("Server '%s' at '%s:%d': ONLINE\n" % (server.name, server.address, server.port))
                 server.status = Server.SERVER_STATUS_ONLINE
             else:
-                job.outStream.write("OFFLINE\n")
+                job.outStream.write("Server '%s' at '%s:%d': OFFLINE\n" % (server.name, server.address, server.port))
                 server.status = Server.SERVER_STATUS_OFFLINE
 
-            client.close()
-
             server.save()
 
         self.last_check = datetime.now()
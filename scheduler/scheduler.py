@@ -40,13 +40,20 @@ from django.db.models import Q
 from scheduler_listener import SchedulerListener
 from scheduler_listener import PROTOCOL
 from tasks.task import Task
+from tasks.router import MessageRouter
+from utilities.connection_pool import ServerConnectionPool
+from utilities.timers import TimerService
+from utilities.timers import monotonicTime
+from utilities.selector import Selector
+from utilities.db_executor import DatabaseExecutor
 from pymash import OutStream
+from pymash import Message
 from pymash import CommunicationChannel
 from pymash import ThreadedServer
 from mash.servers.models import Job as ServerJob
+import mash.factory.models      # Invalidates the cached status of the menu of the factory
 import sys
 import os
-import select
 import signal
 import glob
 import traceback
@@ -66,6 +73,11 @@ def term_signal_handler(signum, frame):
 #-------------------------------------------------------------------------------
 class Scheduler:
 
+    # Constants
+    NB_DATABASE_WORKERS = 4     # Number of threads executing the database
+                                # operations of the jobs
+
+
     #---------------------------------------------------------------------------
     # Constructor
     #---------------------------------------------------------------------------
@@ -73,6 +85,10 @@ class Scheduler:
         self.server         = None
         self.input_channel  = None
         self.tasks          = []
+        self.timers         = TimerService()
+        self.selector       = None
+        self.executor       = None
+        self.router         = None
 
         self.outStream = OutStream()
         self.outStream.open('Scheduler', 'logs/scheduler-$TIMESTAMP.log')
@@ -88,10 +104,17 @@ class Scheduler:
 
         # Setup the server
         (SchedulerListener.OUTPUT_CHANNEL, self.input_channel) = CommunicationChannel.create(CommunicationChannel.CHANNEL_TYPE_SIMPLEX)
-        self.server = ThreadedServer(settings.SCHEDULER_ADDRESS, settings.SCHEDULER_PORT, SchedulerListener)
+        self.server = ThreadedServer(settings.SCHEDULER_ADDRESS, settings.SCHEDULER_PORT, SchedulerListener,
+                                     eventLoop=True)
         self.server.start()
 
+        # Execute the database operations of the jobs outside of the loop
+        self.executor = DatabaseExecutor(Scheduler.NB_DATABASE_WORKERS, outStream=self.outStream)
+        DatabaseExecutor.setInstance(self.executor)
+
         # Create the tasks
+        self.router = MessageRouter(self.outStream)
+
         files = glob.glob('implemented_tasks/*.py')
         for inFile in files:
             try:
@@ -106,7 +129,9 @@ class Scheduler:
 
                 if hasattr(module, 'tasks'):
                     for task_class in module.tasks():
-                        self.tasks.append(task_class())
+                        task = task_class()
+                        self.tasks.append(task)
+                        self.router.addTask(task)
 
                         self.outStream.write("    Supported commands:\n")
                         for command, parameters in task_class.SUPPORTED_COMMANDS.items():
@@ -123,12 +148,26 @@ class Scheduler:
 
                 OutStream.outputToConsole = previous
                 
+        # Register the file descriptors we must listen to (the tasks register
+        # the sockets of their jobs themselves)
+        self.selector = Selector()
+        self.selector.register(self.input_channel.readPipe, (None, self.input_channel))
+        self.selector.register(self.executor.fileDescriptor(), (None, self.executor))
+
+        for task in self.tasks:
+            task.watch(self.selector)
+
         try:
             # Remove all the delayed and running jobs from the database, and simulate
-            # a reception of their commands to reschedule them
+            # a reception of their commands to reschedule them (each command once,
+            # the jobs created by the tasks being rescheduled through their parent)
             jobs = ServerJob.objects.filter(Q(status=ServerJob.STATUS_DELAYED) | Q(status=ServerJob.STATUS_RUNNING))
+            commands = []
             for job in jobs:
-                SchedulerListener.OUTPUT_CHANNEL.sendMessage(job.command)
+                command = self.router.replayedCommand(Message.fromString(job.command)).toString()
+                if command not in commands:
+                    commands.append(command)
+                    SchedulerListener.OUTPUT_CHANNEL.sendMessage(command)
             jobs.delete()
 
             # Start the tasks
@@ -136,7 +175,12 @@ class Scheduler:
                 task.start()
 
             start_time = datetime.now()
-            start = datetime.now()
+
+            # Register the deadlines of the tasks
+            last_updates = {}
+            for task in self.tasks:
+                last_updates[task] = monotonicTime()
+                self.timers.setTimeout(task, task.getTimeout())
 
             while (True):
                 current_time = datetime.now()
@@ -148,48 +192,52 @@ class Scheduler:
                     self.outStream.close()
                     self.outStream = OutStream()
                     self.outStream.open('Scheduler', 'logs/scheduler-$TIMESTAMP.log')
+                    self.executor.outStream = self.outStream
 
-                # Build the list of file descriptors we must listen to
-                tasks_file_descriptors = []
-                for task_file_descriptors in [ task.getFileDescriptors() for task in self.tasks ]:
-                    tasks_file_descriptors.extend(task_file_descriptors)
-
-                select_list = [self.input_channel.readPipe]
-                select_list.extend(tasks_file_descriptors)
-
-                # Compute the timeout
-                timeouts = filter(lambda x: x is not None, map(lambda x: x.getTimeout(), self.tasks))
-                timeout = None
-                if len(timeouts) > 0:
-                    timeout = reduce(lambda x, y: min(x, y), timeouts)
-
-                # Wait for a message
+                # Wait for a message, until the next deadline
+                timeout = self.timers.nextTimeout()
                 if timeout is None:
                     self.outStream.write('Waiting for an event, no timeout...\n')
                 else:
-                    self.outStream.write('Waiting for an event, with a timeout of %d seconds...\n' % timeout)
+                    self.outStream.write('Waiting for an event, with a timeout of %.3f seconds...\n' % timeout)
                 
-                ready_to_read, ready_to_write, in_error = select.select(select_list, [], select_list, timeout)
-
-                # Tell the tasks about the event
-                end = datetime.now()
-                elapsed = (end - start).seconds
-                for task in self.tasks:
-                    task.onEvent(elapsed, ready_to_read)
-
-                if elapsed > 0:
-                    start = end
+                events = self.selector.select(timeout)
 
+                # Dispatch the ready file descriptors to their owners
+                woken = set(self.timers.expired())
+                ready_to_read = {}          # task -> file descriptors
                 channels_to_read = []
 
-                # Commands sent by the clients
-                if self.input_channel.readPipe in ready_to_read:
-                    channels_to_read.append(self.input_channel)
+                for (file_descriptor, (task, target)) in events:
+                    if isinstance(target, CommunicationChannel):
+                        # Commands sent by the clients come first, then the
+                        # commands and events sent by the tasks
+                        if target is self.input_channel:
+                            channels_to_read.insert(0, target)
+                        else:
+                            channels_to_read.append(target)
+
+                    if task is not None:
+                        woken.add(task)
+                        ready_to_read.setdefault(task, []).append(file_descriptor)
+
+                # Finish the processing of the database operations done by the
+                # executor (the commands and events sent by the callbacks are
+                # handled at the next iteration)
+                self.executor.processCompletions()
+
+                # Only the tasks whose deadline is reached or with a file
+                # descriptor ready are told about the event, the clock of the
+                # other ones is just updated
+                for task in self.tasks:
+                    now = monotonicTime()
+                    elapsed = now - last_updates[task]
+                    last_updates[task] = now
 
-                # Commands and events sent by the tasks
-                ready_tasks_file_descriptors = filter(lambda x: x in tasks_file_descriptors, ready_to_read)
-                for channels in [ filter(lambda x: x.readPipe == file_descriptor, map(lambda x: x.out_channel, self.tasks)) for file_descriptor in ready_tasks_file_descriptors ]:
-                    channels_to_read.extend(channels)
+                    if task in woken:
+                        task.onEvent(elapsed, ready_to_read.get(task, []))
+                    else:
+                        task.updateTimeouts(elapsed)
 
                 # Process all the commands and events received via channels
                 for channel in channels_to_read:
@@ -200,21 +248,31 @@ class Scheduler:
 
                         self.outStream.write('Got message: %s\n' % message.toString())
 
-                        # Find the task that is able to handle it
-                        for task in self.tasks:
-                            if task.processMessage(message):
-                                break
+                        # Deliver it to the task(s) able to handle it
+                        self.router.route(message)
                 
                 # Run the jobs that were scheduled
                 for task in self.tasks:
                     task.processNewJobs()
 
+                # Register the new deadlines of the tasks (the ones of the tasks
+                # not woken up can only be brought forward)
+                for task in self.tasks:
+                    self.timers.setTimeout(task, task.getTimeout(), keepEarlier=(task not in woken))
+
         except KeyboardInterrupt:
             self.outStream.write("Scheduler stopped\n")
 
         for task in self.tasks:
             task.stop()
 
+        self.executor.shutdown()
+        DatabaseExecutor.setInstance(None)
+
+        ServerConnectionPool.instance().clear()
+
+        self.selector.close()
+
         self.server.stop()
         self.input_channel.close()
         
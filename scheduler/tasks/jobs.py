@@ -23,11 +23,18 @@
 ################################################################################
 
 
+from django.conf import settings
 from pymash.messages import Message
 from pymash.outstream import OutStream
 from mash.servers.models import Job as ServerJob
 from mash.experiments.models import Experiment
+from mash.experiments.models import Notification
 from utilities.logs import saveLogFile
+from utilities.connection_pool import ServerConnectionPool
+from utilities.db_executor import DatabaseExecutor
+from utilities.timers import monotonicTime
+from collections import OrderedDict
+import heapq
 
 
 #-------------------------------------------------------------------------------
@@ -37,6 +44,13 @@ from utilities.logs import saveLogFile
 #-------------------------------------------------------------------------------
 class Job(object):
 
+    # Constants
+    DEFAULT_NOTIFICATIONS_DELAY = 5     # Maximum time (in seconds) during which
+                                        # the notifications are kept in memory
+                                        # (see setNotification()), if not set by
+                                        # SCHEDULER_NOTIFICATIONS_DELAY
+
+
     #---------------------------------------------------------------------------
     # Constructor
     #
@@ -65,10 +79,16 @@ class Job(object):
         else:
             raise ValueError()
         
+        self.job_list   = None          # The list containing the job (if any)
+        self.deadline   = None          # Deadline of the job (if delayed), see JobList
+        self.descriptor = None          # File descriptor of the client (if any), see JobList
         self.timeout    = None          # Timeout for the job (if delayed, in seconds)
         self.client     = None          # Network client object used by the job
         self.operation  = None          # Current operation (task-specific)
         self.mail_sent  = False         # Indicates if a mail was sent about the errors
+        self.last_alert = None          # The alert given to markAsFailed() (if any)
+        self.notifications          = OrderedDict() # Notifications not saved yet (name -> value)
+        self.notifications_deadline = None          # When they must be saved (see monotonicTime())
         self.outStream  = OutStream()   # Output stream relative to this job
 
     #---------------------------------------------------------------------------
@@ -83,23 +103,14 @@ class Job(object):
     # @param server     The server currently executing the job
     #---------------------------------------------------------------------------
     def markAsScheduled(self):
-        self.server_job.status = ServerJob.STATUS_SCHEDULED
+        self._setStatus(ServerJob.STATUS_SCHEDULED)
         self.server_job.server = None
-        self.server_job.save()
-
-        if self.server_job.experiment is not None:
-            self.server_job.experiment.status = Experiment.STATUS_SCHEDULED
-            self.server_job.experiment.save()
-            self.server_job.experiment.notifications.all().delete()
+        self._saveState(Experiment.STATUS_SCHEDULED, clearNotifications=True)
 
         self.timeout = None
         self.operation = None
 
-        if self.client is not None:
-            self.client.sendCommand('DONE')
-            self.client.close()
-            del self.client
-            self.client = None
+        self.closeClient(reusable=False)
 
         self.outStream.delete()
         self.outStream = OutStream()
@@ -112,15 +123,11 @@ class Job(object):
     # @param experiment         The experiment related to the job
     #---------------------------------------------------------------------------
     def markAsRunning(self, server=None, heuristic_version=None, experiment=None):
-        self.server_job.status = ServerJob.STATUS_RUNNING
+        self._setStatus(ServerJob.STATUS_RUNNING)
         self.server_job.server = server
         self.server_job.heuristic_version = heuristic_version
         self.server_job.experiment = experiment
-        self.server_job.save()
-
-        if self.server_job.experiment is not None:
-            self.server_job.experiment.status = Experiment.STATUS_RUNNING
-            self.server_job.experiment.save()
+        self._saveState(Experiment.STATUS_RUNNING)
 
         self.timeout = None
 
@@ -133,22 +140,13 @@ class Job(object):
     # Mark the job as done
     #---------------------------------------------------------------------------
     def markAsDone(self, experiment_status=Experiment.STATUS_DONE):
-        self.server_job.status = ServerJob.STATUS_DONE
+        self._setStatus(ServerJob.STATUS_DONE)
         self.server_job.server = None
-        self.server_job.save()
-
-        if self.server_job.experiment is not None:
-            self.server_job.experiment.status = experiment_status
-            self.server_job.experiment.save()
-            self.server_job.experiment.notifications.all().delete()
+        self._saveState(experiment_status, clearNotifications=True)
 
         self.operation = None
         
-        if self.client is not None:
-            self.client.sendCommand('DONE')
-            self.client.close()
-            del self.client
-            self.client = None
+        self.closeClient()
 
         self.outStream.delete()
         self.outStream = OutStream()
@@ -159,31 +157,24 @@ class Job(object):
     # @param alert  The alert explaining the problem
     #---------------------------------------------------------------------------
     def markAsFailed(self, alert=None):
-        self.server_job.status = ServerJob.STATUS_FAILED
+        self._setStatus(ServerJob.STATUS_FAILED)
         self.server_job.server = None
-        self.server_job.save()
-
-        if self.server_job.experiment is not None:
-            self.server_job.experiment.status = Experiment.STATUS_FAILED
-            self.server_job.experiment.save()
-            self.server_job.experiment.notifications.all().delete()
+        self._saveState(Experiment.STATUS_FAILED, clearNotifications=True)
 
         self.operation = None
 
         if alert is not None:
             alert.job = self.server_job
-            alert.save()
+            self.last_alert = alert
+            self.persist(alert.save)
         
-        if self.client is not None:
-            self.client.sendCommand('DONE')
-            self.client.close()
-            del self.client
-            self.client = None
+        self.closeClient(reusable=False)
 
         if self.server_job.logs is not None:
             content = self.outStream.dump(200 * 1024)
             if content is not None:
-                saveLogFile(self.server_job.logs, 'Job.log', content)
+                logs = self.server_job.logs
+                self.persist(lambda: saveLogFile(logs, 'Job.log', content))
 
         self.outStream.delete()
         self.outStream = OutStream()
@@ -192,22 +183,13 @@ class Job(object):
     # Mark the job as cancelled
     #---------------------------------------------------------------------------
     def markAsCancelled(self):
-        self.server_job.status = ServerJob.STATUS_CANCELLED
+        self._setStatus(ServerJob.STATUS_CANCELLED)
         self.server_job.server = None
-        self.server_job.save()
-
-        if self.server_job.experiment is not None:
-            self.server_job.experiment.status = Experiment.STATUS_FAILED
-            self.server_job.experiment.save()
-            self.server_job.experiment.notifications.all().delete()
+        self._saveState(Experiment.STATUS_FAILED, clearNotifications=True)
 
         self.operation = None
 
-        if self.client is not None:
-            self.client.sendCommand('DONE')
-            self.client.close()
-            del self.client
-            self.client = None
+        self.closeClient(reusable=False)
 
         self.outStream.delete()
         self.outStream = OutStream()
@@ -218,39 +200,220 @@ class Job(object):
     # @param delay  The delay
     #---------------------------------------------------------------------------
     def markAsDelayed(self, delay):
-        self.server_job.status = ServerJob.STATUS_DELAYED
+        self._setStatus(ServerJob.STATUS_DELAYED)
         self.server_job.server = None
-        self.server_job.save()
-
-        if self.server_job.experiment is not None:
-            self.server_job.experiment.status = Experiment.STATUS_SCHEDULED
-            self.server_job.experiment.save()
-            self.server_job.experiment.notifications.all().delete()
+        self._saveState(Experiment.STATUS_SCHEDULED, clearNotifications=True)
 
         self.timeout = delay
         self.operation = None
         
-        if self.client is not None:
-            self.client.sendCommand('DONE')
-            self.client.close()
-            del self.client
-            self.client = None
+        self.closeClient(reusable=False)
 
         self.outStream.delete()
         self.outStream = OutStream()
 
+    #---------------------------------------------------------------------------
+    # Tell the server that the job is done with it (if any)
+    #
+    # @param reusable   Indicates if the connection can be handed to another
+    #                   job (only when the job went well, otherwise the state
+    #                   of the server is unknown and the connection is closed)
+    #---------------------------------------------------------------------------
+    def closeClient(self, reusable=True):
+        if self.client is not None:
+            client = self.client
+            self.client = None
+
+            if reusable:
+                ServerConnectionPool.instance().done(client)
+            else:
+                ServerConnectionPool.instance().discard(client)
+
+    #---------------------------------------------------------------------------
+    # Execute a database operation of the job, outside of the loop of the
+    # scheduler (see utilities.db_executor.DatabaseExecutor)
+    #
+    # @param function   (Optional) The function to execute, without argument
+    # @param callback   (Optional) The function to call from the loop of the
+    #                   scheduler once the operation (and all the previous ones
+    #                   of the job) is done
+    #
+    # The operations of a job are executed in order
+    #---------------------------------------------------------------------------
+    def persist(self, function=None, callback=None):
+        DatabaseExecutor.instance().submit(self, function, callback)
+
+    #---------------------------------------------------------------------------
+    # Set the value of a notification of the experiment of the job
+    #
+    # @param name   Name of the notification
+    # @param value  Value of the notification
+    #
+    # The notifications are kept in memory (only the last value of each one)
+    # and saved in the database at most notificationsDelay() seconds later (see
+    # flushNotifications()), or when the state of the job changes
+    #---------------------------------------------------------------------------
+    def setNotification(self, name, value):
+        if len(self.notifications) == 0:
+            self.notifications_deadline = monotonicTime() + Job.notificationsDelay()
+
+        self.notifications[name] = value
+
+    #---------------------------------------------------------------------------
+    # Returns the maximum time (in seconds) during which the notifications are
+    # kept in memory (setting 'SCHEDULER_NOTIFICATIONS_DELAY')
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def notificationsDelay():
+        return getattr(settings, 'SCHEDULER_NOTIFICATIONS_DELAY', Job.DEFAULT_NOTIFICATIONS_DELAY)
+
+    #---------------------------------------------------------------------------
+    # Returns the number of seconds before the notifications kept in memory must
+    # be saved, or None
+    #---------------------------------------------------------------------------
+    def getNotificationsTimeout(self):
+        if len(self.notifications) == 0:
+            return None
+
+        return max(self.notifications_deadline - monotonicTime(), 0)
+
+    #---------------------------------------------------------------------------
+    # Save the notifications kept in memory in the database
+    #---------------------------------------------------------------------------
+    def flushNotifications(self):
+        if len(self.notifications) == 0:
+            return
+
+        notifications = self.notifications
+        experiment = self.server_job.experiment
+
+        self.notifications = OrderedDict()
+        self.notifications_deadline = None
+
+        if experiment is None:
+            return
+
+        def save():
+            existing = dict(map(lambda x: (x.name, x),
+                                experiment.notifications.filter(name__in=notifications.keys())))
+
+            for (name, value) in notifications.items():
+                notification = existing.get(name)
+                if notification is None:
+                    notification            = Notification()
+                    notification.name       = name
+                    notification.experiment = experiment
+
+                notification.value = value
+                notification.save()
+
+        self.persist(save)
+
     #---------------------------------------------------------------------------
     # Return the alert associated to the job (if any)
     #---------------------------------------------------------------------------
     def alert(self):
+        if self.last_alert is not None:
+            return self.last_alert
+
         try:
             return self.server_job.alert
         except:
             return None
 
+    #---------------------------------------------------------------------------
+    # Timeout of the job (if delayed, in seconds)
+    #
+    # Stored as a deadline on the clock of the list containing the job, so the
+    # list doesn't need to update all the delayed jobs when time passes
+    #---------------------------------------------------------------------------
+    def _getTimeout(self):
+        if self.deadline is None:
+            return None
+
+        return self.deadline - self._clock()
+
+    def _setTimeout(self, timeout):
+        if timeout is None:
+            self.deadline = None
+        else:
+            self.deadline = self._clock() + timeout
+
+        if self.job_list is not None:
+            self.job_list._onTimeoutChanged(self)
+
+    timeout = property(_getTimeout, _setTimeout)
+
+    def _clock(self):
+        if self.job_list is None:
+            return 0
+
+        return self.job_list.clock
+
+    #---------------------------------------------------------------------------
+    # Network client object used by the job
+    #
+    # The list containing the job is told when it changes, to listen to the
+    # socket of the client
+    #---------------------------------------------------------------------------
+    def _getClient(self):
+        return self._client
+
+    def _setClient(self, client):
+        self._client = client
+
+        if self.job_list is not None:
+            self.job_list._onClientChanged(self)
+
+    def _delClient(self):
+        self._setClient(None)
+
+    client = property(_getClient, _setClient, _delClient)
+
+    #---------------------------------------------------------------------------
+    # Save the job and the status of its experiment (if any) in the database
+    #---------------------------------------------------------------------------
+    def _saveState(self, experiment_status, clearNotifications=False):
+        server_job = self.server_job
+        experiment = server_job.experiment
+
+        # The notifications kept in memory are useless if they must be deleted
+        if clearNotifications:
+            self.notifications = OrderedDict()
+            self.notifications_deadline = None
+        else:
+            self.flushNotifications()
+
+        if experiment is not None:
+            experiment.status = experiment_status
+
+        def save():
+            server_job.save()
+
+            if experiment is not None:
+                experiment.save()
+                if clearNotifications:
+                    experiment.notifications.all().delete()
+
+        self.persist(save)
+
+    #---------------------------------------------------------------------------
+    # Change the status of the job
+    #---------------------------------------------------------------------------
+    def _setStatus(self, status):
+        previous = self.server_job.status
+        self.server_job.status = status
+
+        if self.job_list is not None:
+            self.job_list._onStatusChanged(self, previous)
+
 
 #-------------------------------------------------------------------------------
 # Holds a list of jobs
+#
+# The jobs are indexed by status and by command (in the order of the list), and
+# the deadlines of the delayed jobs are kept in a heap. The jobs tell the list
+# when their status or timeout change.
 #-------------------------------------------------------------------------------
 class JobList(object):
 
@@ -261,7 +424,15 @@ class JobList(object):
     #---------------------------------------------------------------------------
     def __init__(self, jobs_class=Job):
         self.jobs_class = jobs_class
-        self.jobs = []
+        self.jobs       = OrderedDict()     # job -> None
+        self.statuses   = {}                # status -> OrderedDict(job -> None)
+        self.commands   = {}                # command key -> OrderedDict(job -> None)
+        self.deadlines  = []                # Heap of (deadline, index, job)
+        self.clock      = 0                 # Number of seconds elapsed (see updateTimeouts())
+        self.counter    = 0                 # Used to order the jobs with the same deadline
+        self.clients    = {}                # file descriptor -> job
+        self.selector   = None              # See watch()
+        self.owner      = None              # See watch()
 
     #---------------------------------------------------------------------------
     # Returns the number of jobs in the list
@@ -270,7 +441,10 @@ class JobList(object):
     # @return           The number of jobs
     #---------------------------------------------------------------------------
     def count(self, status=None):
-        return len(self.getJobs(status))
+        if status is None:
+            return len(self.jobs)
+
+        return len(self.statuses.get(status, ()))
 
     #---------------------------------------------------------------------------
     # Indicates if a job of the list is already executing the given command
@@ -282,7 +456,7 @@ class JobList(object):
         if not(isinstance(command, Message)):
             command = Message.fromString(command)
 
-        return len(filter(lambda x: x.command.equals(command), self.jobs)) > 0
+        return len(self.commands.get(JobList._commandKey(command), ())) > 0
 
     #---------------------------------------------------------------------------
     # Add a new job to the list
@@ -295,7 +469,19 @@ class JobList(object):
     #---------------------------------------------------------------------------
     def addJob(self, server_job=None, command=None):
         job = self.jobs_class(server_job=server_job, command=command)
-        self.jobs.append(job)
+
+        timeout = job.timeout
+        job.job_list = self
+        job.deadline = None
+
+        self.jobs[job] = None
+        self.statuses.setdefault(job.server_job.status, OrderedDict())[job] = None
+        self.commands.setdefault(JobList._commandKey(job.command), OrderedDict())[job] = None
+
+        job.timeout = timeout
+
+        self._onClientChanged(job)
+
         return job
 
     #---------------------------------------------------------------------------
@@ -307,18 +493,21 @@ class JobList(object):
     # @return           The list of jobs
     #---------------------------------------------------------------------------
     def getJobs(self, status=None, command=None):
-        result = self.jobs
-
-        if status is not None:
-            result = filter(lambda x: x.server_job.status == status, result)
-
         if command is not None:
             if not(isinstance(command, Message)):
                 command = Message.fromString(command)
 
-            result = filter(lambda x: x.command.equals(command), result)
+            result = self.commands.get(JobList._commandKey(command), ())
 
-        return result
+            if status is not None:
+                return filter(lambda x: x.server_job.status == status, result)
+
+            return list(result)
+
+        if status is not None:
+            return list(self.statuses.get(status, ()))
+
+        return list(self.jobs)
 
     #---------------------------------------------------------------------------
     # Remove some jobs from the list
@@ -326,10 +515,24 @@ class JobList(object):
     # @param jobs   One job, or an array of jobs
     #---------------------------------------------------------------------------
     def removeJobs(self, jobs):
-        if isinstance(jobs, list):
-            self.jobs = filter(lambda x: x not in jobs, self.jobs)
-        else:
-            self.jobs.remove(jobs)
+        if not(isinstance(jobs, list)):
+            if jobs not in self.jobs:
+                raise ValueError('JobList.removeJobs(x): x not in list')
+
+            jobs = [jobs]
+
+        for job in filter(lambda x: x in self.jobs, jobs):
+            del self.jobs[job]
+            JobList._removeFromIndex(self.statuses, job.server_job.status, job)
+            JobList._removeFromIndex(self.commands, JobList._commandKey(job.command), job)
+
+            # The job keeps its remaining timeout, but not the clock of the list
+            timeout = job.timeout
+            job.job_list = None
+            job.deadline = None
+            job.timeout = timeout
+
+            self._unregisterClient(job)
 
     #---------------------------------------------------------------------------
     # Reschedule a job (put it at the end of the queue)
@@ -337,8 +540,15 @@ class JobList(object):
     # @param job    The job
     #---------------------------------------------------------------------------
     def rescheduleJob(self, job):
-        self.jobs.remove(job)
-        self.jobs.append(job)
+        if job not in self.jobs:
+            raise ValueError('JobList.rescheduleJob(x): x not in list')
+
+        del self.jobs[job]
+        self.jobs[job] = None
+
+        for index in (self.statuses[job.server_job.status], self.commands[JobList._commandKey(job.command)]):
+            del index[job]
+            index[job] = None
 
     #---------------------------------------------------------------------------
     # Returns the next timeout that must occurs
@@ -346,11 +556,12 @@ class JobList(object):
     # @return   The next timeout, or None
     #---------------------------------------------------------------------------
     def getNextTimeout(self):
-        jobs = self.getJobs(ServerJob.STATUS_DELAYED)
-        if len(jobs) == 0:
+        self._discardObsoleteDeadlines()
+
+        if len(self.deadlines) == 0:
             return None
 
-        return reduce(lambda x, y: min(x, y), map(lambda x: x.timeout, jobs))
+        return self.deadlines[0][0] - self.clock
 
     #---------------------------------------------------------------------------
     # Update the timeouts of all the delayed jobs of the list, return a list of
@@ -360,10 +571,136 @@ class JobList(object):
     # @return               The delayed jobs that must be executed again
     #---------------------------------------------------------------------------
     def updateTimeouts(self, elapsed):
-        delayed = self.getJobs(ServerJob.STATUS_DELAYED)
-        for job in delayed:
-            job.timeout -= elapsed
-            if job.timeout <= 0:
-                job.markAsScheduled()
+        self.clock += elapsed
+
+        result = []
+        while True:
+            self._discardObsoleteDeadlines()
+
+            if (len(self.deadlines) == 0) or (self.deadlines[0][0] > self.clock):
+                break
+
+            (deadline, index, job) = heapq.heappop(self.deadlines)
+            job.markAsScheduled()
+            result.append(job)
+
+        return filter(lambda x: x.server_job.status == ServerJob.STATUS_SCHEDULED, result)
+
+    #---------------------------------------------------------------------------
+    # Returns the jobs whose client uses one of the given file descriptors
+    #
+    # @param    file_descriptors    The file descriptors (or objects with a
+    #                               'fileno()' method, like sockets)
+    # @return                       The list of jobs
+    #---------------------------------------------------------------------------
+    def getJobsByFileDescriptors(self, file_descriptors):
+        result = []
+
+        for file_descriptor in file_descriptors:
+            if not(isinstance(file_descriptor, (int, long))):
+                file_descriptor = file_descriptor.fileno()
+
+            job = self.clients.get(file_descriptor)
+            if (job is not None) and (job.client is not None) and (job.client.socket is not None):
+                result.append(job)
+
+        return result
+
+    #---------------------------------------------------------------------------
+    # Register the sockets of the clients of the jobs (current and future ones)
+    # in a selector
+    #
+    # @param    selector    The selector (see utilities.selector.Selector)
+    # @param    owner       The owner of the list, the data registered with each
+    #                       socket is (owner, job)
+    #---------------------------------------------------------------------------
+    def watch(self, selector, owner):
+        self.selector = selector
+        self.owner = owner
+
+        for (file_descriptor, job) in self.clients.items():
+            self.selector.register(file_descriptor, (self.owner, job))
+
+    #---------------------------------------------------------------------------
+    # Called by a job of the list when its client changed
+    #---------------------------------------------------------------------------
+    def _onClientChanged(self, job):
+        self._unregisterClient(job)
+
+        if (job.client is None) or (job.client.socket is None):
+            return
+
+        job.descriptor = job.client.socket.fileno()
+        self.clients[job.descriptor] = job
+
+        if self.selector is not None:
+            self.selector.register(job.descriptor, (self.owner, job))
+
+    #---------------------------------------------------------------------------
+    # Stop to listen to the socket of the client of a job
+    #---------------------------------------------------------------------------
+    def _unregisterClient(self, job):
+        if job.descriptor is None:
+            return
+
+        if self.clients.get(job.descriptor) is job:
+            del self.clients[job.descriptor]
+
+            if self.selector is not None:
+                self.selector.unregister(job.descriptor)
+
+        job.descriptor = None
+
+    #---------------------------------------------------------------------------
+    # Called by a job of the list when its status changed
+    #---------------------------------------------------------------------------
+    def _onStatusChanged(self, job, previous):
+        if previous == job.server_job.status:
+            return
+
+        JobList._removeFromIndex(self.statuses, previous, job)
+        self.statuses.setdefault(job.server_job.status, OrderedDict())[job] = None
+
+        self._onTimeoutChanged(job)
+
+    #---------------------------------------------------------------------------
+    # Called by a job of the list when its timeout changed
+    #---------------------------------------------------------------------------
+    def _onTimeoutChanged(self, job):
+        if (job.deadline is not None) and (job.server_job.status == ServerJob.STATUS_DELAYED):
+            self.counter += 1
+            heapq.heappush(self.deadlines, (job.deadline, self.counter, job))
+
+    #---------------------------------------------------------------------------
+    # Remove the deadlines of the jobs that aren't delayed anymore (or whose
+    # timeout was modified) from the top of the heap
+    #---------------------------------------------------------------------------
+    def _discardObsoleteDeadlines(self):
+        while len(self.deadlines) > 0:
+            (deadline, index, job) = self.deadlines[0]
+            if (job.job_list is self) and (job.server_job.status == ServerJob.STATUS_DELAYED) and \
+               (job.deadline == deadline):
+                break
+
+            heapq.heappop(self.deadlines)
+
+    #---------------------------------------------------------------------------
+    # Remove a job from one of the indexes
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def _removeFromIndex(indexes, key, job):
+        index = indexes.get(key)
+        if (index is not None) and (job in index):
+            del index[job]
+            if len(index) == 0:
+                del indexes[key]
+
+    #---------------------------------------------------------------------------
+    # Returns the key of a command in the index
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def _commandKey(command):
+        if command.parameters is None:
+            return (command.name, ())
 
-        return filter(lambda x: x.server_job.status == ServerJob.STATUS_SCHEDULED, delayed)
+        return (command.name, tuple(command.parameters))
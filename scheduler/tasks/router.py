@@ -0,0 +1,142 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+from pymash import Message
+
+
+#-------------------------------------------------------------------------------
+# Convert the parameters of a message to the types expected by a task
+#
+# @param message    The message
+# @param format     List of the types of the parameters (see
+#                   Task.SUPPORTED_COMMANDS)
+# @return           The list of converted parameters
+#
+# Raises a ValueError if the parameters don't match the format.
+#-------------------------------------------------------------------------------
+def convertParameters(message, format):
+    parameters = message.parameters
+    if parameters is None:
+        parameters = []
+
+    if len(format) != len(parameters):
+        raise ValueError('Invalid number of arguments, expected %d, got message: %s' % \
+                         (len(format), message.toString()))
+
+    try:
+        return map(lambda (index, value): format[index](value), enumerate(parameters))
+    except:
+        raise ValueError("Invalid type of arguments, expected '%s', got message: %s" % \
+                         (str(format), message.toString()))
+
+
+#-------------------------------------------------------------------------------
+# Deliver the commands and events received by the scheduler to the tasks
+#
+# The routes are built once, when the tasks are loaded: a command is handed to
+# the first task accepting it, an event to all the tasks supporting it. The
+# parameters of a message are converted only once for all the tasks expecting
+# the same format.
+#-------------------------------------------------------------------------------
+class MessageRouter(object):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #
+    # @param outStream  The output stream to use
+    #---------------------------------------------------------------------------
+    def __init__(self, outStream):
+        self.outStream = outStream
+        self.routes    = {}     # message name -> (is_event, [tasks])
+        self.replays   = {}     # internal command name -> command name
+
+
+    #---------------------------------------------------------------------------
+    # Add the routes to a task
+    #
+    # @param task   The task
+    #---------------------------------------------------------------------------
+    def addTask(self, task):
+        for command in task.SUPPORTED_COMMANDS.keys():
+            self.routes.setdefault(command, (False, []))[1].append(task)
+
+        for event in task.SUPPORTED_EVENTS.keys():
+            self.routes.setdefault(event, (True, []))[1].append(task)
+
+        self.replays.update(task.INTERNAL_COMMANDS)
+
+
+    #---------------------------------------------------------------------------
+    # Deliver a message to the task(s) able to handle it
+    #
+    # @param message    The message
+    # @return           'False' if no task supports the message
+    #---------------------------------------------------------------------------
+    def route(self, message):
+        if message.name not in self.routes:
+            self.outStream.write('No task is able to handle the message\n')
+            return False
+
+        (is_event, tasks) = self.routes[message.name]
+
+        converted = {}      # format -> parameters (or None if invalid)
+
+        for task in tasks:
+            format = tuple(task.dataFormat(message.name))
+
+            if format not in converted:
+                try:
+                    converted[format] = convertParameters(message, format)
+                except ValueError, e:
+                    self.outStream.write('ERROR: %s\n' % str(e))
+                    converted[format] = None
+
+            parameters = converted[format]
+            if parameters is None:
+                continue
+
+            # Each task gets its own copy of the message
+            handled = task.processMessage(Message(message.name, list(parameters)), converted=True)
+
+            if handled and not(is_event):
+                break
+
+        return True
+
+
+    #---------------------------------------------------------------------------
+    # Returns the command to send to reschedule a job interrupted by a restart
+    # of the scheduler (the jobs created by a task for another one are
+    # rescheduled through the command of their parent, see
+    # Task.INTERNAL_COMMANDS)
+    #
+    # @param command    The command of the job
+    # @return           The command to send
+    #---------------------------------------------------------------------------
+    def replayedCommand(self, command):
+        if command.name in self.replays:
+            return Message(self.replays[command.name], command.parameters)
+
+        return command
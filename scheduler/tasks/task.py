@@ -31,21 +31,82 @@ from pymash import CommunicationChannel
 from pymash import Message
 from tasks.jobs import JobList
 from tasks.jobs import Job
+from tasks.router import convertParameters
 from utilities.logs import saveLogFile
+from utilities.connection_pool import ServerConnectionPool
+from utilities.timers import monotonicTime
 from mash.servers.models import Job as ServerJob
 from mash.servers.models import Alert
 from datetime import datetime
 from datetime import timedelta
+from functools import partial
 import os
 import string
 import traceback
 
 
+#-------------------------------------------------------------------------------
+# Period during which the events of one kind are coalesced (see
+# Task.coalesceEvent())
+#-------------------------------------------------------------------------------
+class CoalescingWindow(object):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #
+    # @param delay      Number of seconds without event after which the window
+    #                   is closed
+    # @param max_delay  Maximum number of seconds before the window is closed
+    # @param clock      (Optional) The function returning the current time
+    #---------------------------------------------------------------------------
+    def __init__(self, delay, max_delay, clock=monotonicTime):
+        now = clock()
+
+        self.clock        = clock
+        self.delay        = delay
+        self.deadline     = now + delay
+        self.max_deadline = now + max_delay
+        self.nb_events    = 0
+        self.parameters   = []
+
+
+    #---------------------------------------------------------------------------
+    # Add the parameters of an event received during the window (each distinct
+    # value is kept once)
+    #---------------------------------------------------------------------------
+    def add(self, parameters):
+        self.nb_events += 1
+
+        if parameters is not None:
+            for parameter in parameters:
+                if parameter not in self.parameters:
+                    self.parameters.append(parameter)
+
+        self.deadline = min(self.clock() + self.delay, self.max_deadline)
+
+
+    #---------------------------------------------------------------------------
+    # Returns the number of seconds before the end of the window
+    #---------------------------------------------------------------------------
+    def getTimeout(self):
+        return max(self.deadline - self.clock(), 0)
+
+
 #-------------------------------------------------------------------------------
 # Represents a task, responsible to perform jobs of a particular type
 #-------------------------------------------------------------------------------
 class Task(object):
-    
+
+    # Events coalesced when received in bursts: event name -> (delay, maximum
+    # delay), in seconds (see coalesceEvent()). Only the events with one
+    # parameter can be coalesced.
+    COALESCED_EVENTS = {}
+
+    # Commands of the jobs created by the task itself (never received from the
+    # clients): command name -> name of the command to send instead to
+    # reschedule the job after a restart of the scheduler (see MessageRouter)
+    INTERNAL_COMMANDS = {}
+
     #---------------------------------------------------------------------------
     # Constructor
     #---------------------------------------------------------------------------
@@ -53,11 +114,16 @@ class Task(object):
         (self.channel, self.out_channel) = CommunicationChannel.create(
                                                 CommunicationChannel.CHANNEL_TYPE_SIMPLEX)
 
-        self.start_time  = datetime.now()
-        self.jobs        = JobList()
-        self.new_jobs    = []
-        self.nb_max_jobs = 20
-        self.outStream   = OutStream()
+        self.start_time      = datetime.now()
+        self.jobs            = JobList()
+        self.new_jobs        = []
+        self.nb_max_jobs     = 20
+        self.outStream       = OutStream()
+        self.connection_pool = ServerConnectionPool.instance()
+        self.event_windows   = {}       # Event name -> CoalescingWindow
+        self.clock           = monotonicTime    # Clock of the coalescing windows
+
+        self.checkCoalescedEvents()
         
         self.outStream.open('Task %s' % self.__class__.__name__,
                             'logs/task-%s-$TIMESTAMP.log' % self.__class__.__name__.lower())
@@ -99,6 +165,18 @@ class Task(object):
         timeout = self.jobs.getNextTimeout()
         if (timeout is None) and (self.jobs.count(ServerJob.STATUS_SCHEDULED) > 0):
             timeout = 60
+
+        # The notifications of the running jobs must be saved in time
+        for job in self.jobs.getJobs(ServerJob.STATUS_RUNNING):
+            notifications_timeout = job.getNotificationsTimeout()
+            if (notifications_timeout is not None) and ((timeout is None) or (notifications_timeout < timeout)):
+                timeout = notifications_timeout
+
+        # The coalesced events must be processed in time
+        for window in filter(lambda x: x.nb_events > 0, self.event_windows.values()):
+            window_timeout = window.getTimeout()
+            if (timeout is None) or (window_timeout < timeout):
+                timeout = window_timeout
         
         return timeout
 
@@ -115,6 +193,46 @@ class Task(object):
         return file_descriptors
     
     
+    #---------------------------------------------------------------------------
+    # Register the file descriptors that we must listen to for this task in a
+    # selector (see utilities.selector.Selector), with (task, channel) or
+    # (task, job) as data
+    #
+    # Unlike getFileDescriptors(), this is done once: the sockets of the jobs
+    # are registered and unregistered when their client changes
+    #---------------------------------------------------------------------------
+    def watch(self, selector):
+        selector.register(self.out_channel.readPipe, (self, self.out_channel))
+        self.jobs.watch(selector, self)
+
+
+    #---------------------------------------------------------------------------
+    # Update the timeouts of the delayed jobs, without processing any event
+    # (the jobs whose timeout occurred are run by 'processNewJobs()')
+    #
+    # @param elapsed    The number of seconds elapsed
+    #---------------------------------------------------------------------------
+    def updateTimeouts(self, elapsed):
+        if elapsed > 0:
+            self.new_jobs.extend(self.jobs.updateTimeouts(elapsed))
+
+        self.flushNotifications()
+        self.flushEvents()
+
+
+    #---------------------------------------------------------------------------
+    # Save the notifications of the running jobs that were kept in memory for
+    # too long (see Job.setNotification())
+    #
+    # @param force  If 'True', save all the notifications
+    #---------------------------------------------------------------------------
+    def flushNotifications(self, force=False):
+        for job in self.jobs.getJobs(ServerJob.STATUS_RUNNING):
+            timeout = job.getNotificationsTimeout()
+            if (timeout is not None) and (force or (timeout <= 0)):
+                job.flushNotifications()
+
+
     #---------------------------------------------------------------------------
     # Called when an event happened on one of the file descriptors reported by
     # getFileDescriptors(), or in case of timeout
@@ -143,8 +261,8 @@ class Task(object):
 
         # Process the responses from the clients of the running jobs
         nb_jobs_done = 0
-        running_jobs = filter(lambda x: x.client is not None, self.jobs.getJobs(ServerJob.STATUS_RUNNING))
-        jobs = filter(lambda x: x.client.socket in ready_to_read, running_jobs)
+        jobs = filter(lambda x: x.server_job.status == ServerJob.STATUS_RUNNING,
+                      self.jobs.getJobsByFileDescriptors(ready_to_read))
         for job in jobs:
             while True:
                 self._processJob(job)
@@ -153,7 +271,9 @@ class Task(object):
                     nb_jobs_done += 1
                     break
 
-                if not(job.client.hasResponse()):
+                # The job might have released its client (for instance, to
+                # wait for other jobs)
+                if (job.client is None) or not(job.client.hasResponse()):
                     break
 
         # Attempt to run as many currently scheduled jobs as just finished
@@ -167,15 +287,81 @@ class Task(object):
                 if nb_jobs_running == nb_max_jobs:
                     break
 
+        self.flushNotifications()
+        self.flushEvents()
+
+
+    #---------------------------------------------------------------------------
+    # Handle an event listed in COALESCED_EVENTS
+    #
+    # The first event of a burst is processed immediately, and opens a window
+    # during which the following events of the same kind are only recorded.
+    # When no event was received during 'delay' seconds (or after 'maximum
+    # delay' seconds), the recorded events are processed once per distinct
+    # value of their parameter (see flushEvents()).
+    #
+    # @param event  The event
+    # @return       None, or a list of new jobs (already in the jobs list)
+    #---------------------------------------------------------------------------
+    def coalesceEvent(self, event):
+        window = self.event_windows.get(event.name)
+
+        if (window is not None) and (window.nb_events == 0) and (window.getTimeout() <= 0):
+            window = None
+
+        if window is not None:
+            window.add(event.parameters)
+            self.outStream.write('Event coalesced with %d other(s)\n' % (window.nb_events - 1))
+            return None
+
+        (delay, max_delay) = self.COALESCED_EVENTS[event.name]
+        self.event_windows[event.name] = CoalescingWindow(delay, max_delay, self.clock)
+
+        return self.onEventReceived(event)
+
+
+    #---------------------------------------------------------------------------
+    # Process the coalesced events whose window is over (see coalesceEvent())
+    #---------------------------------------------------------------------------
+    def flushEvents(self):
+        for (name, window) in self.event_windows.items():
+            if window.getTimeout() > 0:
+                continue
+
+            del self.event_windows[name]
+
+            if window.nb_events == 0:
+                continue
+
+            # The processing of the coalesced events opens a new window
+            (delay, max_delay) = self.COALESCED_EVENTS[name]
+            self.event_windows[name] = CoalescingWindow(delay, max_delay, self.clock)
+
+            self.outStream.write('Processing %d coalesced events: %s\n' % \
+                                 (window.nb_events, Message(name, window.parameters).toString()))
+
+            for parameter in window.parameters:
+                event = Message(name, [parameter])
+
+                try:
+                    jobs = self.onEventReceived(event)
+                    if jobs is not None:
+                        self.new_jobs.extend(jobs)
+                except:
+                    self._reportPreparationError(event)
+
 
     #---------------------------------------------------------------------------
     # Ask the task to handle the provided message
     #
     # @param    message     The message
+    # @param    converted   Indicates if the parameters of the message were
+    #                       already converted to the expected types (see
+    #                       MessageRouter)
     # @return               A boolean indicating if the task is handling the
     #                       message
     #---------------------------------------------------------------------------
-    def processMessage(self, message):
+    def processMessage(self, message, converted=False):
 
         # Check if the task can handle the message
         if not(isinstance(message, Message)):
@@ -186,24 +372,15 @@ class Task(object):
             return False
 
         # Check that the format of the message is correct
-        format = self.dataFormat(message.name)
-        
-        parameters = message.parameters
-        if parameters is None:
-            parameters = []
-
-        if len(format) != len(parameters):
-            self.outStream.write('ERROR: Invalid number of arguments, expected %d, ' \
-                                 'got message: %s\n' % (len(format), message.toString()))
-            return False
+        if not(converted):
+            try:
+                parameters = convertParameters(message, self.dataFormat(message.name))
+            except ValueError, e:
+                self.outStream.write('ERROR: %s\n' % str(e))
+                return False
 
-        try:
             if message.parameters is not None:
-                message.parameters = map(lambda (index, value): format[index](value), enumerate(message.parameters))
-        except:
-            self.outStream.write("ERROR: Invalid type of arguments, expected '%s', " \
-                                 "got message: %s\n" % (str(format), message.toString()))
-            return False
+                message.parameters = parameters
 
         # Determine if the message is a command or an event
         try:
@@ -217,25 +394,39 @@ class Task(object):
                     self.new_jobs.append(job)
             else:
                 self.outStream.write('Got event: %s\n' % message.toString())
-                jobs = self.onEventReceived(message)
+
+                if message.name in self.COALESCED_EVENTS:
+                    jobs = self.coalesceEvent(message)
+                else:
+                    jobs = self.onEventReceived(message)
+
                 if jobs is not None:
                     for job in jobs:
                         self.new_jobs.append(job)
         except:
-            self.outStream.write('Exception during the preparation of a job:\n')
-            details = traceback.format_exc()
-            self.outStream.write(details + "\n")
+            self._reportPreparationError(message)
 
-            subject = '[MASH ALERT] Exception during the preparation of a job'
-            content = 'Message: %s\n\n%s' % (message.toString(), details)
+        return True
 
-            try:
-                send_mail(subject, content, settings.DEFAULT_FROM_EMAIL,
-                          [ admin[1] for admin in settings.ADMINS ])
-            except:
-                pass
 
-        return True
+    #---------------------------------------------------------------------------
+    # Report the exception that occurred during the preparation of a job
+    #
+    # @param message    The command or event
+    #---------------------------------------------------------------------------
+    def _reportPreparationError(self, message):
+        self.outStream.write('Exception during the preparation of a job:\n')
+        details = traceback.format_exc()
+        self.outStream.write(details + "\n")
+
+        subject = '[MASH ALERT] Exception during the preparation of a job'
+        content = 'Message: %s\n\n%s' % (message.toString(), details)
+
+        try:
+            send_mail(subject, content, settings.DEFAULT_FROM_EMAIL,
+                      [ admin[1] for admin in settings.ADMINS ])
+        except:
+            pass
 
 
     #---------------------------------------------------------------------------
@@ -305,73 +496,85 @@ class Task(object):
 
         elif job.server_job.status == ServerJob.STATUS_DONE:
             self.outStream.write('Result: the job is done\n')
-            self.jobs.removeJobs(job)
+            self.jobs.removeJobs([job])    # Might already be done by the task
             del job
 
         elif job.server_job.status == ServerJob.STATUS_FAILED:
             self.outStream.write('Result: the job has failed\n')
-            self.jobs.removeJobs(job)
+            self.jobs.removeJobs([job])
 
-            alert = job.alert()
-            if alert is not None:
+            # Report the failure once all the database operations of the job
+            # are done
+            job.persist(callback=partial(self._reportFailure, job))
 
-                # Dump the output stream of the task in a log file
-                if job.server_job.logs is not None:
-                    saveLogFile(job.server_job.logs, '%s.log' % self.__class__.__name__, self.outStream.dump())
+            del job
+
+
+    #---------------------------------------------------------------------------
+    # Report the failure of a job to the administrators (if an alert was
+    # raised)
+    #
+    # @param job    The job
+    #---------------------------------------------------------------------------
+    def _reportFailure(self, job):
+        alert = job.alert()
+        if alert is not None:
 
-                # If not already done, send a mail to the administrators about the problem
-                if not(job.mail_sent):
-                    subject = '[MASH ALERT] ' + alert.message
+            # Dump the output stream of the task in a log file
+            if job.server_job.logs is not None:
+                saveLogFile(job.server_job.logs, '%s.log' % self.__class__.__name__, self.outStream.dump())
 
-                    message = ''
-                    if alert.details is not None:
-                        message = alert.details + '\n\n'
+            # If not already done, send a mail to the administrators about the problem
+            if not(job.mail_sent):
+                subject = '[MASH ALERT] ' + alert.message
 
-                    message += 'Job ID: %d\nCommand: %s\n' % (job.server_job.id, job.command.toString())
+                message = ''
+                if alert.details is not None:
+                    message = alert.details + '\n\n'
 
-                    if job.server_job.heuristic_version is not None:
-                        message += 'Heuristic version: %s/heuristics/v%d/\n' % (settings.SECURED_WEBSITE_URL_DOMAIN, job.server_job.heuristic_version.id)
+                message += 'Job ID: %d\nCommand: %s\n' % (job.server_job.id, job.command.toString())
 
-                    if job.server_job.experiment is not None:
-                        message += 'Experiment: %s/experiments/%d/\n' % (settings.SECURED_WEBSITE_URL_DOMAIN, job.server_job.experiment.id)
+                if job.server_job.heuristic_version is not None:
+                    message += 'Heuristic version: %s/heuristics/v%d/\n' % (settings.SECURED_WEBSITE_URL_DOMAIN, job.server_job.heuristic_version.id)
 
-                    if job.server_job.logs is not None:
-                        for log_file in job.server_job.logs.files.all():
-                            try:
-                                message += '\n\n' + '-' * 80 + '\n'
-                                message += log_file.file
+                if job.server_job.experiment is not None:
+                    message += 'Experiment: %s/experiments/%d/\n' % (settings.SECURED_WEBSITE_URL_DOMAIN, job.server_job.experiment.id)
 
-                                in_file = open(os.path.join(settings.LOG_FILES_ROOT, job.server_job.logs.folder, log_file.file), 'r')
-                                in_file.seek(0, os.SEEK_END)
+                if job.server_job.logs is not None:
+                    for log_file in job.server_job.logs.files.all():
+                        try:
+                            message += '\n\n' + '-' * 80 + '\n'
+                            message += log_file.file
 
-                                size = in_file.tell()
+                            in_file = open(os.path.join(settings.LOG_FILES_ROOT, job.server_job.logs.folder, log_file.file), 'r')
+                            in_file.seek(0, os.SEEK_END)
 
-                                if size > 10 * 1024:
-                                    message += ' (truncated)'
-                                    in_file.seek(-10 * 1024, os.SEEK_END)
-                                else:
-                                    in_file.seek(0, os.SEEK_SET)
+                            size = in_file.tell()
 
-                                message += '\n\n'
+                            if size > 10 * 1024:
+                                message += ' (truncated)'
+                                in_file.seek(-10 * 1024, os.SEEK_END)
+                            else:
+                                in_file.seek(0, os.SEEK_SET)
 
-                                if size > 10 * 1024:
-                                    content = in_file.read(10 * 1024)
-                                    message += '...\n' + content
-                                else:
-                                    content = in_file.read()
-                                    message += content
+                            message += '\n\n'
 
-                                in_file.close()
-                            except:
-                                pass
+                            if size > 10 * 1024:
+                                content = in_file.read(10 * 1024)
+                                message += '...\n' + content
+                            else:
+                                content = in_file.read()
+                                message += content
 
-                        try:
-                            send_mail(subject, message, settings.DEFAULT_FROM_EMAIL,
-                                      [ admin[1] for admin in settings.ADMINS ])
+                            in_file.close()
                         except:
                             pass
 
-            del job
+                    try:
+                        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL,
+                                  [ admin[1] for admin in settings.ADMINS ])
+                    except:
+                        pass
 
 
     #_____ Methods to implement __________
@@ -441,4 +644,16 @@ class Task(object):
     #---------------------------------------------------------------------------
     @classmethod
     def isCommand(cls, message_name):
-        return (message_name in cls.SUPPORTED_COMMANDS.keys())
+        return (message_name in cls.SUPPORTED_COMMANDS)
+
+
+    #---------------------------------------------------------------------------
+    # Class method checking that the coalesced events of the task have exactly
+    # one parameter (raises a ValueError otherwise)
+    #---------------------------------------------------------------------------
+    @classmethod
+    def checkCoalescedEvents(cls):
+        for name in cls.COALESCED_EVENTS.keys():
+            format = cls.dataFormat(name)
+            if (format is None) or (len(format) != 1):
+                raise ValueError("The event '%s' can't be coalesced, it hasn't exactly one parameter" % name)
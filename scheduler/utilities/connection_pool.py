@@ -0,0 +1,371 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+from pymash import Client
+from pymash import Message
+from pymash import NetworkUtils
+import socket
+import select
+import errno
+import time
+
+
+#-------------------------------------------------------------------------------
+# Pool of connections to the servers of the farm, shared by all the tasks of the
+# scheduler
+#
+# The pool keeps the connections to the servers that answered 'READY' to the
+# 'STATUS' command but aren't used by a job (yet), so the tasks don't need to
+# establish a new connection (and ask the status) to each server each time they
+# look for a free one. The connections are indexed by (address, port).
+#
+# The servers without an idle connection are all contacted at once (see
+# probe()), and the ones that don't answer in time are ignored, so a server
+# that hangs can't block the scheduler.
+#
+# When a job is done with a server (see done()), its connection goes back to
+# the pool: the 'STATUS' command is sent right away, and the answer is checked
+# (without waiting for it) when the connection is handed to another job. The
+# connections of the jobs that failed are closed.
+#
+# The pool never blocks on an idle connection: the ones that were idle for too
+# long, or whose server didn't answer 'READY' yet, are closed and their servers
+# contacted again with the other ones.
+#-------------------------------------------------------------------------------
+class ServerConnectionPool(object):
+
+    # Constants
+    MAX_IDLE_TIME = 60      # Time (in seconds) after which an idle connection
+                            # isn't trusted anymore
+    PROBE_TIMEOUT = 10      # Maximum time (in seconds) allowed to a server to
+                            # accept a connection and answer to 'STATUS'
+
+    # The pool shared by all the tasks
+    _instance = None
+
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #---------------------------------------------------------------------------
+    def __init__(self):
+        self.idle    = {}       # (address, port) -> (client, timestamp)
+        self.owners  = {}       # client -> (address, port)
+        self.pending = set()    # Idle clients waiting for the answer to 'STATUS'
+
+
+    #---------------------------------------------------------------------------
+    # Returns the pool shared by all the tasks of the scheduler
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def instance():
+        if ServerConnectionPool._instance is None:
+            ServerConnectionPool._instance = ServerConnectionPool()
+
+        return ServerConnectionPool._instance
+
+
+    #---------------------------------------------------------------------------
+    # Returns a connection to a server of the list which is ready
+    #
+    # @param servers    The servers
+    # @param outStream  (Optional) The output stream to use with the connection
+    # @return           (server, client), or (None, None) if no server is ready
+    #
+    # The servers with an idle connection are returned first, the others are
+    # contacted at once: the first one to answer 'READY' is returned (the
+    # connections to the other ones which answered at the same time are kept in
+    # the pool).
+    #---------------------------------------------------------------------------
+    def acquire(self, servers, outStream=None):
+        for server in servers:
+            client = self._takeIdleConnection((server.address, server.port), outStream)
+            if client is not None:
+                return (server, client)
+
+        ready = self.probe(servers, outStream=outStream, first=True)
+        if len(ready) == 0:
+            return (None, None)
+
+        for (server, client) in ready[1:]:
+            self.release(client)
+
+        return ready[0]
+
+
+    #---------------------------------------------------------------------------
+    # Contact all the servers of the list at once
+    #
+    # @param servers        The servers
+    # @param outStream      (Optional) The output stream to use with the
+    #                       connections
+    # @param checkStatus    If 'False', only check that the servers accept the
+    #                       connection (no 'STATUS' command sent)
+    # @param timeout        (Optional) Maximum time to wait for the servers
+    #                       (by default: PROBE_TIMEOUT)
+    # @param first          If 'True', stop as soon as a server answered
+    # @return               List of (server, client) of the servers that
+    #                       answered in time (and are ready), by order of answer
+    #
+    # The connections returned aren't in the pool: they must be given to a job,
+    # or to release() or discard().
+    #---------------------------------------------------------------------------
+    def probe(self, servers, outStream=None, checkStatus=True, timeout=None, first=False):
+        servers = dict(map(lambda x: ((x.address, x.port), x), servers))
+
+        return map(lambda (key, client): (servers[key], client),
+                   self._probe(servers.keys(), outStream, checkStatus, timeout, first))
+
+
+    #---------------------------------------------------------------------------
+    # Gives back a connection which wasn't used by the job (only 'STATUS' or
+    # 'INFO' commands sent), so it can be handed to another one
+    #
+    # @param client     The client
+    #---------------------------------------------------------------------------
+    def release(self, client):
+        key = self.owners.get(client)
+
+        if (key is None) or (key in self.idle) or not(self._isAlive(client)):
+            self.discard(client)
+            return
+
+        client.outStream = None
+        self.idle[key] = (client, time.time())
+
+
+    #---------------------------------------------------------------------------
+    # Gives back the connection of a job which is done with the server, so it
+    # can be handed to another one
+    #
+    # @param client     The client
+    #
+    # The server is asked for its status at once, its answer is checked by the
+    # next acquire() (see _takeIdleConnection())
+    #---------------------------------------------------------------------------
+    def done(self, client):
+        key = self.owners.get(client)
+
+        if (key is None) or (key in self.idle) or not(self._isAlive(client)) or \
+           not(client.sendCommand('STATUS')):
+            self.discard(client)
+            return
+
+        client.outStream = None
+        self.pending.add(client)
+        self.idle[key] = (client, time.time())
+
+
+    #---------------------------------------------------------------------------
+    # Close a connection, without keeping it in the pool
+    #
+    # @param client     The client
+    #---------------------------------------------------------------------------
+    def discard(self, client):
+        if client.socket is not None:
+            client.sendCommand('DONE')
+            client.close()
+
+        if client in self.owners:
+            del self.owners[client]
+
+        self.pending.discard(client)
+
+
+    #---------------------------------------------------------------------------
+    # Close all the idle connections
+    #---------------------------------------------------------------------------
+    def clear(self):
+        for (client, timestamp) in self.idle.values():
+            self.discard(client)
+
+        self.idle = {}
+
+
+    #_____ Internal methods __________
+
+    def _probe(self, keys, outStream=None, checkStatus=True, timeout=None, first=False):
+        if timeout is None:
+            timeout = ServerConnectionPool.PROBE_TIMEOUT
+
+        deadline = time.time() + timeout
+
+        probes  = {}        # socket -> (key, client)
+        writing = []        # Sockets not connected yet
+        reading = []        # Sockets waiting for the answer to 'STATUS'
+        result  = []
+
+        def drop(s, reason):
+            (key, client) = probes.pop(s)
+            if outStream is not None:
+                outStream.write("    '%s:%d': %s\n" % (key[0], key[1], reason))
+            client.close()
+
+        # Start to connect to all the servers at once
+        for key in keys:
+            if outStream is not None:
+                outStream.write("    Contacting '%s:%d'...\n" % key)
+
+            client = Client(outStream=outStream)
+            client.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            client.socket.setblocking(0)
+            probes[client.socket] = (key, client)
+
+            try:
+                error = client.socket.connect_ex(key)
+            except socket.error, e:
+                error = e.errno
+
+            if error in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                writing.append(client.socket)
+            else:
+                drop(client.socket, 'failed to connect')
+
+        # Wait for the connections and the answers
+        while ((len(writing) > 0) or (len(reading) > 0)) and not(first and (len(result) > 0)):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+
+            ready_to_read, ready_to_write, in_error = select.select(reading, writing, [], remaining)
+
+            for s in ready_to_write:
+                writing.remove(s)
+
+                if s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0:
+                    drop(s, 'failed to connect')
+                    continue
+
+                if not(checkStatus):
+                    s.setblocking(1)
+                    (key, client) = probes.pop(s)
+                    result.append((key, client))
+                    continue
+
+                try:
+                    s.send(NetworkUtils.encodeMessage(Message('STATUS')))
+                    reading.append(s)
+                except socket.error:
+                    drop(s, 'failed to send the STATUS command')
+
+            for s in ready_to_read:
+                (key, client) = probes[s]
+
+                try:
+                    received = client.buffer.receive(s)
+                except socket.error:
+                    received = 0
+
+                if received <= 0:
+                    reading.remove(s)
+                    drop(s, 'connection closed')
+                    continue
+
+                response = NetworkUtils.extractMessage(client.buffer)
+                if response is None:
+                    continue
+
+                reading.remove(s)
+
+                if response.name != 'READY':
+                    drop(s, response.toString())
+                    continue
+
+                s.setblocking(1)
+                probes.pop(s)
+                self.owners[client] = key
+                result.append((key, client))
+
+        # The servers that didn't answer (in time) are ignored
+        for s in probes.keys():
+            drop(s, 'no answer')
+
+        return result
+
+
+    def _takeIdleConnection(self, key, outStream):
+        if key not in self.idle:
+            return None
+
+        (client, timestamp) = self.idle.pop(key)
+
+        if client in self.pending:
+            self.pending.remove(client)
+            alive = self._isReady(client)
+        else:
+            alive = self._isAlive(client)
+
+        if not(alive):
+            self.discard(client)
+            return None
+
+        # Don't wait for the server to confirm its status: the connection is
+        # dropped, and the server contacted again with the other ones
+        if time.time() - timestamp > ServerConnectionPool.MAX_IDLE_TIME:
+            self.discard(client)
+            return None
+
+        client.outStream = outStream
+
+        if outStream is not None:
+            outStream.write("    Using the idle connection to '%s:%d'\n" % key)
+
+        return client
+
+
+    def _isAlive(self, client):
+        if (client.socket is None) or (len(client.buffer) > 0):
+            return False
+
+        # An idle connection must not receive anything: if the socket is
+        # readable, the server closed it (or is in an unexpected state)
+        try:
+            ready_to_read, ready_to_write, in_error = select.select([client.socket], [], [client.socket], 0)
+        except Exception:
+            return False
+
+        return (len(ready_to_read) == 0) and (len(in_error) == 0)
+
+
+    def _isReady(self, client):
+        if client.socket is None:
+            return False
+
+        # Retrieve the answer to 'STATUS' if it is already there, without
+        # waiting for it
+        try:
+            ready_to_read, ready_to_write, in_error = select.select([client.socket], [], [client.socket], 0)
+            if (len(ready_to_read) == 0) or (len(in_error) > 0):
+                return False
+
+            if client.buffer.receive(client.socket) <= 0:
+                return False
+        except Exception:
+            return False
+
+        response = NetworkUtils.extractMessage(client.buffer, framed=client.framed)
+        if (response is None) or (response.name != 'READY'):
+            return False
+
+        return self._isAlive(client)
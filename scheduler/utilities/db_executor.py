@@ -0,0 +1,364 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+from collections import deque
+import threading
+import Queue
+import traceback
+import fcntl
+import errno
+import os
+
+try:
+    from django.db import connection
+    from django.db import transaction
+    from django.db.models import AutoField
+    from django.db.models.signals import pre_save
+    from django.db.models.signals import post_save
+except ImportError:
+    connection = None
+
+
+#-------------------------------------------------------------------------------
+# Executes the database operations of the jobs of the scheduler (state
+# transitions, results, notifications, ...) outside of the loop of the
+# scheduler
+#
+# The operations are executed by a bounded pool of threads, each one with its
+# own connection to the database (the connections of Django are per-thread).
+# The operations submitted with the same key (usually a job) are executed one
+# after the other, in the order of submission. Those with different keys can be
+# executed concurrently.
+#
+# An operation can have a callback, called from the loop of the scheduler once
+# the operation is done (see processCompletions()): the loop listens to the
+# read end of a pipe (see fileDescriptor()), written by the threads each time an
+# operation is done.
+#
+# Without threads (the default), the operations and their callbacks are executed
+# immediately (and their exceptions are propagated to the caller).
+#-------------------------------------------------------------------------------
+class DatabaseExecutor(object):
+
+    # The executor shared by all the tasks
+    _instance = None
+
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #
+    # @param nbWorkers  Number of threads executing the operations (0: the
+    #                   operations are executed immediately)
+    # @param outStream  (Optional) The output stream used to report the errors
+    #---------------------------------------------------------------------------
+    def __init__(self, nbWorkers=0, outStream=None):
+        self.outStream   = outStream
+        self.lock        = threading.Lock()
+        self.idle        = threading.Condition(self.lock)
+        self.pending     = {}               # key -> deque of (function, callback)
+        self.queue       = Queue.Queue()    # Keys with an operation ready to execute
+        self.completions = []               # Callbacks to call from the loop
+        self.workers     = []
+        self.readPipe    = None
+        self.writePipe   = None
+
+        if nbWorkers > 0:
+            (self.readPipe, self.writePipe) = os.pipe()
+            flags = fcntl.fcntl(self.readPipe, fcntl.F_GETFL)
+            fcntl.fcntl(self.readPipe, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+            for i in range(nbWorkers):
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+
+
+    #---------------------------------------------------------------------------
+    # Returns the executor shared by all the tasks of the scheduler
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def instance():
+        if DatabaseExecutor._instance is None:
+            DatabaseExecutor._instance = DatabaseExecutor()
+
+        return DatabaseExecutor._instance
+
+
+    #---------------------------------------------------------------------------
+    # Replace the executor shared by all the tasks of the scheduler
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def setInstance(executor):
+        DatabaseExecutor._instance = executor
+
+
+    #---------------------------------------------------------------------------
+    # Submit an operation
+    #
+    # @param key        The key of the operation (the operations with the same
+    #                   key are executed in order)
+    # @param function   (Optional) The function to execute, without argument
+    # @param callback   (Optional) The function to call from the loop of the
+    #                   scheduler once the operation (and the ones submitted
+    #                   before with the same key) is done
+    #---------------------------------------------------------------------------
+    def submit(self, key, function=None, callback=None):
+        if len(self.workers) == 0:
+            if function is not None:
+                function()
+            if callback is not None:
+                callback()
+            return
+
+        self.lock.acquire()
+        try:
+            if key in self.pending:
+                self.pending[key].append((function, callback))
+            else:
+                self.pending[key] = deque([(function, callback)])
+                self.queue.put(key)
+        finally:
+            self.lock.release()
+
+
+    #---------------------------------------------------------------------------
+    # Returns the file descriptor that becomes readable when some operations
+    # are done, or None if the operations are executed immediately
+    #---------------------------------------------------------------------------
+    def fileDescriptor(self):
+        return self.readPipe
+
+
+    #---------------------------------------------------------------------------
+    # Indicates if some operations are still pending
+    #---------------------------------------------------------------------------
+    def isBusy(self):
+        self.lock.acquire()
+        try:
+            return (len(self.pending) > 0) or (len(self.completions) > 0)
+        finally:
+            self.lock.release()
+
+
+    #---------------------------------------------------------------------------
+    # Call the callbacks of the operations that are done, must be called from
+    # the loop of the scheduler
+    #
+    # @return   The number of callbacks called
+    #---------------------------------------------------------------------------
+    def processCompletions(self):
+        if self.readPipe is not None:
+            try:
+                while len(os.read(self.readPipe, 4096)) > 0:
+                    pass
+            except OSError, e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+
+        self.lock.acquire()
+        try:
+            completions = self.completions
+            self.completions = []
+        finally:
+            self.lock.release()
+
+        for callback in completions:
+            try:
+                callback()
+            except:
+                self._reportError('Exception in the callback of a database operation')
+
+        return len(completions)
+
+
+    #---------------------------------------------------------------------------
+    # Wait for all the pending operations to be done, call their callbacks and
+    # stop the threads
+    #---------------------------------------------------------------------------
+    def shutdown(self):
+        self.lock.acquire()
+        try:
+            while len(self.pending) > 0:
+                self.idle.wait()
+        finally:
+            self.lock.release()
+
+        for worker in self.workers:
+            self.queue.put(None)
+
+        for worker in self.workers:
+            worker.join()
+
+        self.workers = []
+
+        self.processCompletions()
+
+        if self.readPipe is not None:
+            os.close(self.readPipe)
+            os.close(self.writePipe)
+            self.readPipe = None
+            self.writePipe = None
+
+
+    #---------------------------------------------------------------------------
+    # Main function of the threads
+    #---------------------------------------------------------------------------
+    def _work(self):
+        try:
+            while True:
+                key = self.queue.get()
+                if key is None:
+                    break
+
+                self.lock.acquire()
+                (function, callback) = self.pending[key][0]
+                self.lock.release()
+
+                self._execute(function)
+
+                # Let the next operation with the same key (if any) be executed
+                self.lock.acquire()
+                try:
+                    operations = self.pending[key]
+                    operations.popleft()
+                    if len(operations) > 0:
+                        self.queue.put(key)
+                    else:
+                        del self.pending[key]
+                        if len(self.pending) == 0:
+                            self.idle.notifyAll()
+
+                    if callback is not None:
+                        self.completions.append(callback)
+                finally:
+                    self.lock.release()
+
+                if callback is not None:
+                    try:
+                        os.write(self.writePipe, 'x')
+                    except OSError:
+                        pass
+        finally:
+            if connection is not None:
+                connection.close()
+
+
+    #---------------------------------------------------------------------------
+    # Execute an operation, the errors are reported but not propagated
+    #---------------------------------------------------------------------------
+    def _execute(self, function):
+        if function is None:
+            return
+
+        try:
+            function()
+        except:
+            self._reportError('Exception during a database operation')
+
+
+    def _reportError(self, message):
+        if self.outStream is not None:
+            self.outStream.write('%s:\n%s\n' % (message, traceback.format_exc()))
+
+
+#-------------------------------------------------------------------------------
+# Insert several new instances of a model in the database, with one multi-row
+# INSERT statement
+#
+# @param instances  The instances (all of the same model)
+#
+# Unlike save(), the primary keys of the instances aren't retrieved. If some
+# receivers are connected to the 'pre_save' or 'post_save' signals of the model,
+# the instances are saved one by one instead, so the signals are sent
+#-------------------------------------------------------------------------------
+def bulkInsert(instances):
+    if len(instances) == 0:
+        return
+
+    model = instances[0].__class__
+
+    if _hasReceivers(pre_save, model) or _hasReceivers(post_save, model):
+        for instance in instances:
+            instance.save()
+        return
+
+    meta = model._meta
+    fields = filter(lambda x: not(isinstance(x, AutoField)), meta.fields)
+
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (connection.ops.quote_name(meta.db_table),
+                                              ', '.join(map(lambda x: connection.ops.quote_name(x.column), fields)),
+                                              ', '.join(['%s'] * len(fields)))
+
+    rows = map(lambda instance: map(lambda x: x.get_db_prep_save(x.pre_save(instance, True)), fields),
+               instances)
+
+    cursor = connection.cursor()
+    cursor.executemany(sql, rows)
+    transaction.commit_unless_managed()
+
+
+#-------------------------------------------------------------------------------
+# Set the value of a field of several instances of a model in the database,
+# with one UPDATE statement
+#
+# @param model      The model
+# @param field_name Name of the field
+# @param values     The values, as a dictionary (primary key -> value)
+#
+# Unlike save(), the other fields aren't modified, and the signals aren't sent
+#-------------------------------------------------------------------------------
+def bulkUpdate(model, field_name, values):
+    if len(values) == 0:
+        return
+
+    meta = model._meta
+    field = meta.get_field(field_name)
+    pk_column = connection.ops.quote_name(meta.pk.column)
+
+    sql = 'UPDATE %s SET %s = CASE %s %s END WHERE %s IN (%s)' % (connection.ops.quote_name(meta.db_table),
+                                                                connection.ops.quote_name(field.column),
+                                                                pk_column,
+                                                                ' '.join(['WHEN %s THEN %s'] * len(values)),
+                                                                pk_column,
+                                                                ', '.join(['%s'] * len(values)))
+
+    parameters = []
+    for (pk, value) in values.items():
+        parameters.extend([pk, field.get_db_prep_save(value)])
+    parameters.extend(values.keys())
+
+    cursor = connection.cursor()
+    cursor.execute(sql, parameters)
+    transaction.commit_unless_managed()
+
+
+#-------------------------------------------------------------------------------
+# Indicates if some receivers are connected to a signal for a model (either
+# specifically or for all the senders)
+#-------------------------------------------------------------------------------
+def _hasReceivers(signal, model):
+    senders = (id(model), id(None))
+    return len(filter(lambda x: x[0][1] in senders, signal.receivers)) > 0
@@ -61,7 +61,7 @@ def getServerLogs(client, log_entry=None, filter_list=None):
 
         size = int(response.parameters[1])
 
-        content = client.waitData(size)
+        content = client.waitData(size, copy=False)
         if content is None:
             break
 
@@ -0,0 +1,233 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+import bisect
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+#-------------------------------------------------------------------------------
+# Computes the global scores of a group of heuristics, from their error rates
+# on several configurations
+#
+# @param errors     The error rates, as a matrix (one row per heuristic, one
+#                   column per configuration)
+# @return           The scores (one per heuristic)
+#
+# For each configuration, the score of a heuristic is increased by the number
+# of standard deviations its error rate is below the mean of the group. A
+# configuration on which all the heuristics are equal doesn't change the scores.
+#-------------------------------------------------------------------------------
+def computeScores(errors):
+    if len(errors) == 0:
+        return []
+
+    if numpy is None:
+        return _computeScores(errors)
+
+    errors = numpy.asarray(errors, dtype=numpy.float64)
+
+    (mean, deviation) = _statistics(errors.sum(axis=0), (errors ** 2).sum(axis=0),
+                                    errors.shape[0])
+
+    return ((mean - errors) / deviation).sum(axis=1).tolist()
+
+
+#-------------------------------------------------------------------------------
+# Computes the rank of several candidate heuristics, each one being ranked alone
+# in a group made of the reference heuristics
+#
+# @param reference_errors   The error rates of the reference heuristics, as a
+#                           matrix (one row per heuristic, one column per
+#                           configuration)
+# @param candidate_errors   The error rates of the candidates (same layout)
+# @return                   The ranks of the candidates (starting at 1)
+#
+# The result is the same than calling computeScores() and computeRanks() for
+# each candidate, with the candidate at the end of the group.
+#-------------------------------------------------------------------------------
+def computeCandidateRanks(reference_errors, candidate_errors):
+    return ReferenceGroup(reference_errors).rankCandidates(candidate_errors)
+
+
+#-------------------------------------------------------------------------------
+# Group of reference heuristics, against which candidate heuristics are ranked
+# (see computeCandidateRanks())
+#
+# The sums needed to compute the statistics of the group are computed once, so
+# ranking a candidate only requires to add its own errors to them.
+#-------------------------------------------------------------------------------
+class ReferenceGroup(object):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #
+    # @param errors     The error rates of the reference heuristics, as a matrix
+    #                   (one row per heuristic, one column per configuration)
+    #---------------------------------------------------------------------------
+    def __init__(self, errors):
+        self.errors       = errors
+        self.sums         = None
+        self.squared_sums = None
+
+        if (numpy is not None) and (len(errors) > 0):
+            self.errors       = numpy.asarray(errors, dtype=numpy.float64)
+            self.sums         = self.errors.sum(axis=0)
+            self.squared_sums = (self.errors ** 2).sum(axis=0)
+
+
+    #---------------------------------------------------------------------------
+    # Computes the rank of several candidate heuristics, each one being ranked
+    # alone in the group
+    #
+    # @param candidate_errors   The error rates of the candidates, as a matrix
+    #                           (one row per heuristic, one column per
+    #                           configuration)
+    # @return                   The ranks of the candidates (starting at 1)
+    #---------------------------------------------------------------------------
+    def rankCandidates(self, candidate_errors):
+        if len(candidate_errors) == 0:
+            return []
+
+        if self.sums is None:
+            return map(lambda x: computeRanks(computeScores(list(self.errors) + [x]))[-1],
+                       candidate_errors)
+
+        candidate_errors = numpy.asarray(candidate_errors, dtype=numpy.float64)
+
+        # Statistics of each group (one row per candidate)
+        (mean, deviation) = _statistics(self.sums + candidate_errors,
+                                        self.squared_sums + candidate_errors ** 2,
+                                        self.errors.shape[0] + 1)
+
+        candidate_scores = ((mean - candidate_errors) / deviation).sum(axis=1)
+
+        # Scores of the reference heuristics in each group (one row per
+        # candidate, one column per reference heuristic)
+        reference_scores = (mean / deviation).sum(axis=1)[:, numpy.newaxis] - \
+                           numpy.dot(1.0 / deviation, self.errors.T)
+
+        # The candidate is after the reference heuristics with the same score
+        return ((reference_scores >= candidate_scores[:, numpy.newaxis]).sum(axis=1) + 1).tolist()
+
+
+#-------------------------------------------------------------------------------
+# Sorted index of the ranked results of some heuristics on one configuration,
+# used to rank other results without modifying the existing ranks
+#-------------------------------------------------------------------------------
+class RankIndex(object):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #
+    # @param entries    The ranked results, as a list of (test error, train error,
+    #                   rank), ordered by rank
+    #---------------------------------------------------------------------------
+    def __init__(self, entries):
+        entries = sorted(entries, key=lambda x: (x[0], x[1]))
+
+        self.keys  = map(lambda x: (x[0], x[1]), entries)
+        self.ranks = map(lambda x: x[2], entries)
+
+
+    #---------------------------------------------------------------------------
+    # Returns the rank of a result: the rank of the first result with a greater
+    # test error (or the same test error and a greater train error), or the
+    # last rank + 1
+    #---------------------------------------------------------------------------
+    def rank(self, test_error, train_error):
+        index = bisect.bisect_right(self.keys, (test_error, train_error))
+        if index < len(self.ranks):
+            return self.ranks[index]
+
+        return len(self.ranks) + 1
+
+
+#-------------------------------------------------------------------------------
+# Computes the ranks corresponding to some scores (the highest score first,
+# starting at 1)
+#
+# Equal scores get consecutive ranks, in the order of the list
+#-------------------------------------------------------------------------------
+def computeRanks(scores):
+    if numpy is None:
+        order = sorted(range(len(scores)), key=lambda x: -scores[x])
+    else:
+        order = numpy.argsort(-numpy.asarray(scores, dtype=numpy.float64), kind='mergesort')
+
+    ranks = [0] * len(scores)
+    for (rank, index) in enumerate(order):
+        ranks[index] = rank + 1
+
+    return ranks
+
+
+#-------------------------------------------------------------------------------
+# Returns the mean and the standard deviation of the columns of some groups of
+# values, from their sums and sums of squares (the deviations equal to zero are
+# replaced by infinity, so the corresponding columns have no effect on the
+# scores)
+#-------------------------------------------------------------------------------
+def _statistics(sums, squared_sums, count):
+    mean = sums / count
+
+    if count < 2:
+        return (mean, numpy.inf)
+
+    variance = (squared_sums - sums * mean) / (count - 1)
+    deviation = numpy.sqrt(numpy.maximum(variance, 0.0))
+    deviation[deviation <= 0.0] = numpy.inf
+
+    return (mean, deviation)
+
+
+#-------------------------------------------------------------------------------
+# Pure-python implementation of computeScores(), used when NumPy isn't available
+#-------------------------------------------------------------------------------
+def _computeScores(errors):
+    scores = [0.0] * len(errors)
+
+    if len(errors) < 2:
+        return scores
+
+    for column in zip(*errors):
+        errors_sum = sum(column)
+        errors_squared_sum = reduce(lambda x, y: x + y**2, column, 0.0)
+
+        mean = errors_sum / len(column)
+        variance = (errors_squared_sum - errors_sum * mean) / (len(column) - 1)
+        if variance <= 0.0:
+            continue
+
+        standard_deviation = math.sqrt(variance)
+
+        for (index, error) in enumerate(column):
+            scores[index] += (mean - error) / standard_deviation
+
+    return scores
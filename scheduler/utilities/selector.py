@@ -0,0 +1,141 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+import select
+import errno
+
+
+#-------------------------------------------------------------------------------
+# Persistent registry of the file descriptors the scheduler must listen to
+#
+# Unlike select(), which must be given the complete list of file descriptors
+# each time (and is limited to FD_SETSIZE of them), the file descriptors are
+# registered once, with some data identifying their owner, and waiting for an
+# event only returns the ready ones. Uses epoll when available, poll otherwise.
+#-------------------------------------------------------------------------------
+class Selector(object):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #---------------------------------------------------------------------------
+    def __init__(self):
+        if hasattr(select, 'epoll'):
+            self.poller = select.epoll()
+            self.scale  = 1.0       # epoll expects seconds
+        else:
+            self.poller = select.poll()
+            self.scale  = 1000.0    # poll expects milliseconds
+
+        self.descriptors = {}       # file descriptor -> data
+
+
+    #---------------------------------------------------------------------------
+    # Register a file descriptor
+    #
+    # @param fileobj    The file descriptor, or an object with a 'fileno()'
+    #                   method
+    # @param data       The data to return when the file descriptor is ready
+    # @return           The file descriptor
+    #---------------------------------------------------------------------------
+    def register(self, fileobj, data=None):
+        descriptor = Selector.fileDescriptor(fileobj)
+
+        if descriptor in self.descriptors:
+            # The file descriptor was closed and reused without being
+            # unregistered first
+            self.unregister(descriptor)
+
+        self.poller.register(descriptor, select.POLLIN | select.POLLPRI)
+        self.descriptors[descriptor] = data
+
+        return descriptor
+
+
+    #---------------------------------------------------------------------------
+    # Unregister a file descriptor (does nothing if it isn't registered)
+    #
+    # @param fileobj    The file descriptor, or an object with a 'fileno()'
+    #                   method
+    #---------------------------------------------------------------------------
+    def unregister(self, fileobj):
+        descriptor = Selector.fileDescriptor(fileobj)
+
+        if descriptor not in self.descriptors:
+            return
+
+        del self.descriptors[descriptor]
+
+        # The file descriptor might already be closed
+        try:
+            self.poller.unregister(descriptor)
+        except (IOError, OSError, KeyError, ValueError):
+            pass
+
+
+    #---------------------------------------------------------------------------
+    # Wait for some file descriptors to be ready
+    #
+    # @param timeout    Maximum time to wait (in seconds), None to wait
+    #                   indefinitely
+    # @return           List of (file descriptor, data) of the ready file
+    #                   descriptors
+    #---------------------------------------------------------------------------
+    def select(self, timeout=None):
+        if timeout is None:
+            timeout = -1
+        else:
+            timeout = max(timeout, 0) * self.scale
+
+        try:
+            events = self.poller.poll(timeout)
+        except (IOError, select.error), e:
+            if e.args[0] != errno.EINTR:
+                raise
+            events = []
+
+        return map(lambda (descriptor, event): (descriptor, self.descriptors[descriptor]),
+                   filter(lambda (descriptor, event): descriptor in self.descriptors, events))
+
+
+    #---------------------------------------------------------------------------
+    # Close the selector
+    #---------------------------------------------------------------------------
+    def close(self):
+        if hasattr(self.poller, 'close'):
+            self.poller.close()
+
+        self.poller = None
+        self.descriptors = {}
+
+
+    #---------------------------------------------------------------------------
+    # Returns the file descriptor corresponding to an object
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def fileDescriptor(fileobj):
+        if isinstance(fileobj, (int, long)):
+            return fileobj
+
+        return fileobj.fileno()
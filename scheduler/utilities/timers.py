@@ -0,0 +1,135 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+import heapq
+import time
+import os
+
+
+#-------------------------------------------------------------------------------
+# Returns the current value of a monotonic clock (in seconds), not affected by
+# the changes of the system time
+#-------------------------------------------------------------------------------
+if hasattr(time, 'monotonic'):
+    monotonicTime = time.monotonic
+else:
+    # The elapsed real time returned by os.times() is measured from a fixed
+    # point in the past
+    def monotonicTime():
+        return os.times()[4]
+
+
+#-------------------------------------------------------------------------------
+# Keeps track of the next deadline of several owners (the tasks of the
+# scheduler), to know how long to wait for an event and which owners must be
+# woken up when the time is out
+#
+# The deadlines are kept in a heap, the obsolete entries (deadline modified or
+# cancelled) are discarded when they reach the top of it.
+#-------------------------------------------------------------------------------
+class TimerService(object):
+
+    #---------------------------------------------------------------------------
+    # Constructor
+    #
+    # @param clock  (Optional) The function returning the current time
+    #---------------------------------------------------------------------------
+    def __init__(self, clock=monotonicTime):
+        self.clock     = clock
+        self.deadlines = {}     # owner -> deadline
+        self.heap      = []     # Heap of (deadline, index, owner)
+        self.counter   = 0      # Used to order the owners with the same deadline
+
+
+    #---------------------------------------------------------------------------
+    # Set the deadline of an owner
+    #
+    # @param owner          The owner
+    # @param timeout        Number of seconds before the deadline, or None to
+    #                       cancel it
+    # @param keepEarlier    If 'True', an earlier deadline of the owner isn't
+    #                       modified
+    #---------------------------------------------------------------------------
+    def setTimeout(self, owner, timeout, keepEarlier=False):
+        current = self.deadlines.get(owner)
+
+        if timeout is None:
+            if not(keepEarlier):
+                self.cancel(owner)
+            return
+
+        deadline = self.clock() + max(timeout, 0)
+        if (current is not None) and ((current == deadline) or (keepEarlier and (current < deadline))):
+            return
+
+        self.deadlines[owner] = deadline
+
+        self.counter += 1
+        heapq.heappush(self.heap, (deadline, self.counter, owner))
+
+
+    #---------------------------------------------------------------------------
+    # Cancel the deadline of an owner
+    #---------------------------------------------------------------------------
+    def cancel(self, owner):
+        if owner in self.deadlines:
+            del self.deadlines[owner]
+
+
+    #---------------------------------------------------------------------------
+    # Returns the number of seconds before the next deadline, or None
+    #---------------------------------------------------------------------------
+    def nextTimeout(self):
+        self._discardObsoleteEntries()
+
+        if len(self.heap) == 0:
+            return None
+
+        return max(self.heap[0][0] - self.clock(), 0)
+
+
+    #---------------------------------------------------------------------------
+    # Returns the owners whose deadline is reached (their deadline is removed)
+    #---------------------------------------------------------------------------
+    def expired(self):
+        now = self.clock()
+
+        result = []
+        while True:
+            self._discardObsoleteEntries()
+
+            if (len(self.heap) == 0) or (self.heap[0][0] > now):
+                break
+
+            (deadline, index, owner) = heapq.heappop(self.heap)
+            del self.deadlines[owner]
+            result.append(owner)
+
+        return result
+
+
+    def _discardObsoleteEntries(self):
+        while (len(self.heap) > 0) and (self.deadlines.get(self.heap[0][2]) != self.heap[0][0]):
+            heapq.heappop(self.heap)
@@ -0,0 +1,6 @@
+USE mash;
+
+ALTER TABLE heuristics_heuristicevaluationresults ADD COLUMN train_error_mean double precision NULL;
+ALTER TABLE heuristics_heuristicevaluationresults ADD COLUMN train_error_deviation double precision NULL;
+ALTER TABLE heuristics_heuristicevaluationresults ADD COLUMN test_error_mean double precision NULL;
+ALTER TABLE heuristics_heuristicevaluationresults ADD COLUMN test_error_deviation double precision NULL;
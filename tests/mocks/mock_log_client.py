@@ -45,7 +45,7 @@ class MockLogClient(object):
         
         return Message('LOG_FILE', [name, size])
     
-    def waitData(self, size):
+    def waitData(self, size, copy=True):
         if self.current >= len(self.log_files):
             return None
         
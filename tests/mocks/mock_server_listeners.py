@@ -112,6 +112,7 @@ class MockExperimentServerListener(ServerListener):
     ERROR_REPORT_CONTEXT    = None
     ERROR_REPORT_STACKTRACE = None
     LAST_COMMAND            = None
+    PIPELINED_SETUP         = False
 
 
     def __init__(self, socket, channel):
@@ -141,6 +142,9 @@ class MockExperimentServerListener(ServerListener):
             else:
                 self.sendResponse(Message('BUSY'))
 
+        elif (command.name == 'USE_PIPELINED_SETUP') and MockExperimentServerListener.PIPELINED_SETUP:
+            self.sendResponse(Message('OK'))
+
         elif (command.name == 'SET_EXPERIMENT_TYPE'):
             self.goalplanning = (command.parameters[0] == 'GoalPlanning')
 
@@ -166,6 +170,7 @@ class MockExperimentServerListener(ServerListener):
              (command.name == 'END_PREDICTOR_SETUP') or \
              (command.name == 'USE_HEURISTICS_REPOSITORY') or \
              (command.name == 'USE_HEURISTIC') or \
+             ((command.name == 'USE_HEURISTICS') and MockExperimentServerListener.PIPELINED_SETUP) or \
              (command.name == 'RESET'):
             if MockExperimentServerListener.FAIL_CONDITION != command.name:
                 self.sendResponse(Message('OK'))
@@ -39,6 +39,11 @@ class MockTask(Task):
         'EVENT1': [],
         'EVENT2': [int],
         'EVENT3': [int],
+        'EVENT4': [int],
+    }
+
+    COALESCED_EVENTS = {
+        'EVENT4': (0.1, 0.3),
     }
     
     
@@ -113,5 +118,7 @@ class MockTask(Task):
         elif event.name == 'EVENT3':
             job = self.jobs.addJob(command=Message('COMMAND2', event.parameters))
             return [job]
+        elif event.name == 'EVENT4':
+            self.channel.sendMessage(Message('EVENT4_RECEIVED', event.parameters))
 
         return None
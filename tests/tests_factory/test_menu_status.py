@@ -0,0 +1,427 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+import unittest
+from mash.factory.utilities import menu_status, _compute_menu_status
+from mash.factory.models import FactoryTask, FactoryTaskResult, DebuggingEntry
+from mash.factory.models import menu_status_cache_key
+from mash.heuristics.models import Heuristic
+from mash.heuristics.models import HeuristicVersion
+from mash.heuristics.models import HeuristicTestStatus
+from mash.experiments.models import Experiment
+from mash.experiments.models import Configuration
+from mash.tasks.models import Task as DBTask
+from django.contrib.auth.models import User, AnonymousUser
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db.models import Q
+import mash.factory.models
+import mash.factory.utilities
+from datetime import datetime
+
+
+#-------------------------------------------------------------------------------
+# The implementation of the status of the menu of the factory before it was
+# computed in one query (one query per value), used as a reference
+#-------------------------------------------------------------------------------
+def reference_menu_status(user):
+    status = {
+        'compilation': 0,
+        'experiments': 0,
+        'recorded_data': None,
+        'heuristic_unchecked': 0,
+        'nb_compilation_errors': 0,
+        'nb_total_numbers_heuristics': 0,
+        'heuristic_ids': {
+            'errors': [],
+            'in_progress': [],
+        },
+    }
+
+    if not(user.is_anonymous()):
+
+        heuristic_test_status = HeuristicTestStatus.objects.filter(heuristic_version__heuristic__simple=True,
+                                                                   heuristic_version__heuristic__author=user,
+                                                                   heuristic_version__checked=False,
+                                                                   error=False)
+        status['compilation'] = heuristic_test_status.count()
+
+        task_results = FactoryTaskResult.objects.filter(experiment__user=user)
+        status['experiments'] = task_results.filter(Q(experiment__status=Experiment.STATUS_SCHEDULED) |
+                                                    Q(experiment__status=Experiment.STATUS_RUNNING)).count()
+
+        status['heuristic_ids']['errors'] = \
+                map(lambda x: x.heuristic_version.id,
+                    HeuristicTestStatus.objects.filter(heuristic_version__heuristic__author__id=user.id,
+                                                       heuristic_version__heuristic__simple=True,
+                                                       heuristic_version__checked=False,
+                                                       error=True))
+
+        status['heuristic_ids']['in_progress'] = \
+                map(lambda x: x.heuristic_version.id,
+                    HeuristicTestStatus.objects.filter(heuristic_version__heuristic__author__id=user.id,
+                                                       heuristic_version__heuristic__simple=True,
+                                                       heuristic_version__checked=False,
+                                                       error=False))
+
+        status['nb_compilation_errors'] = len(status['heuristic_ids']['errors'])
+        status['nb_total_numbers_heuristics'] = HeuristicVersion.objects.filter(heuristic__simple=True,
+                                                                                heuristic__author=user).count()
+
+        try:
+            debugging_entry = DebuggingEntry.objects.get(heuristic_version__heuristic__author=user)
+            if (debugging_entry.status == DebuggingEntry.STATUS_DONE) or \
+               (debugging_entry.status == DebuggingEntry.STATUS_FAILED):
+                status['recorded_data'] = 'done'
+            else:
+                status['recorded_data'] = 'running'
+        except:
+            pass
+
+    status['heuristic_unchecked'] = HeuristicVersion.objects.filter(heuristic__author__id=user.id, heuristic__simple=True).exclude(checked=True).count()
+
+    return status
+
+
+class BaseMenuStatusTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        DebuggingEntry.objects.all().delete()
+        FactoryTaskResult.objects.all().delete()
+        FactoryTask.objects.all().delete()
+        HeuristicTestStatus.objects.all().delete()
+        HeuristicVersion.objects.all().delete()
+        Heuristic.objects.all().delete()
+        Experiment.objects.all().delete()
+        Configuration.objects.all().delete()
+        User.objects.all().delete()
+        DBTask.objects.all().delete()
+
+
+    def util_create_user(self, username):
+        user = User()
+        user.username = username
+        user.save()
+        return user
+
+
+    def util_create_configuration(self, name):
+        try:
+            task = DBTask.objects.all()[0]
+        except:
+            task = DBTask()
+            task.name = 'name1'
+            task.type = DBTask.TYPE_GOALPLANNING
+            task.save()
+
+        configuration = Configuration()
+        configuration.name = name
+        configuration.heuristics = Configuration.CUSTOM_HEURISTICS_LIST
+        configuration.experiment_type = Configuration.FACTORY
+        configuration.task = task
+        configuration.save()
+
+        return configuration
+
+
+    def util_create_factory_task(self):
+        try:
+            return FactoryTask.objects.all()[0]
+        except:
+            factory_task = FactoryTask()
+            factory_task.config = self.util_create_configuration('factory/task1')
+            factory_task.taskNumber = 1
+            factory_task.save()
+            return factory_task
+
+
+    def util_create_heuristic_version(self, user, heuristic_name, simple=True, checked=False, test_error=None):
+        heuristic = Heuristic()
+        heuristic.author = user
+        heuristic.name = heuristic_name
+        heuristic.simple = simple
+        heuristic.save()
+
+        version = HeuristicVersion()
+        version.heuristic = heuristic
+        version.version = 1
+        version.filename = '%s.cpp' % heuristic_name
+        version.upload_date = datetime.now()
+        version.status_date = datetime.now()
+        version.checked = checked
+        version.save()
+
+        if test_error is not None:
+            self.util_create_test_status(version, test_error)
+
+        return version
+
+
+    def util_create_test_status(self, version, error):
+        test_status = HeuristicTestStatus()
+        test_status.heuristic_version = version
+        test_status.phase = HeuristicTestStatus.PHASE_COMPILATION
+        test_status.error = error
+        test_status.save()
+        return test_status
+
+
+    def util_create_debugging_entry(self, version, status):
+        debugging_entry = DebuggingEntry()
+        debugging_entry.task = self.util_create_factory_task()
+        debugging_entry.heuristic_version = version
+        debugging_entry.status = status
+        debugging_entry.save()
+        return debugging_entry
+
+
+    def util_create_factory_experiment(self, user, name, status):
+        experiment = Experiment()
+        experiment.name = name
+        experiment.configuration = self.util_create_configuration(name)
+        experiment.user = user
+        experiment.status = status
+        experiment.creation_date = datetime.now()
+        experiment.save()
+
+        result = FactoryTaskResult()
+        result.task = self.util_create_factory_task()
+        result.experiment = experiment
+        result.save()
+
+        return experiment
+
+
+class MenuStatusTestCase(BaseMenuStatusTestCase):
+
+    def assertSameStatus(self, user):
+        expected = reference_menu_status(user)
+        expected['heuristic_ids']['errors'].sort()
+        expected['heuristic_ids']['in_progress'].sort()
+
+        if user.is_anonymous():
+            status = _compute_menu_status(None)
+        else:
+            status = _compute_menu_status(user)
+
+        self.assertEqual(expected, status)
+
+
+    def test_anonymous_user(self):
+        self.assertSameStatus(AnonymousUser())
+
+
+    def test_no_heuristic(self):
+        self.assertSameStatus(self.util_create_user('user1'))
+
+
+    def test_heuristics(self):
+        user = self.util_create_user('user1')
+
+        self.util_create_heuristic_version(user, 'heuristic1', test_error=False)
+        self.util_create_heuristic_version(user, 'heuristic2', test_error=True)
+        self.util_create_heuristic_version(user, 'heuristic3')
+        self.util_create_heuristic_version(user, 'heuristic4', checked=True, test_error=False)
+        self.util_create_heuristic_version(user, 'heuristic5', simple=False, test_error=False)
+        self.util_create_heuristic_version(user, 'heuristic6', test_error=False)
+
+        self.assertSameStatus(user)
+
+
+    def test_factory_experiments(self):
+        user = self.util_create_user('user1')
+
+        self.util_create_factory_experiment(user, 'experiment1', Experiment.STATUS_SCHEDULED)
+        self.util_create_factory_experiment(user, 'experiment2', Experiment.STATUS_RUNNING)
+        self.util_create_factory_experiment(user, 'experiment3', Experiment.STATUS_DONE)
+        self.util_create_factory_experiment(user, 'experiment4', Experiment.STATUS_FAILED)
+
+        self.assertSameStatus(user)
+
+        self.util_create_heuristic_version(user, 'heuristic1', test_error=False)
+        self.util_create_heuristic_version(user, 'heuristic2', test_error=True)
+
+        self.assertSameStatus(user)
+
+
+    def test_debugging_entry(self):
+        user = self.util_create_user('user1')
+
+        version = self.util_create_heuristic_version(user, 'heuristic1', checked=True)
+        self.util_create_heuristic_version(user, 'heuristic2', test_error=False)
+
+        debugging_entry = self.util_create_debugging_entry(version, DebuggingEntry.STATUS_SCHEDULED)
+        self.assertSameStatus(user)
+
+        for status in (DebuggingEntry.STATUS_RUNNING, DebuggingEntry.STATUS_DONE, DebuggingEntry.STATUS_FAILED):
+            debugging_entry.status = status
+            debugging_entry.save()
+            self.assertSameStatus(user)
+
+
+    def test_several_users(self):
+        user1 = self.util_create_user('user1')
+        user2 = self.util_create_user('user2')
+
+        self.util_create_heuristic_version(user1, 'heuristic1', test_error=False)
+        self.util_create_heuristic_version(user1, 'heuristic2', test_error=True)
+        self.util_create_factory_experiment(user1, 'experiment1', Experiment.STATUS_RUNNING)
+
+        version = self.util_create_heuristic_version(user2, 'heuristic3', checked=True)
+        self.util_create_heuristic_version(user2, 'heuristic4', test_error=True)
+        self.util_create_debugging_entry(version, DebuggingEntry.STATUS_DONE)
+
+        self.assertSameStatus(user1)
+        self.assertSameStatus(user2)
+
+
+class MenuStatusCacheTestCase(BaseMenuStatusTestCase):
+
+    def setUp(self):
+        BaseMenuStatusTestCase.tearDown(self)
+
+        # The cache must be shared with the scheduler to be used: use a local
+        # one, but pretend it is shared
+        self.cache_backend = settings.CACHE_BACKEND
+        self.cache = mash.factory.models.cache
+
+        settings.CACHE_BACKEND = 'memcached://127.0.0.1:11211/'
+        mash.factory.models.cache = get_cache('locmem://')
+        mash.factory.utilities.cache = mash.factory.models.cache
+
+        self.user = self.util_create_user('user1')
+        self.other_user = self.util_create_user('user2')
+
+        self.version = self.util_create_heuristic_version(self.user, 'heuristic1', checked=True)
+        self.other_version = self.util_create_heuristic_version(self.other_user, 'heuristic2', checked=True)
+
+    def tearDown(self):
+        BaseMenuStatusTestCase.tearDown(self)
+
+        settings.CACHE_BACKEND = self.cache_backend
+        mash.factory.models.cache = self.cache
+        mash.factory.utilities.cache = self.cache
+
+
+    def util_is_cached(self, user):
+        return mash.factory.models.cache.get(menu_status_cache_key(user.id)) is not None
+
+
+    def util_cache_menu_status(self):
+        menu_status(self.user)
+        menu_status(self.other_user)
+
+        self.assertTrue(self.util_is_cached(self.user))
+        self.assertTrue(self.util_is_cached(self.other_user))
+
+
+    def util_check_invalidated(self):
+        self.assertFalse(self.util_is_cached(self.user))
+        self.assertTrue(self.util_is_cached(self.other_user))
+        self.assertEqual(_compute_menu_status(self.user), menu_status(self.user))
+
+
+    def test_status_cached(self):
+        status = menu_status(self.user)
+
+        self.assertTrue(self.util_is_cached(self.user))
+        self.assertEqual(status, menu_status(self.user))
+
+
+    def test_local_cache_backend(self):
+        settings.CACHE_BACKEND = 'locmem://'
+
+        menu_status(self.user)
+
+        self.assertFalse(self.util_is_cached(self.user))
+
+
+    def test_invalidation_on_heuristic_version_creation(self):
+        self.util_cache_menu_status()
+        self.util_create_heuristic_version(self.user, 'heuristic3')
+        self.util_check_invalidated()
+
+
+    def test_invalidation_on_heuristic_version_modification(self):
+        self.util_cache_menu_status()
+        self.version.checked = False
+        self.version.save()
+        self.util_check_invalidated()
+
+
+    def test_invalidation_on_heuristic_version_deletion(self):
+        self.util_cache_menu_status()
+        self.version.delete()
+        self.util_check_invalidated()
+
+
+    def test_invalidation_on_test_status_modification(self):
+        self.util_cache_menu_status()
+        test_status = self.util_create_test_status(self.version, False)
+        self.util_check_invalidated()
+
+        self.util_cache_menu_status()
+        test_status.error = True
+        test_status.save()
+        self.util_check_invalidated()
+
+        self.util_cache_menu_status()
+        test_status.delete()
+        self.util_check_invalidated()
+
+
+    def test_invalidation_on_debugging_entry_modification(self):
+        self.util_cache_menu_status()
+        debugging_entry = self.util_create_debugging_entry(self.version, DebuggingEntry.STATUS_RUNNING)
+        self.util_check_invalidated()
+
+        self.util_cache_menu_status()
+        debugging_entry.status = DebuggingEntry.STATUS_DONE
+        debugging_entry.save()
+        self.util_check_invalidated()
+
+        self.util_cache_menu_status()
+        debugging_entry.delete()
+        self.util_check_invalidated()
+
+
+    def test_invalidation_on_experiment_modification(self):
+        self.util_cache_menu_status()
+        experiment = self.util_create_factory_experiment(self.user, 'experiment1', Experiment.STATUS_SCHEDULED)
+        self.util_check_invalidated()
+
+        self.util_cache_menu_status()
+        experiment.status = Experiment.STATUS_DONE
+        experiment.save()
+        self.util_check_invalidated()
+
+
+def tests():
+    return [ MenuStatusTestCase,
+             MenuStatusCacheTestCase,
+           ]
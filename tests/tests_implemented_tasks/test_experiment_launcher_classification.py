@@ -43,10 +43,16 @@ from mash.contests.models import Contest
 from mash.contests.models import ContestEntry
 from mash.accounts.models import UserProfile
 from mocks.mock_server_listeners import MockExperimentServerListener
+from implemented_tasks.experiment_launcher import EvaluationShards
+from implemented_tasks.experiment_launcher import ExperimentLauncher
+from utilities.db_executor import DatabaseExecutor
 from pymash.messages import Message
+from pymash.server import ThreadedServer
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.db.models import Q
 from datetime import datetime
+import select
 import os
 
 
@@ -527,6 +533,9 @@ class ExperimentLauncherClassificationSuccessTestCase(ExperimentLauncherClassifi
                 self.assertEqual(int(seeds[index]), step.seed)
                 self.assertTrue(step.train_error is not None)
                 self.assertTrue(step.test_error is not None)
+
+            self.assertTrue(experiment.evaluation_results.test_error_mean is not None)
+            self.assertTrue(experiment.evaluation_results.train_error_mean is not None)
             
         self.assertTrue(experiment.data_report is not None)
         
@@ -614,6 +623,19 @@ class ExperimentLauncherClassificationEvaluationExperimentsSuccessTestCase(Exper
         self.seeds = '1234 5678 9000'
 
 
+class ExperimentLauncherClassificationEvaluationExperimentsBatchesSuccessTestCase(ExperimentLauncherClassificationEvaluationExperimentsSuccessTestCase):
+
+    def setUp(self):
+        super(ExperimentLauncherClassificationEvaluationExperimentsBatchesSuccessTestCase, self).setUp()
+        self.steps_batch = ExperimentLauncher.EVALUATION_STEPS_BATCH
+        ExperimentLauncher.EVALUATION_STEPS_BATCH = 2
+
+
+    def tearDown(self):
+        ExperimentLauncher.EVALUATION_STEPS_BATCH = self.steps_batch
+        super(ExperimentLauncherClassificationEvaluationExperimentsBatchesSuccessTestCase, self).tearDown()
+
+
 class ExperimentLauncherClassificationContestBaseExperimentsSuccessTestCase(ExperimentLauncherClassificationSuccessTestCase):
 
     def setUp(self):
@@ -1089,8 +1111,330 @@ class ExperimentLauncherClassificationContestEntryExperimentsCancellingTestCase(
 
 
 
+class ExperimentLauncherClassificationPipelinedSetupSuccessTestCase(ExperimentLauncherClassificationSuccessTestCase):
+
+    def setUp(self):
+        super(ExperimentLauncherClassificationPipelinedSetupSuccessTestCase, self).setUp()
+        self.experiment_type = Configuration.PUBLIC
+        MockExperimentServerListener.PIPELINED_SETUP = True
+
+
+    def tearDown(self):
+        MockExperimentServerListener.PIPELINED_SETUP = False
+        super(ExperimentLauncherClassificationPipelinedSetupSuccessTestCase, self).tearDown()
+
+
+class ExperimentLauncherClassificationPipelinedSetupEvaluationSuccessTestCase(ExperimentLauncherClassificationPipelinedSetupSuccessTestCase):
+
+    def setUp(self):
+        super(ExperimentLauncherClassificationPipelinedSetupEvaluationSuccessTestCase, self).setUp()
+        self.experiment_type = Configuration.EVALUATION
+        self.seeds = '1234 5678 9000'
+
+
+class ExperimentLauncherClassificationPipelinedSetupFailureTestCase(ExperimentLauncherClassificationBaseTestCase):
+
+    def setUp(self):
+        super(ExperimentLauncherClassificationPipelinedSetupFailureTestCase, self).setUp()
+        self.experiment_type = Configuration.PUBLIC
+        MockExperimentServerListener.PIPELINED_SETUP = True
+
+
+    def tearDown(self):
+        MockExperimentServerListener.PIPELINED_SETUP = False
+        super(ExperimentLauncherClassificationPipelinedSetupFailureTestCase, self).tearDown()
+
+
+    def util_test_error_base(self, fail_condition):
+        self.util_createImageServer()
+        self.util_createExperimentServer()
+        self.util_start()
+        self.util_createExperiment(self.experiment_type, seeds=self.seeds)
+
+        MockExperimentServerListener.FAIL_CONDITION          = fail_condition
+        MockExperimentServerListener.ERROR_REPORT            = None
+        MockExperimentServerListener.ERROR_REPORT_PARAMETERS = None
+        MockExperimentServerListener.ERROR_REPORT_CONTEXT    = None
+        MockExperimentServerListener.ERROR_REPORT_STACKTRACE = None
+
+        self.task.processMessage(Message('RUN_EXPERIMENT', [self.experiment.id]))
+
+        self.util_wait_jobs_completion([self.task])
+
+        self.assertEqual(1, Job.objects.count())
+        self.assertEqual(1, Job.objects.filter(status=Job.STATUS_FAILED).count())
+
+        self.assertEqual(1, Alert.objects.count())
+
+        experiment = Experiment.objects.get(id=self.experiment.id)
+        self.assertEqual(Experiment.STATUS_FAILED, experiment.status)
+
+        # The remaining commands of the burst were sent, but not the next ones
+        self.assertNotEqual('TRAIN_PREDICTOR', MockExperimentServerListener.LAST_COMMAND.name)
+
+
+    def test_error_with_experiment_setup_section_setting(self):
+        self.util_test_error_base('DATABASE_NAME')
+
+
+    def test_error_with_instrument_setup_section_start(self):
+        self.util_test_error_base('BEGIN_INSTRUMENT_SETUP')
+
+
+    def test_error_with_heuristics_list(self):
+        self.util_test_error_base('USE_HEURISTICS')
+
+
+class FakeServerJob(object):
+
+    def __init__(self):
+        self.status     = Job.STATUS_RUNNING
+        self.experiment = Experiment(id=1)
+
+
+class FakeEvaluationJob(object):
+
+    def __init__(self, evaluation=None, parent=None):
+        self.evaluation = evaluation
+        self.parent     = parent
+        self.server_job = FakeServerJob()
+        self.operation  = None
+        self.callbacks  = []
+
+    def persist(self, function=None, callback=None):
+        self.callbacks.append(callback)
+
+    def markAsDone(self):
+        self.server_job.status = Job.STATUS_DONE
+
+    def closeClient(self):
+        pass
+
+    def flushed(self):
+        for callback in self.callbacks:
+            callback()
+        self.callbacks = []
+
+
+class EvaluationShardsTestCase(unittest.TestCase):
+
+    def test_seeds_distribution(self):
+        parent = object()
+        shard = object()
+
+        evaluation = EvaluationShards(parent, 3)
+
+        self.assertEqual(0, evaluation.nextSeed(parent))
+        self.assertEqual(1, evaluation.nextSeed(shard))
+        self.assertEqual(set([parent, shard]), evaluation.running)
+
+        self.assertEqual(2, evaluation.nextSeed(shard))
+        self.assertTrue(evaluation.nextSeed(parent) is None)
+        self.assertEqual(set([shard]), evaluation.running)
+
+        self.assertTrue(evaluation.nextSeed(shard) is None)
+        self.assertEqual(0, len(evaluation.running))
+
+
+    def test_shards_finishing_out_of_order(self):
+        completed = []
+
+        launcher = ExperimentLauncher()
+        launcher.completeExperiment = lambda job: completed.append(job)
+
+        parent = FakeEvaluationJob()
+        evaluation = EvaluationShards(parent, 3)
+        parent.evaluation = evaluation
+
+        shard1 = FakeEvaluationJob(evaluation, parent)
+        shard2 = FakeEvaluationJob(evaluation, parent)
+
+        for job in (parent, shard1, shard2):
+            self.assertTrue(evaluation.nextSeed(job) is not None)
+
+        for job in (shard2, parent, shard1):
+            self.assertTrue(evaluation.nextSeed(job) is None)
+            launcher.leaveEvaluation(job)
+
+        self.assertEqual(0, len(evaluation.running))
+
+        # The parent waits for the other jobs, without going back to the
+        # beginning of the experiment if it is processed meanwhile
+        self.assertEqual(ExperimentLauncher.waitEvaluation, parent.operation)
+
+        # The results of the second shard aren't saved yet
+        parent.flushed()
+        shard1.flushed()
+        self.assertEqual([], completed)
+        self.assertFalse(evaluation.finished)
+
+        shard2.flushed()
+        self.assertEqual([parent], completed)
+        self.assertTrue(evaluation.finished)
+
+
+class ExperimentLauncherClassificationShardedEvaluationTestCase(ExperimentLauncherClassificationBaseTestCase):
+
+    def setUp(self):
+        self.second_experiment_server = None
+        self.executor = None
+
+        super(ExperimentLauncherClassificationShardedEvaluationTestCase, self).setUp()
+
+        self.experiment_type = Configuration.EVALUATION
+        self.seeds = '1234 5678 9000 4321'
+
+        # The database operations are executed by worker threads, like in the
+        # scheduler
+        self.executor = DatabaseExecutor(nbWorkers=2)
+        DatabaseExecutor.setInstance(self.executor)
+
+
+    def tearDown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            DatabaseExecutor.setInstance(None)
+            self.executor = None
+
+        if self.second_experiment_server is not None:
+            self.second_experiment_server.stop()
+            self.second_experiment_server = None
+
+        super(ExperimentLauncherClassificationShardedEvaluationTestCase, self).tearDown()
+
+
+    def util_createSecondExperimentServer(self):
+        server                      = Server()
+        server.name                 = 'Experimentix2'
+        server.address              = '127.0.0.1'
+        server.port                 = 18002
+        server.server_type          = Server.EXPERIMENTS_SERVER
+        server.subtype              = Server.SUBTYPE_NONE
+        server.status               = Server.SERVER_STATUS_ONLINE
+        server.save()
+
+        server.supported_tasks.add(DBTask.objects.all()[0])
+
+
+    def util_wait_jobs_completion(self, tasks):
+        for task in filter(lambda x: len(x.new_jobs) > 0, tasks):
+            task.processNewJobs()
+
+        while (Job.objects.filter(Q(status=Job.STATUS_SCHEDULED) | Q(status=Job.STATUS_RUNNING)).count() > 0) or \
+              self.executor.isBusy():
+            select_list = [self.executor.fileDescriptor()]
+            for task in tasks:
+                select_list.extend(task.getFileDescriptors())
+
+            ready_to_read, ready_to_write, in_error = select.select(select_list, [], select_list, 0.1)
+
+            self.executor.processCompletions()
+
+            for task in tasks:
+                task.onEvent(None, ready_to_read)
+                task.processNewJobs()
+
+
+    def test_evaluation(self):
+        self.util_createImageServer()
+        self.util_createExperimentServer()
+        self.util_createSecondExperimentServer()
+
+        self.experiment_server = ThreadedServer('127.0.0.1', 18000, MockExperimentServerListener)
+        self.experiment_server.start()
+
+        self.second_experiment_server = ThreadedServer('127.0.0.1', 18002, MockExperimentServerListener)
+        self.second_experiment_server.start()
+
+        self.util_start(no_experiment_server=True)
+        self.util_createExperiment(self.experiment_type, seeds=self.seeds)
+
+        MockExperimentServerListener.FAIL_CONDITION          = None
+        MockExperimentServerListener.ERROR_REPORT            = None
+        MockExperimentServerListener.ERROR_REPORT_PARAMETERS = None
+        MockExperimentServerListener.ERROR_REPORT_CONTEXT    = None
+        MockExperimentServerListener.ERROR_REPORT_STACKTRACE = None
+
+        self.task.processMessage(Message('RUN_EXPERIMENT', [self.experiment.id]))
+
+        self.util_wait_jobs_completion([self.task])
+
+        self.assertEqual(0, self.task.jobs.count())
+        self.assertEqual(0, Job.objects.filter(status=Job.STATUS_FAILED).count())
+        self.assertEqual(0, Alert.objects.count())
+
+        experiment = Experiment.objects.get(id=self.experiment.id)
+        self.assertEqual(Experiment.STATUS_DONE, experiment.status)
+
+        seeds = self.seeds.split(' ')
+        self.assertEqual(len(seeds), experiment.evaluation_results.steps.count())
+        self.assertEqual(sorted(map(lambda x: int(x), seeds)),
+                         map(lambda x: x.seed, experiment.evaluation_results.steps.order_by('seed')))
+        self.assertTrue(experiment.evaluation_results.test_error_mean is not None)
+
+        m = self.task.out_channel.waitMessage()
+        self.assertEqual('EVT_HEURISTIC_EVALUATED', m.name)
+
+
+class FakePipelinedClient(object):
+
+    def __init__(self, responses):
+        self.responses = responses
+
+    def waitResponse(self):
+        return self.responses.pop(0)
+
+
+class FakePipelinedJob(object):
+
+    def __init__(self, responses):
+        self.client            = FakePipelinedClient(responses)
+        self.operation         = None
+        self.pending_responses = [ 'Error 1', 'Error 2', 'Error 3' ]
+        self.pipeline_next     = None
+        self.pipeline_failure  = None
+
+
+class PipelinedResponsesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.errors = []
+        self.launcher = ExperimentLauncher()
+        self.launcher.processError = lambda job, error, response=None: self.errors.append((error, response))
+
+    def test_one_response_per_call_after_an_error(self):
+        job = FakePipelinedJob([ Message('OK'), Message('ERROR', ['failure']), Message('OK') ])
+
+        self.launcher.processPipelinedResponses(job)
+        self.launcher.processPipelinedResponses(job)
+        self.assertEqual(1, len(job.client.responses))
+        self.assertEqual(ExperimentLauncher.processPipelinedResponses, job.operation)
+        self.assertEqual([], self.errors)
+
+        self.launcher.processPipelinedResponses(job)
+        self.assertEqual(0, len(job.client.responses))
+        self.assertEqual(1, len(self.errors))
+        self.assertEqual('Error 2', self.errors[0][0])
+        self.assertEqual('ERROR', self.errors[0][1].name)
+
+    def test_success(self):
+        operations = []
+
+        job = FakePipelinedJob([ Message('OK'), Message('OK'), Message('OK') ])
+        job.pipeline_next = lambda launcher, job, no_waiting: operations.append(no_waiting)
+
+        for i in range(3):
+            self.launcher.processPipelinedResponses(job)
+
+        self.assertEqual([True], operations)
+        self.assertEqual([], self.errors)
+
+
 def tests():
     return [ ExperimentLauncherClassificationServersTestCase,
+             EvaluationShardsTestCase,
+             ExperimentLauncherClassificationShardedEvaluationTestCase,
+             PipelinedResponsesTestCase,
              ExperimentLauncherClassificationPublicExperimentsFailureTestCase,
              ExperimentLauncherClassificationPrivateExperimentsFailureTestCase,
              ExperimentLauncherClassificationConsortiumExperimentsFailureTestCase,
@@ -1101,6 +1445,7 @@ def tests():
              ExperimentLauncherClassificationPrivateExperimentsSuccessTestCase,
              ExperimentLauncherClassificationConsortiumExperimentsSuccessTestCase,
              ExperimentLauncherClassificationEvaluationExperimentsSuccessTestCase,
+             ExperimentLauncherClassificationEvaluationExperimentsBatchesSuccessTestCase,
              ExperimentLauncherClassificationContestBaseExperimentsSuccessTestCase,
              ExperimentLauncherClassificationContestEntryExperimentsSuccessTestCase,
              ExperimentLauncherClassificationPublicExperimentsPluginErrorReportsTestCase,
@@ -1115,4 +1460,7 @@ def tests():
              ExperimentLauncherClassificationEvaluationExperimentsCancellingTestCase,
              ExperimentLauncherClassificationContestBaseExperimentsCancellingTestCase,
              ExperimentLauncherClassificationContestEntryExperimentsCancellingTestCase,
+             ExperimentLauncherClassificationPipelinedSetupSuccessTestCase,
+             ExperimentLauncherClassificationPipelinedSetupEvaluationSuccessTestCase,
+             ExperimentLauncherClassificationPipelinedSetupFailureTestCase,
            ]
@@ -158,6 +158,9 @@ class EvaluatedHeuristicRankerTestCase(BaseTaskTest):
                 step.train_error = 0.5
                 step.test_error = test_error
                 step.save()
+
+            if experiment.status == Experiment.STATUS_DONE:
+                evaluation_results.update_statistics()
         
         version.evaluated = (version.evaluation_results.filter(experiment__status=Experiment.STATUS_RUNNING).count() == 0)
         version.save()
@@ -239,6 +242,36 @@ class EvaluatedHeuristicRankerTestCase(BaseTaskTest):
         self.assertTrue(HeuristicVersion.objects.get(heuristic__name='heuristic5').rank is None)
 
 
+    def test_rank_evaluated_heuristics__results_without_steps(self):
+
+        self.util_create_configuration('config1')
+        self.util_create_configuration('config2')
+
+        self.util_create_heuristic('user1', 'heuristic1', True, test_errors=[[0.1, 0.2, 0.05], [0.1, 0.2, 0.15]])
+        self.util_create_heuristic('user2', 'heuristic2', True, test_errors=[[], [0.01, 0.02, 0.015]])
+        self.util_create_heuristic('user3', 'heuristic3', False, test_errors=[[0.3, 0.25, 0.35], [0.2, 0.3, 0.25]])
+
+        self.task = HeuristicRanker()
+        self.task.start()
+
+        self.assertTrue(self.task.processMessage('RANK_EVALUATED_HEURISTICS'))
+
+        self.util_wait_jobs_completion([self.task])
+
+        self.assertEqual(1, Job.objects.count())
+        self.assertEqual(1, Job.objects.filter(status=Job.STATUS_DONE).count())
+
+        self.assertTrue(HeuristicEvaluationResults.objects.get(heuristic_version__heuristic__name='heuristic2',
+                                                               evaluation_config__name='template/config1').rank is None)
+        self.assertEqual(1, HeuristicEvaluationResults.objects.get(heuristic_version__heuristic__name='heuristic2',
+                                                                   evaluation_config__name='template/config2').rank)
+
+        # The heuristic version without steps is left out of the global ranking
+        self.assertEqual(1, HeuristicVersion.objects.get(heuristic__name='heuristic1').rank)
+        self.assertTrue(HeuristicVersion.objects.get(heuristic__name='heuristic2').rank is None)
+        self.assertEqual(2, HeuristicVersion.objects.get(heuristic__name='heuristic3').rank)
+
+
     def test_event_private_heuristic_evaluated__one_configuration(self):
 
         self.util_create_configuration('config1')
@@ -602,7 +635,22 @@ class ContestEntriesRankerTestCase(BaseTaskTest):
 
 
 
+class EvaluationStatisticsTestCase(unittest.TestCase):
+
+    def test_standard_deviation(self):
+        self.assertTrue(HeuristicEvaluationResults.standard_deviation([]) is None)
+        self.assertEqual(0.0, HeuristicEvaluationResults.standard_deviation([0.3]))
+        self.assertAlmostEqual(0.1, HeuristicEvaluationResults.standard_deviation([0.2, 0.3, 0.4]))
+        self.assertAlmostEqual(0.0, HeuristicEvaluationResults.standard_deviation([0.1, 0.1, 0.1]))
+
+    def test_error_text(self):
+        self.assertEqual('-', HeuristicEvaluationResults.error_text(None, None))
+        self.assertEqual('30.00%', HeuristicEvaluationResults.error_text(0.3, None))
+        self.assertEqual('30.00% (0.000)', HeuristicEvaluationResults.error_text(0.3, 0.0))
+
+
 def tests():
     return [ EvaluatedHeuristicRankerTestCase,
              ContestEntriesRankerTestCase,
+             EvaluationStatisticsTestCase,
            ]
@@ -0,0 +1,117 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import tempfile
+import tarfile
+import shutil
+import os
+from StringIO import StringIO
+from pymash.actions_cache import ActionsCache
+
+
+ACTIONS = '# Actions performed\n' \
+          '# <frame> <reward> <actions>\n' \
+          'SEQUENCE 0\n' \
+          '0 0 1 2\n' \
+          '1 0 3 4\n' \
+          'SEQUENCE_END\n' \
+          'SEQUENCE 3\n' \
+          '0 1 5 6\n' \
+          'SEQUENCE_END\n'
+
+
+class ActionsCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def createReport(self, content):
+        filename = os.path.join(self.folder, 'report.tar.gz')
+
+        tar = tarfile.open(filename, 'w:gz')
+
+        if content is not None:
+            info = tarfile.TarInfo(ActionsCache.ACTIONS_MEMBER)
+            info.size = len(content)
+            tar.addfile(info, StringIO(content))
+
+        tar.close()
+
+        return filename
+
+    def test_parse(self):
+        self.assertEqual({ 0: [ [1, 2], [3, 4] ], 3: [ [5, 6] ] },
+                         ActionsCache.parse(StringIO(ACTIONS)))
+
+    def test_load(self):
+        filename = self.createReport(ACTIONS)
+
+        self.assertFalse(ActionsCache.exists(filename))
+        self.assertEqual([ [1, 2], [3, 4] ], ActionsCache.load(filename, 0))
+        self.assertTrue(ActionsCache.exists(filename))
+        self.assertEqual(os.path.join(self.folder, 'report.actions'), ActionsCache.folder(filename))
+
+        # The cache must be used from now on
+        os.remove(filename)
+
+        self.assertEqual([ [5, 6] ], ActionsCache.load(filename, 3))
+        self.assertTrue(ActionsCache.load(filename, 1) is None)
+
+        ActionsCache.remove(filename)
+        self.assertFalse(ActionsCache.exists(filename))
+
+    def test_load_without_actions(self):
+        filename = self.createReport(None)
+
+        self.assertTrue(ActionsCache.load(filename, 0) is None)
+
+    def test_load_rows_of_different_lengths(self):
+        filename = self.createReport('SEQUENCE 1\n'
+                                     '0 0 1\n'
+                                     '1 0\n'
+                                     '2 0 2 3 4\n'
+                                     'SEQUENCE_END\n')
+
+        ActionsCache.build(filename)
+        os.remove(filename)
+
+        self.assertEqual([ [1], [], [2, 3, 4] ], ActionsCache.load(filename, 1))
+
+    def test_build_failure(self):
+        filename = self.createReport('SEQUENCE 0\n'
+                                     '0 0 %d\n'
+                                     'SEQUENCE_END\n' % (1 << 40))
+
+        self.assertRaises(OverflowError, ActionsCache.build, filename)
+
+        self.assertFalse(ActionsCache.exists(filename))
+        self.assertEqual([ 'report.tar.gz' ], os.listdir(self.folder))
+
+
+def tests():
+    return [ ActionsCacheTestCase ]
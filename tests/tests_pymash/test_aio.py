@@ -0,0 +1,294 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+import unittest
+import threading
+import socket
+import time
+from pymash.server import ThreadedServer
+from pymash.server import ServerListener
+from pymash.client import Client
+from pymash.messages import Message
+from pymash.aio import EventLoop
+from pymash.aio import AsyncClient
+from pymash.aio import AsyncServer
+from pymash.aio import AsyncServerListener
+from pymash.aio import Return
+from pymash.aio import gather
+from pymash.aio import sleep
+
+
+class AsyncEchoListener(AsyncServerListener):
+
+    def handleCommand(self, command):
+        if command.name == 'DONE':
+            yield self.sendResponse('GOODBYE')
+            raise Return(ServerListener.ACTION_CLOSE_CONNECTION)
+
+        elif command.name == 'DATA':
+            data = yield self.waitData(command.parameters[0])
+            yield self.sendResponse(Message('RECEIVED', [len(data)]))
+
+        elif command.name == 'SLEEP':
+            yield sleep(command.parameters[0])
+            yield self.sendResponse('AWAKE')
+
+        else:
+            yield self.sendResponse(command)
+
+        raise Return(ServerListener.ACTION_NONE)
+
+
+class EchoListener(ServerListener):
+
+    def handleCommand(self, command):
+        if command.name == 'DONE':
+            self.sendResponse('GOODBYE')
+            return ServerListener.ACTION_CLOSE_CONNECTION
+
+        self.sendResponse(command)
+        return ServerListener.ACTION_NONE
+
+
+class EventLoopTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = EventLoop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_return_value(self):
+        def add(a, b):
+            yield sleep(0)
+            raise Return(a + b)
+
+        def run():
+            result = yield add(1, 2)
+            raise Return(result * 10)
+
+        self.assertEqual(30, self.loop.runUntilComplete(run()))
+
+    def test_exception(self):
+        def fail():
+            yield sleep(0)
+            raise ValueError('error')
+
+        def run():
+            try:
+                yield fail()
+            except ValueError:
+                raise Return('caught')
+
+        self.assertEqual('caught', self.loop.runUntilComplete(run()))
+        self.assertRaises(ValueError, self.loop.runUntilComplete, fail())
+
+    def test_gather_runs_concurrently(self):
+        def wait(delay, value):
+            yield sleep(delay)
+            raise Return(value)
+
+        start = time.time()
+        results = self.loop.runUntilComplete(gather(wait(0.3, 1), wait(0.2, 2), wait(0.3, 3)))
+
+        self.assertEqual([1, 2, 3], results)
+        self.assertTrue(time.time() - start < 0.6)
+
+    def test_stop_from_another_thread(self):
+        timer = threading.Timer(0.2, self.loop.stop)
+        timer.start()
+
+        self.loop.runForever()
+
+        timer.join()
+
+
+class AsyncServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = EventLoop()
+
+        self.server = AsyncServer(AsyncEchoListener, self.loop, nbMaxClients=2)
+        self.assertTrue(self.server.listen('127.0.0.1', 18020))
+
+        self.thread = threading.Thread(target=self.loop.runForever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.loop.stop()
+        self.thread.join()
+
+        self.server.close()
+        self.loop.close()
+
+    def test_commands(self):
+        client = Client()
+        self.assertTrue(client.connect('127.0.0.1', 18020))
+
+        self.assertTrue(client.sendCommand(Message('SOME_NAME', [1, 2, 3])))
+        self.assertTrue(client.waitResponse().equals(Message('SOME_NAME', [1, 2, 3])))
+
+        self.assertTrue(client.sendCommand('DONE'))
+        self.assertEqual('GOODBYE', client.waitResponse().name)
+
+        client.close()
+
+    def test_framed_mode_and_data(self):
+        client = Client()
+        self.assertTrue(client.connect('127.0.0.1', 18020))
+        self.assertTrue(client.useFramedMode())
+
+        client.sendCommand(Message('DATA', [100000]))
+        client.sendData('A' * 100000)
+        client.sendCommand(Message('SOME_NAME', ['some text', 1.5]))
+
+        self.assertTrue(client.waitResponse().equals(Message('RECEIVED', [100000])))
+        self.assertTrue(client.waitResponse().equals(Message('SOME_NAME', ['some text', 1.5])))
+
+        client.close()
+
+    def test_clients_handled_concurrently(self):
+        client1 = Client()
+        self.assertTrue(client1.connect('127.0.0.1', 18020))
+        client2 = Client()
+        self.assertTrue(client2.connect('127.0.0.1', 18020))
+
+        # The second client is served while the first one waits
+        client1.sendCommand(Message('SLEEP', [0.5]))
+        client2.sendCommand('SOME_NAME')
+
+        start = time.time()
+        self.assertEqual('SOME_NAME', client2.waitResponse().name)
+        self.assertTrue(time.time() - start < 0.4)
+        self.assertEqual('AWAKE', client1.waitResponse().name)
+
+        client1.close()
+        client2.close()
+
+    def test_busy(self):
+        clients = []
+        for i in range(2):
+            client = Client()
+            self.assertTrue(client.connect('127.0.0.1', 18020))
+            clients.append(client)
+
+        time.sleep(0.2)
+
+        client = Client()
+        self.assertTrue(client.connect('127.0.0.1', 18020))
+        self.assertTrue(client.sendCommand('SOME_NAME'))
+        self.assertEqual('BUSY', client.waitResponse().name)
+        client.close()
+
+        for client in clients:
+            client.close()
+
+
+class AsyncClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadedServer('127.0.0.1', 18021, EchoListener, logFolder='logs')
+        self.server.start()
+        time.sleep(0.5)
+
+        self.loop = EventLoop()
+
+    def tearDown(self):
+        self.loop.close()
+
+        self.server.stop()
+        self.server.join()
+
+    def test_commands(self):
+        def run():
+            client = AsyncClient()
+            connected = yield client.connect('127.0.0.1', 18021, timeout=5)
+            self.assertTrue(connected)
+
+            framed = yield client.useFramedMode(timeout=5)
+            self.assertTrue(framed)
+
+            yield client.sendCommand(Message('SOME_NAME', [1, 'some text']))
+            response = yield client.waitResponse(timeout=5)
+            self.assertTrue(response.equals(Message('SOME_NAME', [1, 'some text'])))
+
+            yield client.sendCommand('DONE')
+            response = yield client.waitResponse(timeout=5)
+            self.assertEqual('GOODBYE', response.name)
+
+            client.close()
+
+        self.loop.runUntilComplete(run())
+
+    def test_timeout(self):
+        def run():
+            client = AsyncClient()
+            connected = yield client.connect('127.0.0.1', 18021, timeout=5)
+            self.assertTrue(connected)
+
+            response = yield client.waitResponse(timeout=0.2)
+            self.assertTrue(response is None)
+
+            client.close()
+
+        self.loop.runUntilComplete(run())
+
+    def test_connection_refused(self):
+        # Find a port nobody listens to
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+        s.close()
+
+        def run():
+            client = AsyncClient()
+            connected = yield client.connect('127.0.0.1', port, timeout=5)
+            raise Return(connected)
+
+        self.assertFalse(self.loop.runUntilComplete(run()))
+
+    def test_fan_out(self):
+        def echo(value):
+            client = AsyncClient()
+            connected = yield client.connect('127.0.0.1', 18021, timeout=5)
+            if not(connected):
+                raise Return(None)
+
+            yield client.sendCommand(Message('SOME_NAME', [value]))
+            response = yield client.waitResponse(timeout=5)
+            client.close()
+
+            raise Return(response.parameters[0])
+
+        results = self.loop.runUntilComplete(gather(*[ echo(i) for i in range(5) ]))
+
+        self.assertEqual(range(5), results)
+
+
+def tests():
+    return [ EventLoopTestCase,
+             AsyncServerTestCase,
+             AsyncClientTestCase,
+           ]
@@ -0,0 +1,177 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+import unittest
+import threading
+import time
+import shutil
+import os
+from pymash.server import ThreadedServer
+from pymash.server import ServerListener
+from pymash.client import Client
+from pymash.messages import Message
+
+
+class EchoListener(ServerListener):
+
+    def handleCommand(self, command):
+        if command.name == 'DONE':
+            self.sendResponse('GOODBYE')
+            return ServerListener.ACTION_CLOSE_CONNECTION
+
+        elif command.name == 'DATA':
+            data = self.waitData(command.parameters[0])
+            self.sendResponse(Message('RECEIVED', [len(data)]))
+
+        else:
+            self.sendResponse(command)
+
+        return ServerListener.ACTION_NONE
+
+
+class TextOnlyListener(EchoListener):
+
+    SUPPORTS_FRAMED_MODE = False
+
+    received = []
+
+    def handleCommand(self, command):
+        TextOnlyListener.received.append(command.name)
+        return EchoListener.handleCommand(self, command)
+
+
+class EventLoopServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadedServer('127.0.0.1', 18010, EchoListener, logFolder='logs',
+                                     eventLoop=True, nbWorkers=2)
+        self.server.start()
+        time.sleep(0.5)
+
+    def tearDown(self):
+        self.server.stop()
+        self.server.join()
+
+        if os.path.exists('logs'):
+            shutil.rmtree('logs')
+
+    def test_commands(self):
+        client = Client()
+        self.assertTrue(client.connect('127.0.0.1', 18010))
+
+        self.assertTrue(client.sendCommand(Message('SOME_NAME', [1, 2, 3])))
+        self.assertTrue(client.waitResponse().equals(Message('SOME_NAME', [1, 2, 3])))
+
+        self.assertTrue(client.sendCommand('DONE'))
+        self.assertEqual('GOODBYE', client.waitResponse().name)
+
+        client.close()
+
+    def test_pipelined_commands_and_data(self):
+        client = Client()
+        self.assertTrue(client.connect('127.0.0.1', 18010))
+        self.assertTrue(client.useFramedMode())
+
+        client.sendCommand(Message('DATA', [100000]))
+        client.sendData('A' * 100000)
+        client.sendCommand('COMMAND1')
+        client.sendCommand('COMMAND2')
+
+        self.assertTrue(client.waitResponse().equals(Message('RECEIVED', [100000])))
+        self.assertEqual('COMMAND1', client.waitResponse().name)
+        self.assertEqual('COMMAND2', client.waitResponse().name)
+
+        client.close()
+
+    def test_more_clients_than_workers(self):
+        errors = []
+
+        def run(index):
+            client = Client()
+            if not(client.connect('127.0.0.1', 18010)):
+                errors.append(index)
+                return
+
+            for i in range(10):
+                client.sendCommand(Message('SOME_NAME', [index, i]))
+                if not(client.waitResponse().equals(Message('SOME_NAME', [index, i]))):
+                    errors.append(index)
+
+            client.close()
+
+        threads = [ threading.Thread(target=run, args=(index,)) for index in range(20) ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+
+
+class FramedModeNegotiationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        TextOnlyListener.received = []
+
+        self.server = ThreadedServer('127.0.0.1', 18011, TextOnlyListener, logFolder='logs',
+                                     eventLoop=True, nbWorkers=2)
+        self.server.start()
+        time.sleep(0.5)
+
+    def tearDown(self):
+        self.server.stop()
+        self.server.join()
+
+        if os.path.exists('logs'):
+            shutil.rmtree('logs')
+
+    def test_negotiated_once_per_connection(self):
+        client = Client()
+        self.assertTrue(client.connect('127.0.0.1', 18011))
+
+        self.assertFalse(client.useFramedMode())
+        self.assertFalse(client.useFramedMode())
+
+        self.assertTrue(client.sendCommand(Message('SOME_NAME', [1])))
+        self.assertTrue(client.waitResponse().equals(Message('SOME_NAME', [1])))
+
+        self.assertEqual(['USE_FRAMED_MODE', 'SOME_NAME'], TextOnlyListener.received)
+
+        # A new connection negotiates again
+        client.close()
+        self.assertTrue(client.connect('127.0.0.1', 18011))
+        self.assertFalse(client.useFramedMode())
+        client.close()
+
+        self.assertEqual(['USE_FRAMED_MODE', 'SOME_NAME', 'USE_FRAMED_MODE'], TextOnlyListener.received)
+
+
+def tests():
+    return [ EventLoopServerTestCase,
+             FramedModeNegotiationTestCase,
+           ]
@@ -95,6 +95,33 @@ class MessageTestCase(unittest.TestCase):
         m = Message('SOME_NAME', ['This\nis a "complicated"\n\'parameter\''])
         self.assertTrue(m.equals(Message.fromString('SOME_NAME \'This\\nis a "complicated"\\n\\\'parameter\\\'\'')))
 
+    def test_frame_without_parameter(self):
+        m = Message('SOME_NAME')
+        self.assertTrue(m.equals(Message.fromFrame(m.toFrame())))
+
+    def test_frame_with_mixed_parameters(self):
+        m = Message('SOME_NAME', [1, 2.0, 'hi', 'hello world'])
+        m2 = Message.fromFrame(m.toFrame())
+        self.assertTrue(m.equals(m2))
+        self.assertTrue(isinstance(m2.parameters[0], int))
+        self.assertTrue(isinstance(m2.parameters[1], float))
+
+    def test_frame_keeps_string_parameters(self):
+        m = Message('SOME_NAME', ['007', '12', '1.7', '1 2', 'abc'])
+        self.assertEqual(['007', '12', '1.7', '1 2', 'abc'], Message.fromFrame(m.toFrame()).parameters)
+
+    def test_frame_and_string_decode_identically(self):
+        m = Message.fromString('SOME_NAME 12 007 2.5 hi \'hello world\' \'5 6\'')
+        self.assertEqual(m.parameters, Message.fromFrame(m.toFrame()).parameters)
+
+    def test_frame_with_complicated_parameters(self):
+        m = Message('SOME_NAME', ['This\nis a "complicated"\n\'parameter\''])
+        self.assertTrue(m.equals(Message.fromFrame(m.toFrame())))
+
+    def test_frame_from_memoryview(self):
+        m = Message('SOME_NAME', [1, 'hi'])
+        self.assertTrue(m.equals(Message.fromFrame(memoryview(m.toFrame()))))
+
 
 def tests():
     return [ MessageTestCase ]
@@ -0,0 +1,156 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+import unittest
+import socket
+import struct
+import hashlib
+import tempfile
+import threading
+import os
+from pymash.messages import Message
+from pymash.networkutils import NetworkUtils
+
+
+class TextModeNetworkUtilsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        (self.socket1, self.socket2) = socket.socketpair()
+
+    def tearDown(self):
+        self.socket1.close()
+        self.socket2.close()
+
+    def test_message_transmission(self):
+        NetworkUtils.sendMessage(self.socket1, Message('SOME_NAME', [1, 2, 3]))
+        (message, buffer) = NetworkUtils.waitMessage(self.socket2, '')
+
+        self.assertTrue(message.equals(Message('SOME_NAME', [1, 2, 3])))
+        self.assertEqual(0, len(buffer))
+
+    def test_has_message(self):
+        self.assertFalse(NetworkUtils.hasMessage('SOME_NAME'))
+        self.assertTrue(NetworkUtils.hasMessage('SOME_NAME\n'))
+
+
+class FramedModeNetworkUtilsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        (self.socket1, self.socket2) = socket.socketpair()
+
+    def tearDown(self):
+        self.socket1.close()
+        self.socket2.close()
+
+    def test_message_transmission(self):
+        NetworkUtils.sendMessage(self.socket1, Message('SOME_NAME', [1, 2.5, 'hello world']), framed=True)
+        (message, buffer) = NetworkUtils.waitMessage(self.socket2, '', framed=True)
+
+        self.assertTrue(message.equals(Message('SOME_NAME', [1, 2.5, 'hello world'])))
+        self.assertEqual(0, len(buffer))
+
+    def test_multiple_messages_transmission(self):
+        NetworkUtils.sendMessage(self.socket1, Message('NOTIFICATION', ['CURRENT_ROUND', 1]), framed=True)
+        NetworkUtils.sendMessage(self.socket1, 'TRAIN_ERROR 0.5', framed=True)
+
+        (message, buffer) = NetworkUtils.waitMessage(self.socket2, '', framed=True)
+        self.assertTrue(message.equals(Message('NOTIFICATION', ['CURRENT_ROUND', 1])))
+
+        (message, buffer) = NetworkUtils.waitMessage(self.socket2, buffer, framed=True)
+        self.assertTrue(message.equals(Message('TRAIN_ERROR', [0.5])))
+
+    def test_has_message(self):
+        frame = Message('SOME_NAME').toFrame()
+        header = struct.pack(NetworkUtils.FRAME_HEADER, len(frame))
+
+        self.assertFalse(NetworkUtils.hasMessage(header, framed=True))
+        self.assertFalse(NetworkUtils.hasMessage(header + frame[:-1], framed=True))
+        self.assertTrue(NetworkUtils.hasMessage(header + frame, framed=True))
+
+
+class FileTransferNetworkUtilsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        (self.socket1, self.socket2) = socket.socketpair()
+
+        self.content = ''.join([ chr(i % 256) for i in range(300 * 1024) ])
+
+        (fd, self.input_filename) = tempfile.mkstemp()
+        os.write(fd, self.content)
+        os.close(fd)
+
+        (fd, self.output_filename) = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        self.socket1.close()
+        self.socket2.close()
+        os.remove(self.input_filename)
+        os.remove(self.output_filename)
+
+    def send(self, size):
+        inFile = open(self.input_filename, 'rb')
+        NetworkUtils.sendFile(self.socket1, inFile, size)
+        inFile.close()
+
+    def test_file_transmission(self):
+        thread = threading.Thread(target=self.send, args=(len(self.content),))
+        thread.start()
+
+        outFile = open(self.output_filename, 'wb')
+        (checksum, buffer) = NetworkUtils.receiveToFile(self.socket2, '', outFile, len(self.content))
+        outFile.close()
+
+        thread.join()
+
+        self.assertEqual(hashlib.md5(self.content).hexdigest(), checksum)
+        self.assertEqual(self.content, open(self.output_filename, 'rb').read())
+
+    def test_file_transmission_after_message(self):
+        NetworkUtils.sendMessage(self.socket1, Message('DATA', [1000]))
+
+        thread = threading.Thread(target=self.send, args=(1000,))
+        thread.start()
+
+        (message, buffer) = NetworkUtils.waitMessage(self.socket2, '')
+        self.assertTrue(message.equals(Message('DATA', [1000])))
+
+        outFile = open(self.output_filename, 'wb')
+        (checksum, buffer) = NetworkUtils.receiveToFile(self.socket2, buffer, outFile, 1000)
+        outFile.close()
+
+        thread.join()
+
+        self.assertEqual(hashlib.md5(self.content[:1000]).hexdigest(), checksum)
+        self.assertEqual(self.content[:1000], open(self.output_filename, 'rb').read())
+        self.assertEqual(0, len(buffer))
+
+
+def tests():
+    return [ TextModeNetworkUtilsTestCase,
+             FramedModeNetworkUtilsTestCase,
+             FileTransferNetworkUtilsTestCase,
+           ]
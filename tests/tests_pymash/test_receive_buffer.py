@@ -0,0 +1,84 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+import unittest
+import socket
+from pymash.receive_buffer import ReceiveBuffer
+
+
+class ReceiveBufferTestCase(unittest.TestCase):
+
+    def test_initial_content(self):
+        buffer = ReceiveBuffer('BLAH')
+        self.assertEqual(4, len(buffer))
+        self.assertEqual('BLAH', str(buffer))
+
+    def test_extract_lines(self):
+        buffer = ReceiveBuffer('LINE1\n\nLINE2\nLINE')
+        self.assertEqual('LINE1', buffer.extractLine().tobytes())
+        self.assertEqual('LINE2', buffer.extractLine().tobytes())
+        self.assertTrue(buffer.extractLine() is None)
+        self.assertFalse(buffer.hasLine())
+        self.assertEqual('LINE', str(buffer))
+
+    def test_take_returns_views(self):
+        buffer = ReceiveBuffer('0123456789')
+        data = buffer.take(4)
+        self.assertTrue(isinstance(data, memoryview))
+        self.assertEqual('0123', data.tobytes())
+        self.assertEqual(6, len(buffer))
+
+    def test_compaction(self):
+        buffer = ReceiveBuffer(capacity=16)
+        buffer.append('0123456789')
+        buffer.take(8)
+        buffer.append('ABCDEFGH')
+        self.assertEqual(16, len(buffer.data))
+        self.assertEqual('89ABCDEFGH', str(buffer))
+
+    def test_growth(self):
+        buffer = ReceiveBuffer(capacity=16)
+        buffer.append('0123456789')
+        view = buffer.take(2)
+        buffer.append('ABCDEFGHIJKLMNOP')
+        self.assertTrue(len(buffer.data) >= 24)
+        self.assertEqual('23456789ABCDEFGHIJKLMNOP', str(buffer))
+        self.assertEqual('01', view.tobytes())
+
+    def test_receive(self):
+        (socket1, socket2) = socket.socketpair()
+        socket1.sendall('SOME DATA\n')
+
+        buffer = ReceiveBuffer()
+        self.assertEqual(10, buffer.receive(socket2))
+        self.assertEqual('SOME DATA', buffer.extractLine().tobytes())
+
+        socket1.close()
+        socket2.close()
+
+
+def tests():
+    return [ ReceiveBufferTestCase ]
@@ -0,0 +1,219 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import tempfile
+import shutil
+import os
+import struct
+import zlib
+from pymash import recorded_data
+from pymash.recorded_data import RecordedDataReader, RecordedDataIndex, encodePNG
+
+
+class RecordedDataIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, '1.data')
+
+        content = 'FRAME 0\nSRC_IMAGE 2x1 ' + 'ABCDEF' + 'TEXT 5 hello' + 'IMAGEGRAY 2x2 ' + '1234' + 'END_FRAME\n' + \
+                  'FRAME 1\nSRC_IMAGE 1x1 ' + 'XYZ' + 'IMAGERGB 1x2 ' + 'UVWXYZ' + 'LIMIT_REACHED\nEND_FRAME\n' + \
+                  'FRAME 2\nSRC_IMAGE 4x4 ' + 'INCOMPLETE'
+
+        data_file = open(self.filename, 'wb')
+        data_file.write(content)
+        data_file.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_build(self):
+        index = RecordedDataIndex.build(self.filename)
+
+        self.assertEqual(2, index.nbFrames())
+        self.assertEqual(3, len(index.frameElements(0)))
+        self.assertEqual(2, len(index.frameElements(1)))
+
+    def test_read_frames(self):
+        index = RecordedDataIndex.build(self.filename)
+
+        reader = RecordedDataReader(self.filename)
+        frame1 = index.readFrame(reader, 1)
+        frame0 = index.readFrame(reader, 0)
+
+        self.assertEqual(0, frame0['index'])
+        self.assertFalse(frame0['limit_reached'])
+        self.assertEqual(2, frame0['src_image']['width'])
+        self.assertEqual(1, frame0['src_image']['height'])
+        self.assertEqual('ABCDEF', frame0['src_image']['pixels'].tobytes())
+        self.assertEqual(2, len(frame0['user_data']))
+        self.assertEqual('text', frame0['user_data'][0]['type'])
+        self.assertEqual('hello', frame0['user_data'][0]['text'].tobytes())
+        self.assertEqual('gray', frame0['user_data'][1]['type'])
+        self.assertEqual('1234', frame0['user_data'][1]['pixels'].tobytes())
+
+        self.assertEqual(1, frame1['index'])
+        self.assertTrue(frame1['limit_reached'])
+        self.assertEqual('XYZ', frame1['src_image']['pixels'].tobytes())
+        self.assertEqual('rgb', frame1['user_data'][0]['type'])
+        self.assertEqual(1, frame1['user_data'][0]['width'])
+        self.assertEqual(2, frame1['user_data'][0]['height'])
+        self.assertEqual('UVWXYZ', frame1['user_data'][0]['pixels'].tobytes())
+
+        reader.close()
+
+    def test_sidecar_file(self):
+        index = RecordedDataIndex.open(self.filename)
+        self.assertTrue(os.path.exists(RecordedDataIndex.filename(self.filename)))
+
+        loaded = RecordedDataIndex.load(RecordedDataIndex.filename(self.filename))
+        self.assertEqual(index.frames, loaded.frames)
+        self.assertEqual(index.elements, loaded.elements)
+
+    def test_invalid_sidecar_file(self):
+        index_file = open(RecordedDataIndex.filename(self.filename), 'wb')
+        index_file.write('GARBAGE')
+        index_file.close()
+
+        self.assertTrue(RecordedDataIndex.load(RecordedDataIndex.filename(self.filename)) is None)
+        self.assertEqual(2, RecordedDataIndex.open(self.filename).nbFrames())
+
+    def test_large_text(self):
+        text = 'A' * 70000
+
+        data_file = open(self.filename, 'wb')
+        data_file.write('FRAME 0\nSRC_IMAGE 1x1 ABCTEXT %d %sEND_FRAME\n' % (len(text), text))
+        data_file.close()
+
+        RecordedDataIndex.open(self.filename)
+        index = RecordedDataIndex.load(RecordedDataIndex.filename(self.filename))
+        self.assertEqual(1, index.nbFrames())
+
+        reader = RecordedDataReader(self.filename)
+        frame = index.readFrame(reader, 0)
+        self.assertEqual(text, frame['user_data'][0]['text'].tobytes())
+        reader.close()
+
+
+class RecordedDataReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, '1.data')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, content):
+        data_file = open(self.filename, 'wb')
+        data_file.write(content)
+        data_file.close()
+
+    def test_lazy_iteration(self):
+        self.write('FRAME 0\nSRC_IMAGE 1x1 ABCEND_FRAME\n' + \
+                   'FRAME 1\nSRC_IMAGE 1x1 DEFTEXT 3 abcEND_FRAME\n')
+
+        reader = RecordedDataReader(self.filename)
+        frames = reader.frames()
+
+        frame = frames.next()
+        self.assertEqual(0, frame['index'])
+        self.assertTrue(isinstance(frame['src_image']['pixels'], memoryview))
+        self.assertEqual('ABC', frame['src_image']['pixels'].tobytes())
+
+        frame = frames.next()
+        self.assertEqual(1, frame['index'])
+        self.assertEqual('abc', frame['user_data'][0]['text'].tobytes())
+
+        self.assertRaises(StopIteration, frames.next)
+
+        reader.close()
+
+    def test_truncated_file(self):
+        self.write('FRAME 0\nSRC_IMAGE 10x10 ABC')
+
+        reader = RecordedDataReader(self.filename)
+        self.assertEqual(0, len(list(reader.frames())))
+        reader.close()
+
+    def test_empty_file(self):
+        self.write('')
+
+        reader = RecordedDataReader(self.filename)
+        self.assertEqual(0, len(list(reader.frames())))
+        reader.close()
+
+        self.assertEqual(0, RecordedDataIndex.build(self.filename).nbFrames())
+
+
+class EncodePNGTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.numpy = recorded_data.numpy
+
+    def tearDown(self):
+        recorded_data.numpy = self.numpy
+
+    def decode(self, png, nb_channels):
+        self.assertEqual('\x89PNG\r\n\x1a\n', png[:8])
+
+        (width, height, depth, color_type) = struct.unpack('!IIBB', png[16:26])
+
+        offset = png.index('IDAT')
+        (length,) = struct.unpack('!I', png[offset - 4:offset])
+        data = map(ord, zlib.decompress(png[offset + 4:offset + 4 + length]))
+
+        stride = width * nb_channels
+        pixels = []
+
+        for y in range(height):
+            row = data[y * (stride + 1) + 1:(y + 1) * (stride + 1)]
+
+            # 'Sub' filter
+            if data[y * (stride + 1)] == 1:
+                for x in range(nb_channels, stride):
+                    row[x] = (row[x] + row[x - nb_channels]) % 256
+
+            pixels.extend(row)
+
+        return (width, height, color_type, ''.join(map(chr, pixels)))
+
+    def check(self, pixels, width, height, nb_channels, color_type):
+        png = encodePNG(buffer(pixels), width, height, nb_channels)
+        self.assertEqual((width, height, color_type, pixels), self.decode(png, nb_channels))
+
+    def test_rgb(self):
+        self.check(''.join(map(lambda x: chr((x * 37) % 256), range(5 * 3 * 3))), 5, 3, 3, 2)
+
+    def test_gray(self):
+        self.check('\x00\xFF\x10\x80\x7F\x01', 3, 2, 1, 0)
+
+    def test_without_numpy(self):
+        recorded_data.numpy = None
+        self.check(''.join(map(lambda x: chr((x * 37) % 256), range(4 * 2 * 3))), 4, 2, 3, 2)
+
+
+def tests():
+    return [ RecordedDataReaderTestCase, RecordedDataIndexTestCase, EncodePNGTestCase ]
@@ -24,12 +24,15 @@
 
 
 import unittest
+from django.conf import settings
 from tasks.jobs import Job
 from tasks.jobs import JobList
 from pymash.messages import Message
+from pymash.client import Client
 from mash.servers.models import Job as ServerJob
 from mash.servers.models import Alert
 from mash.servers.models import Server
+import socket
 
 
 class JobTestCase(unittest.TestCase):
@@ -180,6 +183,50 @@ class JobTestCase(unittest.TestCase):
         self.assertEqual(ServerJob.STATUS_DELAYED, job.server_job.status)
         self.assertEqual(10, job.timeout)
 
+    def test_notifications(self):
+        c = Message('SOME_NAME', [1, 2, 3])
+        job = Job(command=c)
+
+        self.assertTrue(job.getNotificationsTimeout() is None)
+
+        job.markAsRunning()
+        job.setNotification('CURRENT_ROUND', '1 10')
+        job.setNotification('TEST_STEP_DONE', '5 1000')
+        job.setNotification('CURRENT_ROUND', '2 10')
+
+        self.assertEqual(['CURRENT_ROUND', 'TEST_STEP_DONE'], job.notifications.keys())
+        self.assertEqual('2 10', job.notifications['CURRENT_ROUND'])
+
+        timeout = job.getNotificationsTimeout()
+        self.assertTrue((timeout > 0) and (timeout <= Job.notificationsDelay()))
+
+        job.flushNotifications()
+
+        self.assertEqual(0, len(job.notifications))
+        self.assertTrue(job.getNotificationsTimeout() is None)
+
+        job.setNotification('CURRENT_ROUND', '3 10')
+        job.markAsDone()
+
+        self.assertEqual(0, len(job.notifications))
+        self.assertTrue(job.getNotificationsTimeout() is None)
+
+    def test_notifications_delay_setting(self):
+        previous = Job.notificationsDelay()
+        settings.SCHEDULER_NOTIFICATIONS_DELAY = 0.5
+
+        try:
+            job = Job(command=Message('SOME_NAME', [1, 2, 3]))
+            job.markAsRunning()
+            job.setNotification('CURRENT_ROUND', '1 10')
+
+            timeout = job.getNotificationsTimeout()
+            self.assertTrue((timeout > 0) and (timeout <= 0.5))
+
+            job.flushNotifications()
+        finally:
+            settings.SCHEDULER_NOTIFICATIONS_DELAY = previous
+
 
 class JobListTestCase(unittest.TestCase):
 
@@ -280,6 +327,60 @@ class JobListTestCase(unittest.TestCase):
 
         self.assertEqual(4, self.jobs.count(ServerJob.STATUS_SCHEDULED))
 
+    def test_modified_timeout(self):
+        j1 = self.jobs.addJob(command='D1')
+        j1.markAsDelayed(60)
+
+        timeout_jobs = self.jobs.updateTimeouts(20)
+        self.assertEqual(0, len(timeout_jobs))
+        self.assertEqual(40, j1.timeout)
+
+        j1.timeout = 0
+        self.assertEqual(0, self.jobs.getNextTimeout())
+
+        timeout_jobs = self.jobs.updateTimeouts(0)
+        self.assertEqual(1, len(timeout_jobs))
+        self.assertTrue(j1 in timeout_jobs)
+        self.assertTrue(self.jobs.getNextTimeout() is None)
+
+    def test_reschedule_job(self):
+        self.jobs.rescheduleJob(self.j1)
+
+        self.assertEqual([self.j2, self.j3, self.j1], self.jobs.getJobs())
+        self.assertEqual([self.j3, self.j1], self.jobs.getJobs(ServerJob.STATUS_SCHEDULED))
+
+    def test_status_changes(self):
+        self.j1.markAsRunning()
+        self.j2.markAsDone()
+
+        self.assertEqual([self.j3], self.jobs.getJobs(ServerJob.STATUS_SCHEDULED))
+        self.assertEqual([self.j1], self.jobs.getJobs(ServerJob.STATUS_RUNNING))
+        self.assertEqual([self.j2], self.jobs.getJobs(ServerJob.STATUS_DONE))
+        self.assertEqual([self.j1], self.jobs.getJobs(status=ServerJob.STATUS_RUNNING, command='C1'))
+        self.assertEqual(0, len(self.jobs.getJobs(status=ServerJob.STATUS_SCHEDULED, command='C1')))
+
+        self.jobs.removeJobs(self.j2)
+
+        self.assertEqual(0, self.jobs.count(ServerJob.STATUS_DONE))
+        self.assertFalse(self.jobs.hasJob('C2'))
+
+    def test_clients(self):
+        (s1, s2) = socket.socketpair()
+
+        client = Client()
+        client.socket = s1
+
+        self.j2.client = client
+        self.assertEqual([self.j2], self.jobs.getJobsByFileDescriptors([s1]))
+        self.assertEqual([self.j2], self.jobs.getJobsByFileDescriptors([s1.fileno()]))
+
+        self.j2.client = None
+        self.assertEqual([], self.jobs.getJobsByFileDescriptors([s1]))
+
+        s1.close()
+        s2.close()
+
+
 
 def tests():
     return [ JobTestCase, JobListTestCase ]
@@ -0,0 +1,173 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+from tasks.router import MessageRouter
+from tasks.router import convertParameters
+from pymash import Message
+
+
+class FakeOutStream(object):
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+
+class FakeTask(object):
+
+    SUPPORTED_COMMANDS = {}
+    SUPPORTED_EVENTS   = {}
+    INTERNAL_COMMANDS  = {}
+
+    def __init__(self, handles=True):
+        self.handles  = handles
+        self.messages = []
+
+    @classmethod
+    def dataFormat(cls, name):
+        if name in cls.SUPPORTED_COMMANDS:
+            return cls.SUPPORTED_COMMANDS[name]
+        return cls.SUPPORTED_EVENTS.get(name)
+
+    def processMessage(self, message, converted=False):
+        self.converted = converted
+        self.messages.append(message)
+        return self.handles
+
+
+class FakeTask1(FakeTask):
+
+    SUPPORTED_COMMANDS = { 'COMMAND': [int, str] }
+    SUPPORTED_EVENTS   = { 'EVENT': [int] }
+
+
+class FakeTask2(FakeTask):
+
+    SUPPORTED_COMMANDS = { 'COMMAND': [int, str] }
+    SUPPORTED_EVENTS   = { 'EVENT': [int], 'OTHER_EVENT': [str] }
+
+
+class FakeTask3(FakeTask):
+
+    SUPPORTED_EVENTS   = { 'EVENT': [str] }
+    INTERNAL_COMMANDS  = { 'INTERNAL_COMMAND': 'COMMAND' }
+
+
+class MessageRouterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.outStream = FakeOutStream()
+        self.router = MessageRouter(self.outStream)
+
+        self.task1 = FakeTask1(handles=False)
+        self.task2 = FakeTask2()
+        self.task3 = FakeTask3()
+
+        for task in [ self.task1, self.task2, self.task3 ]:
+            self.router.addTask(task)
+
+    def test_convert_parameters(self):
+        self.assertEqual([1, 'a'], convertParameters(Message('COMMAND', ['1', 'a']), [int, str]))
+        self.assertEqual([], convertParameters(Message('COMMAND'), []))
+        self.assertRaises(ValueError, convertParameters, Message('COMMAND', ['1']), [int, str])
+        self.assertRaises(ValueError, convertParameters, Message('COMMAND', ['a', 'b']), [int, str])
+
+    def test_unknown_message(self):
+        self.assertFalse(self.router.route(Message('UNKNOWN')))
+
+    def test_command_to_first_handling_task(self):
+        self.assertTrue(self.router.route(Message('COMMAND', ['12', 'abc'])))
+
+        self.assertEqual(1, len(self.task1.messages))
+        self.assertEqual(1, len(self.task2.messages))
+        self.assertEqual(0, len(self.task3.messages))
+
+        self.assertEqual([12, 'abc'], self.task2.messages[0].parameters)
+        self.assertTrue(self.task2.converted)
+
+    def test_event_fan_out(self):
+        self.router.route(Message('EVENT', ['5']))
+
+        self.assertEqual([5], self.task1.messages[0].parameters)
+        self.assertEqual([5], self.task2.messages[0].parameters)
+        self.assertEqual(['5'], self.task3.messages[0].parameters)
+
+        # Each task gets its own copy
+        self.assertTrue(self.task1.messages[0] is not self.task2.messages[0])
+        self.assertTrue(self.task1.messages[0].parameters is not self.task2.messages[0].parameters)
+
+    def test_event_only_to_supporting_tasks(self):
+        self.router.route(Message('OTHER_EVENT', ['x']))
+
+        self.assertEqual(0, len(self.task1.messages))
+        self.assertEqual(1, len(self.task2.messages))
+        self.assertEqual(0, len(self.task3.messages))
+
+    def test_invalid_parameters(self):
+        self.router.route(Message('EVENT', ['abc']))
+
+        # Only the task expecting a string gets the event
+        self.assertEqual(0, len(self.task1.messages))
+        self.assertEqual(0, len(self.task2.messages))
+        self.assertEqual(['abc'], self.task3.messages[0].parameters)
+        self.assertTrue(self.outStream.lines[0].startswith('ERROR: Invalid type of arguments'))
+
+    def test_parameters_converted_once_per_format(self):
+        calls = []
+
+        def counting_int(value):
+            calls.append(value)
+            return int(value)
+
+        FakeTask1.SUPPORTED_EVENTS['COUNTED'] = [counting_int]
+        FakeTask2.SUPPORTED_EVENTS['COUNTED'] = [counting_int]
+
+        try:
+            router = MessageRouter(self.outStream)
+            router.addTask(self.task1)
+            router.addTask(self.task2)
+
+            router.route(Message('COUNTED', ['3']))
+        finally:
+            del FakeTask1.SUPPORTED_EVENTS['COUNTED']
+            del FakeTask2.SUPPORTED_EVENTS['COUNTED']
+
+        self.assertEqual(['3'], calls)
+        self.assertEqual([3], self.task1.messages[0].parameters)
+        self.assertEqual([3], self.task2.messages[0].parameters)
+
+    def test_replayed_command(self):
+        command = self.router.replayedCommand(Message('INTERNAL_COMMAND', [12]))
+        self.assertEqual('COMMAND', command.name)
+        self.assertEqual([12], command.parameters)
+
+        command = Message('COMMAND', [12, 'abc'])
+        self.assertTrue(self.router.replayedCommand(command) is command)
+
+
+def tests():
+    return [ MessageRouterTestCase ]
@@ -24,6 +24,7 @@
 
 
 import unittest
+import time
 from tasks.task import Task
 from pymash.messages import Message
 from mash.servers.models import Job as ServerJob
@@ -188,5 +189,86 @@ class TaskTestCase(unittest.TestCase):
         self.assertEqual('COMMAND2_DONE', m.name)
 
 
+    def test_coalesced_events(self):
+        now = [ 100.0 ]
+        self.task.clock = lambda: now[0]
+
+        m = self.task.out_channel.waitMessage()
+        self.assertEqual('STARTUP_DONE', m.name)
+
+        # The first event is processed immediately
+        self.assertTrue(self.task.processMessage(Message('EVENT4', [1])))
+        self.task.processNewJobs()
+
+        m = self.task.out_channel.waitMessage()
+        self.assertEqual('EVENT4_RECEIVED', m.name)
+        self.assertEqual([1], m.parameters)
+
+        self.assertTrue(self.task.getTimeout() is None)
+
+        # The following ones are coalesced
+        for parameter in [2, 3, 2]:
+            now[0] += 0.05
+            self.assertTrue(self.task.processMessage(Message('EVENT4', [parameter])))
+            self.task.processNewJobs()
+
+        self.assertTrue(self.task.out_channel.waitMessage(block=False) is None)
+
+        self.assertAlmostEqual(0.1, self.task.getTimeout())
+
+        now[0] += 0.05
+        self.task.updateTimeouts(0)
+        self.task.processNewJobs()
+        self.assertTrue(self.task.out_channel.waitMessage(block=False) is None)
+
+        # Processed once per distinct parameter
+        now[0] += 0.05
+        self.task.updateTimeouts(0)
+        self.task.processNewJobs()
+
+        m = self.task.out_channel.waitMessage()
+        self.assertEqual('EVENT4_RECEIVED', m.name)
+        self.assertEqual([2], m.parameters)
+
+        m = self.task.out_channel.waitMessage()
+        self.assertEqual('EVENT4_RECEIVED', m.name)
+        self.assertEqual([3], m.parameters)
+
+    def test_coalesced_events_maximum_delay(self):
+        now = [ 100.0 ]
+        self.task.clock = lambda: now[0]
+
+        m = self.task.out_channel.waitMessage()
+        self.assertEqual('STARTUP_DONE', m.name)
+
+        self.assertTrue(self.task.processMessage(Message('EVENT4', [1])))
+        self.task.processNewJobs()
+        self.task.out_channel.waitMessage()
+
+        # The window is closed after 0.3 seconds, even if the events continue
+        for parameter in [2, 3, 4, 5]:
+            now[0] += 0.08
+            self.assertTrue(self.task.processMessage(Message('EVENT4', [parameter])))
+            self.task.processNewJobs()
+
+        self.assertEqual(0, self.task.getTimeout())
+
+        self.task.updateTimeouts(0)
+        self.task.processNewJobs()
+
+        for parameter in [2, 3, 4, 5]:
+            m = self.task.out_channel.waitMessage()
+            self.assertEqual([parameter], m.parameters)
+
+    def test_coalesced_events_without_one_parameter(self):
+        MockTask.checkCoalescedEvents()
+
+        MockTask.COALESCED_EVENTS['EVENT1'] = (0.1, 0.3)
+        try:
+            self.assertRaises(ValueError, MockTask.checkCoalescedEvents)
+        finally:
+            del MockTask.COALESCED_EVENTS['EVENT1']
+
+
 def tests():
     return [ TaskTestCase ]
@@ -0,0 +1,249 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+import unittest
+from utilities.connection_pool import ServerConnectionPool
+from mocks.mock_server_listeners import MockCompilationServerListener
+from pymash.server import ThreadedServer
+import socket
+import shutil
+import time
+import os
+
+
+class FakeServer(object):
+
+    def __init__(self, port):
+        self.address = '127.0.0.1'
+        self.port    = port
+
+
+class ServerConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        MockCompilationServerListener.FAIL_CONDITION = None
+
+        self.server = ThreadedServer('127.0.0.1', 18030, MockCompilationServerListener)
+        self.server.start()
+        time.sleep(0.5)
+
+        self.pool = ServerConnectionPool()
+
+    def tearDown(self):
+        self.pool.clear()
+
+        self.server.stop()
+        self.server.join()
+
+        MockCompilationServerListener.FAIL_CONDITION = None
+
+        if os.path.exists('logs'):
+            shutil.rmtree('logs')
+
+    def test_acquire(self):
+        servers = [ FakeServer(18031), FakeServer(18030) ]
+
+        (server, client) = self.pool.acquire(servers)
+        self.assertTrue(server is servers[1])
+        self.assertTrue(client is not None)
+
+        self.pool.done(client)
+
+    def test_acquire_busy_server(self):
+        MockCompilationServerListener.FAIL_CONDITION = 'STATUS'
+
+        (server, client) = self.pool.acquire([ FakeServer(18030) ])
+        self.assertTrue(server is None)
+        self.assertTrue(client is None)
+
+    def test_release(self):
+        servers = [ FakeServer(18030) ]
+
+        (server, client) = self.pool.acquire(servers)
+        self.pool.release(client)
+        self.assertEqual(1, len(self.pool.idle))
+
+        # The idle connection must be reused, even if the server would now
+        # refuse a new one
+        MockCompilationServerListener.FAIL_CONDITION = 'STATUS'
+
+        (server2, client2) = self.pool.acquire(servers)
+        self.assertTrue(server2 is servers[0])
+        self.assertTrue(client2 is client)
+        self.assertEqual(0, len(self.pool.idle))
+
+        self.pool.done(client2)
+
+    def test_closed_idle_connection(self):
+        servers = [ FakeServer(18030) ]
+
+        (server, client) = self.pool.acquire(servers)
+        self.pool.release(client)
+
+        # The server closes the connection
+        client.sendCommand('DONE')
+        time.sleep(0.2)
+
+        (server2, client2) = self.pool.acquire(servers)
+        self.assertTrue(server2 is servers[0])
+        self.assertTrue(client2 is not client)
+
+        self.pool.done(client2)
+
+    def test_done(self):
+        servers = [ FakeServer(18030) ]
+
+        (server, client) = self.pool.acquire(servers)
+        connection = client.socket
+
+        self.pool.done(client)
+        self.assertEqual(1, len(self.pool.idle))
+        self.assertTrue(client.socket is connection)
+
+        time.sleep(0.2)
+
+        # The connection is reused, without connecting again to the server
+        (server2, client2) = self.pool.acquire(servers)
+        self.assertTrue(server2 is servers[0])
+        self.assertTrue(client2 is client)
+        self.assertTrue(client2.socket is connection)
+        self.assertEqual(0, len(self.pool.idle))
+        self.assertEqual(1, self.server.server.clientsCounter)
+
+        self.pool.done(client2)
+
+    def test_done_server_not_ready(self):
+        servers = [ FakeServer(18030) ]
+
+        (server, client) = self.pool.acquire(servers)
+
+        # The server doesn't answer 'READY' anymore: the connection isn't
+        # reused
+        MockCompilationServerListener.FAIL_CONDITION = 'STATUS'
+
+        self.pool.done(client)
+        time.sleep(0.2)
+
+        (server2, client2) = self.pool.acquire(servers)
+        self.assertTrue(server2 is None)
+        self.assertTrue(client.socket is None)
+        self.assertEqual(0, len(self.pool.idle))
+
+    def test_discard(self):
+        servers = [ FakeServer(18030) ]
+
+        (server, client) = self.pool.acquire(servers)
+        self.pool.discard(client)
+        self.assertEqual(0, len(self.pool.idle))
+        self.assertTrue(client.socket is None)
+
+    def test_stale_idle_connection(self):
+        servers = [ FakeServer(18030) ]
+
+        (server, client) = self.pool.acquire(servers)
+        self.pool.release(client)
+
+        (client, timestamp) = self.pool.idle[('127.0.0.1', 18030)]
+        self.pool.idle[('127.0.0.1', 18030)] = (client, timestamp - ServerConnectionPool.MAX_IDLE_TIME - 1)
+
+        # The stale connection is dropped (without waiting for the server),
+        # and a new one is established
+        (server2, client2) = self.pool.acquire(servers)
+        self.assertTrue(server2 is servers[0])
+        self.assertTrue(client2 is not client)
+        self.assertTrue(client.socket is None)
+
+        self.pool.done(client2)
+
+    def test_probe(self):
+        servers = [ FakeServer(18030), FakeServer(18031) ]
+
+        ready = self.pool.probe(servers)
+        self.assertEqual(1, len(ready))
+        self.assertTrue(ready[0][0] is servers[0])
+
+        self.pool.discard(ready[0][1])
+
+    def test_probe_hung_server(self):
+        # This server accepts the connections but never answers
+        hung = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        hung.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        hung.bind(('127.0.0.1', 18032))
+        hung.listen(5)
+
+        servers = [ FakeServer(18032), FakeServer(18030) ]
+
+        start = time.time()
+        (server, client) = self.pool.acquire(servers)
+        self.assertTrue(time.time() - start < 2.0)
+        self.assertTrue(server is servers[1])
+
+        self.pool.done(client)
+
+        start = time.time()
+        ready = self.pool.probe([ servers[0] ], timeout=0.5)
+        self.assertEqual(0, len(ready))
+        self.assertTrue(time.time() - start < 2.0)
+
+        hung.close()
+
+    def test_probe_first(self):
+        # This server accepts the connections but never answers
+        hung = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        hung.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        hung.bind(('127.0.0.1', 18032))
+        hung.listen(5)
+
+        servers = [ FakeServer(18032), FakeServer(18030) ]
+
+        # Don't wait for the hung server once a ready one answered
+        start = time.time()
+        ready = self.pool.probe(servers, first=True, timeout=5)
+        self.assertTrue(time.time() - start < 2.0)
+        self.assertEqual(1, len(ready))
+        self.assertTrue(ready[0][0] is servers[1])
+
+        self.pool.discard(ready[0][1])
+
+        hung.close()
+
+    def test_probe_connection_only(self):
+        MockCompilationServerListener.FAIL_CONDITION = 'STATUS'
+
+        servers = [ FakeServer(18030), FakeServer(18031) ]
+
+        self.assertEqual(0, len(self.pool.probe(servers)))
+
+        ready = self.pool.probe(servers, checkStatus=False)
+        self.assertEqual(1, len(ready))
+        self.assertTrue(ready[0][0] is servers[0])
+
+        ready[0][1].close()
+
+
+
+def tests():
+    return [ ServerConnectionPoolTestCase ]
@@ -0,0 +1,151 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+import unittest
+import threading
+import select
+import time
+from utilities.db_executor import DatabaseExecutor
+
+
+class ImmediateExecutionTestCase(unittest.TestCase):
+
+    def test_operation_and_callback(self):
+        executor = DatabaseExecutor()
+        events = []
+
+        executor.submit('A', lambda: events.append('operation'), lambda: events.append('callback'))
+
+        self.assertEqual(['operation', 'callback'], events)
+        self.assertTrue(executor.fileDescriptor() is None)
+        self.assertFalse(executor.isBusy())
+
+    def test_exception(self):
+        executor = DatabaseExecutor()
+
+        def fail():
+            raise ValueError()
+
+        self.assertRaises(ValueError, executor.submit, 'A', fail)
+
+    def test_shared_instance(self):
+        executor = DatabaseExecutor()
+        DatabaseExecutor.setInstance(executor)
+        self.assertTrue(DatabaseExecutor.instance() is executor)
+
+        DatabaseExecutor.setInstance(None)
+        self.assertTrue(DatabaseExecutor.instance() is not executor)
+
+
+class ThreadedExecutionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = DatabaseExecutor(nbWorkers=4)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def waitCompletions(self, expected):
+        nb_completions = 0
+        while nb_completions < expected:
+            (ready, _, _) = select.select([self.executor.fileDescriptor()], [], [], 5)
+            self.assertEqual(1, len(ready))
+            nb_completions += self.executor.processCompletions()
+
+        self.assertEqual(expected, nb_completions)
+
+    def test_callback_in_caller_thread(self):
+        threads = []
+
+        self.executor.submit('A', lambda: threads.append(threading.currentThread()),
+                             lambda: threads.append(threading.currentThread()))
+
+        self.waitCompletions(1)
+
+        self.assertEqual(2, len(threads))
+        self.assertTrue(threads[0] is not threading.currentThread())
+        self.assertTrue(threads[1] is threading.currentThread())
+
+    def test_order_per_key(self):
+        results = { 'A': [], 'B': [] }
+
+        def operation(key, index):
+            def f():
+                time.sleep(0.001 * ((index * 7) % 5))
+                results[key].append(index)
+            return f
+
+        for index in range(20):
+            self.executor.submit('A', operation('A', index))
+            self.executor.submit('B', operation('B', index))
+
+        self.executor.submit('A', callback=lambda: results['A'].append('done'))
+
+        self.waitCompletions(1)
+
+        self.assertEqual(range(20) + ['done'], results['A'])
+
+    def test_keys_in_parallel(self):
+        event = threading.Event()
+        results = []
+
+        self.executor.submit('A', lambda: event.wait(5), lambda: results.append('A'))
+        self.executor.submit('B', None, lambda: results.append('B'))
+
+        self.waitCompletions(1)
+        self.assertEqual(['B'], results)
+
+        event.set()
+
+        self.waitCompletions(1)
+        self.assertEqual(['B', 'A'], results)
+
+    def test_exception(self):
+        results = []
+
+        def fail():
+            raise ValueError()
+
+        self.executor.submit('A', fail)
+        self.executor.submit('A', lambda: results.append('operation'), lambda: results.append('callback'))
+
+        self.waitCompletions(1)
+
+        self.assertEqual(['operation', 'callback'], results)
+
+    def test_shutdown(self):
+        results = []
+
+        for index in range(10):
+            self.executor.submit(index % 3, lambda: time.sleep(0.01), lambda: results.append('callback'))
+
+        self.executor.shutdown()
+
+        self.assertEqual(10, len(results))
+        self.assertFalse(self.executor.isBusy())
+        self.assertTrue(self.executor.fileDescriptor() is None)
+
+
+def tests():
+    return [ ImmediateExecutionTestCase, ThreadedExecutionTestCase ]
@@ -0,0 +1,142 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+import unittest
+import math
+from utilities import ranking
+from utilities.ranking import computeScores
+from utilities.ranking import computeCandidateRanks
+from utilities.ranking import computeRanks
+from utilities.ranking import ReferenceGroup
+from utilities.ranking import RankIndex
+
+
+ERRORS = [ [0.1,  0.3,  0.2],
+           [0.05, 0.35, 0.25],
+           [0.2,  0.3,  0.1],
+           [0.15, 0.3,  0.4] ]
+
+CANDIDATES = [ [0.01, 0.01, 0.01],
+               [0.5,  0.5,  0.5],
+               [0.12, 0.32, 0.18] ]
+
+
+def referenceScores(errors):
+    scores = [0.0] * len(errors)
+
+    for column in zip(*errors):
+        mean = sum(column) / len(column)
+        standard_deviation = math.sqrt(sum(map(lambda x: (x - mean) ** 2, column)) / (len(column) - 1))
+
+        for (index, error) in enumerate(column):
+            scores[index] += (mean - error) / standard_deviation
+
+    return scores
+
+
+class RankingTestCase(unittest.TestCase):
+
+    def test_scores(self):
+        for (score, expected) in zip(computeScores(ERRORS), referenceScores(ERRORS)):
+            self.assertAlmostEqual(expected, score)
+
+    def test_scores_no_heuristic(self):
+        self.assertEqual([], computeScores([]))
+
+    def test_scores_one_heuristic(self):
+        self.assertEqual([0.0], list(computeScores([[0.1, 0.2]])))
+
+    def test_scores_equal_errors(self):
+        scores = computeScores([[0.1, 0.25], [0.2, 0.25], [0.3, 0.25]])
+        self.assertAlmostEqual(0.0, scores[1])
+        self.assertTrue(scores[0] > 0.0)
+        self.assertTrue(scores[2] < 0.0)
+
+    def test_ranks(self):
+        self.assertEqual([2, 1, 4, 3], computeRanks([1.0, 2.0, -1.0, 0.5]))
+
+    def test_ranks_ties(self):
+        self.assertEqual([1, 3, 2], computeRanks([1.0, 0.0, 1.0]))
+
+    def test_candidate_ranks(self):
+        expected = map(lambda x: computeRanks(referenceScores(ERRORS + [x]))[-1], CANDIDATES)
+
+        self.assertEqual([1, 5, expected[2]], expected)
+        self.assertEqual(expected, computeCandidateRanks(ERRORS, CANDIDATES))
+
+    def test_candidate_ranks_no_reference(self):
+        self.assertEqual([1, 1], computeCandidateRanks([], CANDIDATES[:2]))
+
+    def test_candidate_ranks_no_candidate(self):
+        self.assertEqual([], computeCandidateRanks(ERRORS, []))
+
+    def test_reference_group_reuse(self):
+        reference = ReferenceGroup(ERRORS)
+
+        expected = computeCandidateRanks(ERRORS, CANDIDATES)
+
+        for (index, candidate) in enumerate(CANDIDATES):
+            self.assertEqual([expected[index]], reference.rankCandidates([candidate]))
+
+
+class RankIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = RankIndex([ (0.1, 0.2, 1), (0.1, 0.3, 2), (0.2, 0.1, 3), (0.2, 0.1, 3), (0.4, 0.0, 5) ])
+
+    def test_first(self):
+        self.assertEqual(1, self.index.rank(0.05, 0.5))
+        self.assertEqual(1, self.index.rank(0.1, 0.1))
+
+    def test_between(self):
+        self.assertEqual(2, self.index.rank(0.1, 0.25))
+        self.assertEqual(3, self.index.rank(0.1, 0.3))
+        self.assertEqual(5, self.index.rank(0.2, 0.1))
+        self.assertEqual(5, self.index.rank(0.3, 0.0))
+
+    def test_last(self):
+        self.assertEqual(6, self.index.rank(0.4, 0.0))
+        self.assertEqual(6, self.index.rank(0.5, 0.0))
+
+    def test_empty(self):
+        self.assertEqual(1, RankIndex([]).rank(0.1, 0.1))
+
+
+class PurePythonRankingTestCase(RankingTestCase):
+
+    def setUp(self):
+        self.numpy = ranking.numpy
+        ranking.numpy = None
+
+    def tearDown(self):
+        ranking.numpy = self.numpy
+
+
+def tests():
+    return [ RankingTestCase,
+             PurePythonRankingTestCase,
+             RankIndexTestCase,
+           ]
@@ -0,0 +1,88 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+import unittest
+from utilities.selector import Selector
+import socket
+import time
+
+
+class SelectorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.selector = Selector()
+        (self.s1, self.s2) = socket.socketpair()
+        (self.s3, self.s4) = socket.socketpair()
+
+    def tearDown(self):
+        self.selector.close()
+
+        for s in [self.s1, self.s2, self.s3, self.s4]:
+            s.close()
+
+    def test_timeout(self):
+        self.selector.register(self.s1, 'A')
+
+        start = time.time()
+        self.assertEqual([], self.selector.select(0.1))
+        self.assertTrue(time.time() - start >= 0.09)
+
+    def test_ready_file_descriptors(self):
+        self.selector.register(self.s1, 'A')
+        self.selector.register(self.s3, 'B')
+
+        self.s4.sendall('data')
+
+        self.assertEqual([(self.s3.fileno(), 'B')], self.selector.select(1))
+
+    def test_unregister(self):
+        self.selector.register(self.s1, 'A')
+        self.selector.unregister(self.s1)
+        self.selector.unregister(self.s1)
+
+        self.s2.sendall('data')
+
+        self.assertEqual([], self.selector.select(0))
+
+    def test_closed_file_descriptor(self):
+        descriptor = self.selector.register(self.s1, 'A')
+
+        self.s1.close()
+        self.selector.unregister(descriptor)
+
+        self.assertEqual(0, len(self.selector.descriptors))
+
+    def test_reused_file_descriptor(self):
+        descriptor = self.selector.register(self.s1, 'A')
+        self.selector.register(descriptor, 'B')
+
+        self.s2.sendall('data')
+
+        self.assertEqual([(descriptor, 'B')], self.selector.select(1))
+
+
+def tests():
+    return [ SelectorTestCase ]
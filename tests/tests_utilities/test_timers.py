@@ -0,0 +1,107 @@
+################################################################################
+# The MASH web application contains the source code of all the servers
+# in the "computation farm" of the MASH project (http://www.mash-project.eu),
+# developed at the Idiap Research Institute (http://www.idiap.ch).
+#
+# Copyright (c) 2016 Idiap Research Institute, http://www.idiap.ch/
+# Written by Philip Abbet (philip.abbet@idiap.ch)
+#
+# This file is part of the MASH web application (mash-web).
+#
+# The MASH web application is free software: you can redistribute it
+# and/or modify it under the terms of the GNU General Public License
+# version 2 as published by the Free Software Foundation.
+#
+# The MASH web application is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+# of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with the MASH web application. If not, see
+# <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+
+import unittest
+from utilities.timers import TimerService
+from utilities.timers import monotonicTime
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TimerServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.timers = TimerService(clock=self.clock)
+
+    def test_no_deadline(self):
+        self.assertTrue(self.timers.nextTimeout() is None)
+        self.assertEqual([], self.timers.expired())
+
+    def test_next_timeout(self):
+        self.timers.setTimeout('A', 10)
+        self.timers.setTimeout('B', 0.5)
+
+        self.assertEqual(0.5, self.timers.nextTimeout())
+
+        self.clock.now += 0.25
+        self.assertEqual(0.25, self.timers.nextTimeout())
+
+    def test_expired(self):
+        self.timers.setTimeout('A', 10)
+        self.timers.setTimeout('B', 0.5)
+
+        self.clock.now += 0.5
+        self.assertEqual(['B'], self.timers.expired())
+        self.assertEqual(9.5, self.timers.nextTimeout())
+
+        self.clock.now += 20
+        self.assertEqual(['A'], self.timers.expired())
+        self.assertTrue(self.timers.nextTimeout() is None)
+
+    def test_modified_deadline(self):
+        self.timers.setTimeout('A', 10)
+        self.timers.setTimeout('A', 30)
+        self.assertEqual(30, self.timers.nextTimeout())
+
+        self.timers.setTimeout('A', 20, keepEarlier=True)
+        self.assertEqual(20, self.timers.nextTimeout())
+
+        self.timers.setTimeout('A', 40, keepEarlier=True)
+        self.assertEqual(20, self.timers.nextTimeout())
+
+        self.timers.setTimeout('A', None, keepEarlier=True)
+        self.assertEqual(20, self.timers.nextTimeout())
+
+        self.clock.now += 20
+        self.assertEqual(['A'], self.timers.expired())
+        self.assertEqual([], self.timers.expired())
+
+    def test_cancel(self):
+        self.timers.setTimeout('A', 10)
+        self.timers.setTimeout('B', 20)
+        self.timers.setTimeout('A', None)
+
+        self.assertEqual(20, self.timers.nextTimeout())
+
+        self.timers.cancel('B')
+        self.assertTrue(self.timers.nextTimeout() is None)
+
+    def test_monotonic_time(self):
+        t1 = monotonicTime()
+        t2 = monotonicTime()
+        self.assertTrue(t2 >= t1)
+
+
+def tests():
+    return [ TimerServiceTestCase ]